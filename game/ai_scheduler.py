@@ -0,0 +1,135 @@
+"""
+Time-sliced ghost decision scheduler
+
+Ghosts no longer run their searches on their own: during a tick each ghost
+that is due for a decision files a request, and the scheduler serves the
+requests in priority order until the tick's budget of expanded tiles runs
+out. Requests that don't fit are deferred; the ghost keeps its previous
+direction and asks again at the next tile center, ahead of routine requests.
+
+Urgent re-plans go first:
+    - ghosts near Pacman when Pacman enters a new tile
+    - ghosts in or near regions a wall fluctuation regenerated (every ghost
+      when the whole layout changed)
+    - a ghost whose mode changed (frightened, eaten, back to scatter)
+
+The budget counts expanded tiles, so scheduling is deterministic and replays
+stay valid. An optional wall-clock budget bounds frame time more strictly at
+the cost of determinism.
+"""
+import time
+from constants import *
+from profiler import profiler
+
+
+class AIScheduler:
+    """Per-tick budgeted queue of ghost pathfinding decisions"""
+
+    def __init__(self, node_budget=AI_NODE_BUDGET, time_budget_ms=None):
+        """
+        Args:
+            node_budget: tiles all searches may expand per tick
+            time_budget_ms: optional wall-clock limit per tick (not replay-safe)
+        """
+        self.node_budget = node_budget
+        self.time_budget_ms = time_budget_ms
+        self.reset()
+
+    def reset(self, ghosts=(), stagger=True):
+        """
+        Forget all scheduling state, e.g. for a new game.
+        Args:
+            ghosts: the game's ghosts, whose current modes become the baseline
+            stagger: spread the ghosts' decision timers so they don't all
+                come due on the same tick
+        """
+        self.requests = []  # (ghost, tile) asking this tick
+        self.urgent = set()  # Slots of ghosts that must re-plan
+        self.waiting = {}  # Slot -> tick the ghost's request was first deferred
+        self.modes = {}  # Slot -> mode at the last check
+        self.pacman_tile = None
+        self.layout_version = None
+        self.tick = 0
+        # Statistics
+        self.decisions = 0
+        self.deferred = 0
+        self.max_tick_expansions = 0
+        self.max_wait = 0
+        for i, ghost in enumerate(ghosts):
+            if stagger:
+                ghost.decision_timer = i % ghost.decision_delay
+            self.modes[ghost.slot] = ghost.mode
+
+    def observe(self, game_state):
+        """Mark ghosts whose plans went stale since the last tick as urgent"""
+        self.tick += 1
+        maze = game_state.maze
+        if maze.layout_version != self.layout_version:
+            changes = maze.changes_since(self.layout_version) if self.layout_version is not None else None
+            self.layout_version = maze.layout_version
+            if changes is None or changes[0] is None:
+                self.urgent.update(ghost.slot for ghost in game_state.ghosts)
+            else:
+                radius = AI_URGENT_RADIUS
+                for x0, y0, x1, y1 in changes[0]:
+                    self.urgent.update(ghost.slot for ghost in game_state.ghosts_in_rect(x0 - radius, y0 - radius,
+                                                                                        x1 + radius, y1 + radius))
+
+        pacman_tile = game_state.pacman.get_grid_pos()
+        if pacman_tile != self.pacman_tile:
+            self.pacman_tile = pacman_tile
+            self.urgent.update(ghost.slot for ghost in game_state.ghosts_near(*pacman_tile, AI_URGENT_RADIUS))
+
+        modes = self.modes
+        for ghost in game_state.ghosts:
+            if modes.get(ghost.slot) != ghost.mode:
+                modes[ghost.slot] = ghost.mode
+                self.urgent.add(ghost.slot)
+
+    def is_urgent(self, ghost):
+        """Check if a ghost should re-plan before its decision timer expires"""
+        return ghost.slot in self.urgent
+
+    def request(self, ghost, tile):
+        """Ask for a decision for a ghost standing at a tile center"""
+        self.requests.append((ghost, tile))
+
+    def _priority(self, request):
+        """Sort key: urgent first, then longest waiting, then creation order"""
+        slot = request[0].slot
+        return slot not in self.urgent, self.waiting.get(slot, self.tick), slot
+
+    def run(self, maze, pacman_tile):
+        """Serve this tick's requests within the budget and defer the rest"""
+        t = profiler.start()
+        requests = sorted(self.requests, key=self._priority)
+        self.requests = []
+        remaining = self.node_budget
+        deadline = time.perf_counter() + self.time_budget_ms / 1000 if self.time_budget_ms else None
+
+        for ghost, tile in requests:
+            slot = ghost.slot
+            if remaining < AI_MIN_SEARCH or (deadline is not None and time.perf_counter() > deadline):
+                # Keep the current direction and ask again at the next tile center
+                self.waiting.setdefault(slot, self.tick)
+                self.deferred += 1
+                continue
+            remaining -= ghost.decide(maze, tile, pacman_tile, min(BFS_MAX_EXPANSIONS, remaining))
+            self.decisions += 1
+            self.urgent.discard(slot)
+            since = self.waiting.pop(slot, None)
+            if since is not None:
+                self.max_wait = max(self.max_wait, self.tick - since)
+
+        self.max_tick_expansions = max(self.max_tick_expansions, self.node_budget - remaining)
+        profiler.stop("ai.schedule", t)
+
+    def stats(self):
+        """Get decision counts, deferrals and worst-case figures"""
+        return {
+            "decisions": self.decisions,
+            "deferred": self.deferred,
+            "waiting": len(self.waiting),
+            "max_wait_ticks": self.max_wait,
+            "max_tick_expansions": self.max_tick_expansions,
+        }
@@ -0,0 +1,390 @@
+"""
+Performance benchmarks for Pacman
+
+Usage:
+    python benchmark.py swarm                        # per-tick cost at 4, 64 and 512 ghosts
+                                                     # (with decision deferrals and worst wait in ticks)
+    python benchmark.py swarm --ghosts 8 128 --ticks 1200
+    python benchmark.py startup                      # import time and time to first frame
+    python benchmark.py fluctuation                  # regional wall fluctuation versus regenerating the maze
+    python benchmark.py layouts --workers 0 1 2 4    # Aer layouts per second, batched walks across processes
+    python benchmark.py cells                        # per-cell walk generation and fluctuation time by maze size
+    python benchmark.py vecenv --workers 0 1 2 4     # vectorized environment steps per second by worker count
+    python benchmark.py kernels mazes.eml            # compiled kernels versus pure-Python references
+    python benchmark.py chunks --tiles 200000        # endless maze streaming: cost per tile, prefetch hits, memory
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from constants import *
+from game_state import GameState, FLUCTUATION_BACKEND
+import kernels
+from chunks import ChunkedMaze
+from maze import Maze, cell_register, generate_layout, generate_layouts, layout_seed, pacman_start, WALK_STEPS, WALK_SHOTS
+from maze_library import MazeLibrary, flood_components_python
+from pathfinding import bfs_search_python
+import quantum_backend
+from profiler import profiler
+from vec_env import VecEnv, FRAME_SKIP
+
+# Pacman's scripted input: turn every INPUT_PERIOD ticks
+INPUT_PERIOD = 40
+INPUT_CYCLE = [UP, LEFT, DOWN, RIGHT]
+
+
+def _percentile(ordered, p):
+    """Get a percentile of an already sorted list"""
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+
+
+def _run_ticks(game_state, ticks):
+    """
+    Run a scripted game for a number of ticks.
+    Returns the duration of every tick in nanoseconds.
+    """
+    durations = []
+    for tick in range(ticks):
+        if tick % INPUT_PERIOD == 0:
+            game_state.pacman.set_next_direction(INPUT_CYCLE[tick // INPUT_PERIOD % len(INPUT_CYCLE)])
+        start = time.perf_counter_ns()
+        game_state.update()
+        durations.append(time.perf_counter_ns() - start)
+    return durations
+
+
+def bench_swarm(ghost_counts, ticks, seed, width, height):
+    """Measure per-tick cost as the number of ghosts grows"""
+    profiler.set_enabled(True)
+    print(f"{'ghosts':>7} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'ghosts ms':>10} {'collide us':>11} "
+          f"{'all-pairs us':>13} {'deferred':>9} {'max wait':>9}")
+    for count in ghost_counts:
+        game_state = GameState(width, height, seed=seed, ghost_count=count)
+        # Keep the run going and leave wall fluctuations (layout generation) out of the numbers
+        game_state.pacman.lives = ticks + 1
+        game_state.fluctuation_timer = ticks + 1
+        profiler.reset()
+        durations = sorted(_run_ticks(game_state, ticks))
+
+        sections = {name: profiler.sections[name] for name in ("ghost.update", "collision")
+                    if name in profiler.sections}
+        ghost_ms = sections["ghost.update"].total_ns / ticks / 1e6 if "ghost.update" in sections else 0.0
+        collide_us = sections["collision"].total_ns / sections["collision"].calls / 1e3 if "collision" in sections else 0.0
+
+        # The check the spatial hash replaces: every ghost against Pacman
+        start = time.perf_counter_ns()
+        for _ in range(100):
+            [ghost for ghost in game_state.ghosts if ghost.collides_with(game_state.pacman)]
+        all_pairs_us = (time.perf_counter_ns() - start) / 100 / 1e3
+
+        print(f"{count:7d} {sum(durations) / ticks / 1e6:9.3f} {_percentile(durations, 50) / 1e6:8.3f} "
+              f"{_percentile(durations, 99) / 1e6:8.3f} {ghost_ms:10.3f} {collide_us:11.1f} {all_pairs_us:13.1f} "
+              f"{game_state.ai.deferred:9d} {game_state.ai.max_wait:9d}")
+    profiler.set_enabled(False)
+
+
+# Runs in a fresh interpreter; prints the startup phases as JSON
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+eager = sys.argv[1] == "eager"
+if eager:
+    import qiskit, qiskit_aer
+import pygame
+import main, game_state
+from renderer import Renderer
+import quantum_backend
+imported = time.perf_counter()
+pygame.init()
+screen = pygame.display.set_mode((400, 400))
+if eager:
+    # Qiskit's behaviour before lazy loading: Aer builds the first maze, no prewarm
+    game_state.FIRST_LAYOUT_BACKEND = quantum_backend.AER
+else:
+    quantum_backend.prewarm()
+game = game_state.GameState(seed=0)
+Renderer(screen).render(game)
+first_frame = time.perf_counter()
+if not eager:
+    quantum_backend.prewarm().join()
+warm = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_frame": first_frame - imported, "warm": warm - start}))
+"""
+
+
+def bench_startup(runs):
+    """Measure cold-start phases in fresh interpreters, lazy (default) versus eager Qiskit"""
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'mode':>6} {'process s':>10} {'import s':>9} {'first frame s':>14} {'Aer warm s':>11}")
+    for mode in ("lazy", "eager"):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, mode], cwd=here, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            phases = json.loads(output.strip().splitlines()[-1])
+            phases["process"] = time.perf_counter() - start
+            samples.append(phases)
+        median = {key: sorted(sample[key] for sample in samples)[runs // 2] for key in samples[0]}
+        print(f"{mode:>6} {median['process']:10.2f} {median['import']:9.2f} {median['first_frame']:14.2f} "
+              f"{median['warm']:11.2f}")
+
+
+def bench_fluctuation(sizes, repeats):
+    """Measure a regional wall fluctuation against regenerating the whole layout"""
+    print(f"{'maze':>9} {'regional ms':>12} {'tiles changed':>14} {'full ms':>8}")
+    for width, height in sizes:
+        maze = Maze(width, height, seed=0, walk_backend=FLUCTUATION_BACKEND)
+        pacman_tile = maze.pacman_start
+        regional, full, changed = [], [], 0
+        for seed in range(repeats):
+            start = time.perf_counter_ns()
+            changed += len(maze.fluctuate(seed, pacman_tile, FLUCTUATION_BACKEND))
+            regional.append(time.perf_counter_ns() - start)
+            start = time.perf_counter_ns()
+            maze.reset_all_walls(seed, FLUCTUATION_BACKEND)
+            full.append(time.perf_counter_ns() - start)
+        print(f"{width:4d}x{height:<4d} {_percentile(sorted(regional), 50) / 1e6:12.3f} {changed / repeats:14.0f} "
+              f"{_percentile(sorted(full), 50) / 1e6:8.3f}")
+
+
+def _layout_batch(width, height, seeds):
+    """Worker entry point: generate a batch of Aer layouts"""
+    return len(generate_layouts(width, height, seeds)[0])
+
+
+def bench_layouts(count, worker_counts, width, height):
+    """Measure Aer layout throughput: one uncached job per walk, then batches over worker processes"""
+    seeds = [layout_seed(0, i) for i in range(count)]
+    quantum_backend.aer_walk(WALK_STEPS, 1, seed=0)  # Import Qiskit and compile outside the timings
+
+    # Before batching: every walk transpiled its circuit and ran as its own job
+    from qiskit import transpile
+    sample = seeds[:8]
+    start = time.perf_counter()
+    for seed in sample:
+        circuit = transpile(quantum_backend.walk_circuit(WALK_STEPS), quantum_backend.simulator())
+        quantum_backend.simulator().run(circuit, shots=WALK_SHOTS, seed_simulator=seed).result()
+    print(f"{'workers':>8} {'layouts/s':>10}")
+    print(f"{'uncached':>8} {len(sample) / (time.perf_counter() - start):10.1f}")
+
+    batches = [seeds[i:i + quantum_backend.WALK_BATCH_SIZE] for i in range(0, count, quantum_backend.WALK_BATCH_SIZE)]
+    for workers in worker_counts:
+        if workers == 0:
+            start = time.perf_counter()
+            for batch in batches:
+                _layout_batch(width, height, batch)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                # Warm every worker up (Qiskit import, circuit compilation) before timing
+                list(executor.map(_layout_batch, [width] * workers, [height] * workers, [[seed] for seed in seeds[:workers]]))
+                start = time.perf_counter()
+                list(executor.map(_layout_batch, [width] * len(batches), [height] * len(batches), batches))
+        print(f"{workers:8d} {count / (time.perf_counter() - start):10.1f}")
+
+
+def bench_cells(sizes, blocks, repeats):
+    """Measure per-cell walk layouts against maze size: register setup, full layouts and fluctuations"""
+    print(f"{'maze':>9} {'block':>6} {'qubits':>7} {'method':>7} {'register s':>11} {'layout ms':>10} "
+          f"{'fluctuation ms':>15}")
+    for width, height in sizes:
+        for block in [None] + blocks:
+            if block is None:
+                qubits, method, register = quantum_backend.WALK_QUBITS, "aer", 0.0
+                generate_layout(width, height, 0)  # Compile the 32-position walk outside the timings
+            else:
+                qubits = cell_register(width, height, block)[0]
+                method = "mps" if qubits >= quantum_backend.MPS_MIN_QUBITS else "numpy"
+                # Cold: the register's distribution is simulated once per width, then cached
+                quantum_backend.walk_probabilities.cache_clear()
+                quantum_backend.aer_walk_probabilities.cache_clear()
+                start = time.perf_counter()
+                quantum_backend.register_probabilities(WALK_STEPS, qubits)
+                register = time.perf_counter() - start
+            layout, fluctuation = [], []
+            maze = Maze(width, height, seed=0, cell_block=block)
+            for seed in range(repeats):
+                start = time.perf_counter_ns()
+                generate_layout(width, height, seed, cell_block=block)
+                layout.append(time.perf_counter_ns() - start)
+                start = time.perf_counter_ns()
+                maze.fluctuate(seed, maze.pacman_start, FLUCTUATION_BACKEND)
+                fluctuation.append(time.perf_counter_ns() - start)
+            print(f"{width:4d}x{height:<4d} {block or '-':>6} {qubits:7d} {method:>7} {register:11.3f} "
+                  f"{_percentile(sorted(layout), 50) / 1e6:10.2f} {_percentile(sorted(fluctuation), 50) / 1e6:15.2f}")
+
+
+def bench_vecenv(num_envs, worker_counts, steps, seed):
+    """Measure vectorized environment throughput as worker processes are added"""
+    actions = np.random.default_rng(seed).integers(0, 5, size=(steps, num_envs), dtype=np.int8)
+    print(f"{'workers':>8} {'steps/s':>9} {'ticks/s':>9} {'step ms':>8} {'episodes':>9}")
+    for workers in worker_counts:
+        env = VecEnv(num_envs, workers, seed=seed)
+        try:
+            env.reset()
+            env.step(actions[0])  # Leave worker start-up out of the timings
+            episodes = 0
+            start = time.perf_counter()
+            for step_actions in actions:
+                episodes += int(env.step(step_actions)[2].sum())
+            elapsed = time.perf_counter() - start
+        finally:
+            env.close()
+        print(f"{workers:8d} {num_envs * steps / elapsed:9.0f} {num_envs * steps * FRAME_SKIP / elapsed:9.0f} "
+              f"{1000 * elapsed / steps:8.2f} {episodes:9d}")
+
+
+def _mean_us(fn, calls):
+    """Get the mean microseconds of calling fn() for every argument tuple in calls"""
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    return 1e6 * (time.perf_counter() - start) / len(calls)
+
+
+def bench_kernels(path, searches, seed):
+    """Measure the kernels against their pure-Python references on a maze library's layouts"""
+    library = MazeLibrary(path)
+    rng = np.random.default_rng(seed)
+    mazes = [Maze(library.width, library.height, layout=library.layout(i)) for i in range(len(library))]
+    start = pacman_start(library.width, library.height)
+    bfs_calls, flood_calls = [], []
+    for maze in mazes:
+        ys, xs = np.nonzero(maze.walls() == 0)
+        flood_calls.append((maze.walls() == 0, *start))
+        for i, j in rng.integers(len(xs), size=(searches, 2)).tolist():
+            bfs_calls.append((maze, (int(xs[i]), int(ys[i])), (int(xs[j]), int(ys[j]))))
+    positions = rng.uniform(0, library.width * TILE_SIZE, size=(2, 512))
+    within_calls = [(positions[0], positions[1], 0, np.arange(1, n), COLLISION_RADIUS) for n in (4, 64, 512)] * 200
+
+    def within_numpy(xs, ys, slot, slots, radius):
+        dx = xs[slots] - xs[slot]
+        dy = ys[slots] - ys[slot]
+        return dx * dx + dy * dy < radius * radius
+
+    def bfs_kernel(maze, start_pos, target_pos):
+        return kernels.bfs_search(maze.walls(), *start_pos, *target_pos, BFS_MAX_EXPANSIONS)
+
+    rows = [
+        ("bfs_search", bfs_search_python, bfs_kernel, bfs_calls),
+        ("flood_components", flood_components_python, kernels.flood_components, flood_calls),
+        ("within_radius", within_numpy, kernels.within_radius, within_calls),
+    ]
+    mode = "compiled" if kernels.ENABLED else "uncompiled (Numba not enabled)"
+    print(f"{len(mazes)} {library.width}x{library.height} layouts, kernels {mode}")
+    print(f"{'kernel':>17} {'calls':>6} {'reference us':>13} {'kernel us':>10} {'speedup':>8}")
+    for name, reference, kernel, calls in rows:
+        kernel(*calls[0])  # Compile (or load the cached compilation) outside the timing
+        reference_us = _mean_us(reference, calls)
+        kernel_us = _mean_us(kernel, calls)
+        print(f"{name:>17} {len(calls):6d} {reference_us:13.1f} {kernel_us:10.1f} {reference_us / kernel_us:7.1f}x")
+
+
+def bench_chunks(tiles, checkpoints, idle_ms, seed):
+    """
+    Stream an endless maze along a straight trip, with and without the prefetch worker.
+    Every step Pacman enters the next tile, eats its pellet and the column
+    coming into view is read, as the renderer would; then the game thread
+    idles for idle_ms (Pacman takes several frames to cross a tile), which is
+    when the worker gets to run. Only the game thread's work is timed.
+    """
+    print(f"{'prefetch':>8} {'tiles':>8} {'mean us':>8} {'max ms':>7} {'loads':>6} {'prefetched':>11} "
+          f"{'waited':>7} {'resident':>9} {'traced KiB':>11}")
+    for prefetch in (False, True):
+        maze = ChunkedMaze(seed, prefetch=prefetch)
+        start_x, y = maze.pacman_start
+        tracemalloc.start()
+        baseline = None
+        times = []
+        for step in range(1, tiles + 1):
+            x = start_x + step
+            begin = time.perf_counter_ns()
+            maze.stream((x, y), RIGHT)
+            maze.eat_pellet(*maze.tile_center(x, y))
+            for view_y in range(y - MAZE_HEIGHT // 2, y + MAZE_HEIGHT // 2 + 1):
+                maze.get_tile(x + MAZE_WIDTH // 2, view_y)
+            times.append(time.perf_counter_ns() - begin)
+            time.sleep(idle_ms / 1000)
+            if step % (tiles // checkpoints) == 0:
+                traced = tracemalloc.get_traced_memory()[0]
+                baseline = traced if baseline is None else baseline
+                stats = maze.stats
+                print(f"{'on' if prefetch else 'off':>8} {step:8d} {sum(times) / len(times) / 1e3:8.1f} "
+                      f"{max(times) / 1e6:7.2f} {stats['generated'] + stats['restored']:6d} "
+                      f"{stats['prefetched']:11d} {stats['waited']:7d} {len(maze.chunks):9d} {(traced - baseline) / 1024:+11.1f}")
+                times = []
+        tracemalloc.stop()
+        maze.close()
+
+
+def main():
+    """Run a benchmark"""
+    parser = argparse.ArgumentParser(description="EntangleMan performance benchmarks")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    swarm = benchmarks.add_parser("swarm", help="per-tick cost at increasing ghost counts")
+    swarm.add_argument("--ghosts", type=int, nargs="+", default=[4, 64, 512], help="ghost counts to measure")
+    swarm.add_argument("--ticks", type=int, default=600, help="ticks simulated per ghost count")
+    swarm.add_argument("--seed", type=int, default=0, help="game seed")
+    swarm.add_argument("--width", type=int, default=MAZE_WIDTH, help="maze width in tiles")
+    swarm.add_argument("--height", type=int, default=MAZE_HEIGHT, help="maze height in tiles")
+    startup = benchmarks.add_parser("startup", help="import time and time to first frame")
+    startup.add_argument("--runs", type=int, default=3, help="fresh interpreters per mode (median reported)")
+    fluctuation = benchmarks.add_parser("fluctuation", help="regional fluctuation versus full regeneration")
+    fluctuation.add_argument("--sizes", nargs="+", default=["28x31", "100x100", "300x300"],
+                             help="maze sizes as WIDTHxHEIGHT")
+    fluctuation.add_argument("--repeats", type=int, default=20, help="fluctuations per size (median reported)")
+    layouts = benchmarks.add_parser("layouts", help="Aer layout generation throughput")
+    layouts.add_argument("--count", type=int, default=256, help="layouts generated per worker count")
+    layouts.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4],
+                         help="worker process counts (0 = in this process)")
+    layouts.add_argument("--width", type=int, default=MAZE_WIDTH, help="maze width in tiles")
+    layouts.add_argument("--height", type=int, default=MAZE_HEIGHT, help="maze height in tiles")
+    cells = benchmarks.add_parser("cells", help="per-cell walk layouts by maze size")
+    cells.add_argument("--sizes", nargs="+", default=["28x31", "100x100", "300x300", "1000x1000"],
+                       help="maze sizes as WIDTHxHEIGHT")
+    cells.add_argument("--blocks", type=int, nargs="+", default=[1, 2, 4], help="cell block sizes")
+    cells.add_argument("--repeats", type=int, default=5, help="layouts and fluctuations per setting (median reported)")
+    vecenv = benchmarks.add_parser("vecenv", help="vectorized environment throughput by worker count")
+    vecenv.add_argument("--envs", type=int, default=16, help="games stepped together")
+    vecenv.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4],
+                        help="worker process counts (0 = in this process)")
+    vecenv.add_argument("--steps", type=int, default=500, help="steps timed per worker count")
+    vecenv.add_argument("--seed", type=int, default=0, help="seed of the games and their actions")
+    kernel = benchmarks.add_parser("kernels", help="compiled kernels versus pure-Python references")
+    kernel.add_argument("path", help="maze library to run on (see maze_library.py)")
+    kernel.add_argument("--searches", type=int, default=50, help="random ghost searches per layout")
+    kernel.add_argument("--seed", type=int, default=0, help="seed of the search endpoints")
+    chunk = benchmarks.add_parser("chunks", help="endless maze streaming over a long trip")
+    chunk.add_argument("--tiles", type=int, default=20000, help="tiles travelled")
+    chunk.add_argument("--idle-ms", type=float, default=1.0, help="game thread idle time per tile")
+    chunk.add_argument("--checkpoints", type=int, default=5, help="rows printed per trip")
+    chunk.add_argument("--seed", type=int, default=0, help="world seed")
+    args = parser.parse_args()
+
+    if args.benchmark == "swarm":
+        bench_swarm(args.ghosts, args.ticks, args.seed, args.width, args.height)
+    elif args.benchmark == "startup":
+        bench_startup(args.runs)
+    elif args.benchmark == "fluctuation":
+        bench_fluctuation([tuple(int(n) for n in size.split("x")) for size in args.sizes], args.repeats)
+    elif args.benchmark == "layouts":
+        bench_layouts(args.count, args.workers, args.width, args.height)
+    elif args.benchmark == "cells":
+        bench_cells([tuple(int(n) for n in size.split("x")) for size in args.sizes], args.blocks, args.repeats)
+    elif args.benchmark == "vecenv":
+        bench_vecenv(args.envs, args.workers, args.steps, args.seed)
+    elif args.benchmark == "kernels":
+        bench_kernels(args.path, args.searches, args.seed)
+    elif args.benchmark == "chunks":
+        bench_chunks(args.tiles, args.checkpoints, args.idle_ms, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""
+Endless chunked maze for Pacman
+
+In endless mode the maze has no edge Pacman can reach: it is split into
+CHUNK_TILES x CHUNK_TILES chunks that are generated the first time something
+looks at them. Every chunk is seeded from the world seed and its coordinates
+(see chunk_seed), so it gets its own quantum walk distribution, and it is
+generated with the same rules as a whole layout (maze.generate_region) in
+world coordinates. The connectivity corridors sit on world rows and columns,
+so corridors always run on across chunk seams.
+
+Resident chunks are kept in a bounded LRU cache. When Pacman enters a new
+chunk or turns, the chunks ahead of its heading are generated on a worker
+thread, and the chunk evicted when the cache is full is dropped, or written
+to a spill directory when it differs from what its seed would generate
+(eaten pellets, fluctuated walls). Memory therefore stays the same however
+far Pacman travels; only the spill directory grows.
+
+A ChunkedMaze has the methods of maze.Maze the game loop uses, so
+pathfinding (through is_valid_position), entanglement and the renderer
+(through get_tile and the pellet views) work across chunk boundaries
+unchanged. The world is WORLD_TILES square with the ghost house in its
+middle, far more than anyone can travel (2^27 tiles to the closest edge).
+Endless games can't be recorded, spectated or played from a library, and
+are never won: there is always more maze.
+
+Usage:
+    python main.py --endless
+    python main.py --endless --spill /tmp/chunks     # keep changed chunks on disk when evicted
+    python benchmark.py chunks                       # stream cost, prefetch hits and memory over a long trip
+"""
+import hashlib
+import os
+import random
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from constants import *
+from maze import REGION_WALK_SHOTS, WALK_STEPS, generate_region, maze_center
+from quantum_backend import STATEVECTOR, WALK_ROTATION, walk_batch
+
+CHUNK_TILES = 16  # Chunk edge length in tiles
+WORLD_CHUNKS = 2 ** 24  # World edge length in chunks
+WORLD_TILES = CHUNK_TILES * WORLD_CHUNKS
+CHUNK_CACHE = 48  # Resident chunks (the screen shows at most 9, plus the ghosts' and prefetched ones)
+PREFETCH_CHUNKS = 2  # Chunks ahead of Pacman's heading generated on the worker
+POWER_PELLET_CHANCE = 0.25  # Chance that a chunk holds a power pellet
+GHOST_LEASH_TILES = 24  # Ghosts farther than this from Pacman (in either axis) are brought back
+GHOST_RETURN_TILES = 18  # ... to a corridor crossing about this far from Pacman, just off screen
+
+
+def chunk_seed(world_seed, chunk_x, chunk_y):
+    """Get the walk seed of a chunk (depends only on the world seed and the chunk's coordinates)"""
+    digest = hashlib.blake2b(struct.pack("<QQQ", world_seed, chunk_x, chunk_y), digest_size=4,
+                             person=b"chunk").digest()
+    return int.from_bytes(digest, "little")
+
+
+def _corridor(coordinate):
+    """Get the first world corridor row or column (see generate_region) at or after a coordinate"""
+    return coordinate + (1 - coordinate) % 5
+
+
+def endless_start():
+    """Get Pacman's starting tile: the first corridor row below the ghost house"""
+    center_x, center_y = maze_center(WORLD_TILES, WORLD_TILES)
+    return center_x, _corridor(center_y + 3)
+
+
+def _clear_start(grid, region):
+    """Clear the 3x3 tiles around Pacman's start inside a region's grid (generate_region's own start is elsewhere)"""
+    x0, y0, x1, y1 = region
+    start_x, start_y = endless_start()
+    area = grid[max(start_y - 1, y0) - y0:max(min(start_y + 2, y1) - y0, 0),
+                max(start_x - 1, x0) - x0:max(min(start_x + 2, x1) - x0, 0)]
+    area[area != GHOST_HOUSE] = PELLET
+
+
+class Chunk:
+    """The tiles and pellets of one chunk"""
+    __slots__ = ("tiles", "pellets", "changed")
+
+    def __init__(self, tiles, pellets, changed=False):
+        self.tiles = tiles  # Rows of tile types (plain lists keep per-tile lookups fast)
+        self.pellets = pellets  # Row-major bytearray: PELLET, POWER_PELLET or EMPTY per tile
+        self.changed = changed  # Differs from what its seed generates, so it is spilled on eviction
+
+    def to_bytes(self):
+        """Get the tiles and pellets as row-major bytes (the spill file format)"""
+        return bytes(np.array(self.tiles, dtype=np.int8)) + bytes(self.pellets)
+
+    @staticmethod
+    def from_bytes(data):
+        """Rebuild a changed chunk from to_bytes()"""
+        size = CHUNK_TILES * CHUNK_TILES
+        tiles = np.frombuffer(data[:size], dtype=np.int8).reshape(CHUNK_TILES, CHUNK_TILES).tolist()
+        return Chunk(tiles, bytearray(data[size:]), changed=True)
+
+
+def generate_chunk(world_seed, chunk_x, chunk_y, backend=STATEVECTOR):
+    """
+    Generate a chunk from its own quantum walk.
+    Args:
+        world_seed: the endless game's layout seed
+        chunk_x, chunk_y: chunk coordinates (tile // CHUNK_TILES)
+        backend: quantum walk backend
+    Returns:
+        A Chunk
+    """
+    x0, y0 = chunk_x * CHUNK_TILES, chunk_y * CHUNK_TILES
+    region = (x0, y0, x0 + CHUNK_TILES, y0 + CHUNK_TILES)
+    seed = chunk_seed(world_seed, chunk_x, chunk_y)
+    grid = generate_region(WORLD_TILES, WORLD_TILES, region, seed, backend=backend)
+    _clear_start(grid, region)
+    # generate_region only puts power pellets in the world's corners: scatter a few per chunk instead
+    rng = np.random.default_rng(seed)
+    if rng.random() < POWER_PELLET_CHANCE:
+        ys, xs = np.nonzero(grid == PELLET)
+        if len(xs):
+            i = rng.integers(len(xs))
+            grid[ys[i], xs[i]] = POWER_PELLET
+    pellets = np.where((grid == PELLET) | (grid == POWER_PELLET), grid, EMPTY).astype(np.uint8)
+    return Chunk(grid.tolist(), bytearray(pellets.tobytes()))
+
+
+class ChunkPellets:
+    """Set-like view of one kind of pellet (PELLET or POWER_PELLET) in the resident chunks"""
+
+    def __init__(self, maze, kind):
+        self.maze = maze
+        self.kind = kind
+
+    def __contains__(self, pos):
+        x, y = pos
+        if x < 0 or x >= WORLD_TILES or y < 0 or y >= WORLD_TILES:
+            return False
+        chunk = self.maze.chunk(x // CHUNK_TILES, y // CHUNK_TILES)
+        return chunk.pellets[(y % CHUNK_TILES) * CHUNK_TILES + x % CHUNK_TILES] == self.kind
+
+    def __iter__(self):
+        for (chunk_x, chunk_y), chunk in list(self.maze.chunks.items()):
+            for i in np.flatnonzero(np.frombuffer(chunk.pellets, dtype=np.uint8) == self.kind).tolist():
+                yield chunk_x * CHUNK_TILES + i % CHUNK_TILES, chunk_y * CHUNK_TILES + i // CHUNK_TILES
+
+    def __len__(self):
+        kind = bytes([self.kind])
+        return sum(chunk.pellets.count(kind) for chunk in self.maze.chunks.values())
+
+
+class ChunkedMaze:
+    """Endless maze streamed in chunks through a bounded LRU cache (the Maze interface the game loop uses)"""
+
+    def __init__(self, seed=None, walk_backend=STATEVECTOR, noise_profile=None, executor=None,
+                 capacity=CHUNK_CACHE, spill_dir=None, prefetch=True, rng=random):
+        """
+        Args:
+            seed: world seed (every chunk's walk seed derives from it)
+            walk_backend: quantum walk backend for chunks and fluctuations
+            noise_profile: noise profile emulated by tunneling measurements (see noise.py)
+            executor: optional QuantumExecutor for tunneling measurements
+            capacity: resident chunks kept before the least recently used is evicted
+            spill_dir: directory changed chunks are written to on eviction (None = drop them,
+                so they come back as generated, pellets and all)
+            prefetch: generate the chunks ahead of Pacman on a worker thread
+            rng: source of randomness for noisy measurement batches (the game's seeded RNG)
+        """
+        if capacity < 9:
+            raise ValueError(f"The chunk cache must hold at least the 9 chunks around Pacman, got {capacity}")
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.walk_backend = walk_backend
+        self.width = WORLD_TILES
+        self.height = WORLD_TILES
+        self.center = maze_center(WORLD_TILES, WORLD_TILES)
+        self.pacman_start = endless_start()
+        cx, cy = self.center
+        self.ghost_starts = [(cx - 1, cy - 1), (cx, cy - 1), (cx - 1, cy), (cx, cy)]
+        # Corridor crossings around the ghost house
+        self.scatter_targets = [(_corridor(cx + 10), _corridor(cy - 14)), (_corridor(cx - 14), _corridor(cy - 14)),
+                                (_corridor(cx + 10), _corridor(cy + 10)), (_corridor(cx - 14), _corridor(cy + 10))]
+        self.noise_profile = noise_profile
+        self.rng = rng
+        self.executor = executor
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.chunks = OrderedDict()  # (chunk x, chunk y) -> Chunk, least recently used first
+        self.pending = {}  # (chunk x, chunk y) -> Future of a prefetched Chunk
+        # One thread: prefetches run in the order Pacman asked for them
+        self.prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chunks") if prefetch else None
+        self._streamed = None  # (chunk x, chunk y, direction) of the last prefetch
+        # Bumped whenever resident tiles change (fluctuations), see changes_since()
+        self.layout_version = 0
+        self.last_change = None
+        self.layout_fell_back = False  # Chunks never wait on the walk deadline
+        self.pellets = ChunkPellets(self, PELLET)
+        self.power_pellets = ChunkPellets(self, POWER_PELLET)
+        self.stats = {"generated": 0, "restored": 0, "prefetched": 0, "waited": 0, "evicted": 0, "spilled": 0}
+        from entanglement import EntanglementManager
+        self.entanglement = EntanglementManager(self)
+
+    def chunk(self, chunk_x, chunk_y):
+        """Get a chunk, loading it if it isn't resident, and mark it most recently used"""
+        key = (chunk_x, chunk_y)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+        future = self.pending.pop(key, None)
+        if future is not None:
+            if not future.done():
+                self.stats["waited"] += 1  # Pacman caught up with the worker
+            chunk, restored = future.result()
+            self.stats["prefetched"] += 1
+        else:
+            chunk, restored = self._build(key)
+        self.stats["restored" if restored else "generated"] += 1
+        self.chunks[key] = chunk
+        if len(self.chunks) > self.capacity:
+            self._evict(*self.chunks.popitem(last=False))
+        return chunk
+
+    def _build(self, key):
+        """Load a chunk from the spill directory or generate it; returns (chunk, restored) (runs on the worker too)"""
+        if self.spill_dir is not None:
+            try:
+                with open(self._spill_path(key), "rb") as f:
+                    return Chunk.from_bytes(f.read()), True
+            except FileNotFoundError:
+                pass
+        return generate_chunk(self.seed, *key, backend=self.walk_backend), False
+
+    def _spill_path(self, key):
+        """Get the spill file of a chunk (named by world seed, so a new world never reads an old one)"""
+        return os.path.join(self.spill_dir, f"{self.seed:08x}_{key[0]}_{key[1]}.chunk")
+
+    def _evict(self, key, chunk):
+        """Forget an evicted chunk's locks and spill it if it changed"""
+        self.stats["evicted"] += 1
+        x0, y0 = key[0] * CHUNK_TILES, key[1] * CHUNK_TILES
+        locks = self.entanglement.locked_measurements
+        for x, y in [pos for pos in locks if x0 <= pos[0] < x0 + CHUNK_TILES and y0 <= pos[1] < y0 + CHUNK_TILES]:
+            del locks[(x, y)]
+        if self.spill_dir is not None and chunk.changed:
+            with open(self._spill_path(key), "wb") as f:
+                f.write(chunk.to_bytes())
+            self.stats["spilled"] += 1
+
+    def stream(self, tile, direction):
+        """
+        Prefetch the chunks ahead of Pacman's heading on the worker, and drop
+        prefetches Pacman has left behind. Called whenever Pacman enters a tile.
+        """
+        chunk_x, chunk_y = tile[0] // CHUNK_TILES, tile[1] // CHUNK_TILES
+        if self.prefetcher is None or self._streamed == (chunk_x, chunk_y, direction):
+            return
+        self._streamed = (chunk_x, chunk_y, direction)
+        for key in [key for key in self.pending
+                    if max(abs(key[0] - chunk_x), abs(key[1] - chunk_y)) > PREFETCH_CHUNKS + 1]:
+            self.pending.pop(key).cancel()
+        dx, dy = direction
+        for distance in range(1, PREFETCH_CHUNKS + 1):
+            for side in (-1, 0, 1):
+                # The chunk straight ahead and its neighbours across the heading
+                key = (chunk_x + dx * distance + dy * side, chunk_y + dy * distance + dx * side)
+                if (dx or dy) and 0 <= key[0] < WORLD_CHUNKS and 0 <= key[1] < WORLD_CHUNKS \
+                        and key not in self.chunks and key not in self.pending:
+                    self.pending[key] = self.prefetcher.submit(self._build, key)
+
+    def leash(self, tile, pacman_tile):
+        """
+        Get where a ghost that strayed too far from Pacman comes back.
+        Ghosts only turn around at dead ends, and the world's corridors never
+        end, so a ghost heading away from Pacman would otherwise never return.
+        Args:
+            tile: the ghost's tile
+            pacman_tile: Pacman's tile
+        Returns:
+            (corridor crossing on the ghost's side of Pacman, direction facing Pacman),
+            or None if the ghost is close enough
+        """
+        dx, dy = tile[0] - pacman_tile[0], tile[1] - pacman_tile[1]
+        distance = max(abs(dx), abs(dy))
+        if distance <= GHOST_LEASH_TILES:
+            return None
+        scale = GHOST_RETURN_TILES / distance
+        crossing = (_corridor(pacman_tile[0] + round(dx * scale)), _corridor(pacman_tile[1] + round(dy * scale)))
+        if abs(dx) >= abs(dy):
+            return crossing, (LEFT if dx > 0 else RIGHT)
+        return crossing, (UP if dy > 0 else DOWN)
+
+    def close(self):
+        """Stop the prefetch worker, dropping prefetches that have not started"""
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown(wait=False, cancel_futures=True)
+        self.pending.clear()
+
+    def reset_all_walls(self, seed=None, walk_backend=STATEVECTOR):
+        """Start a new world: every chunk is dropped and regenerated from the new seed when next seen"""
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.chunks.clear()
+        self._streamed = None
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.walk_backend = walk_backend
+        self.layout_version += 1
+        self.last_change = None
+        self.entanglement.locked_measurements.clear()
+        self.entanglement.measurement_cache.clear()
+
+    def reset_pellets(self):
+        """Nothing to do: chunks come with their pellets when generated"""
+
+    def fluctuation_regions(self, pacman_tile):
+        """Get the regions a fluctuation may regenerate: the resident chunks' regions not close to Pacman"""
+        size = FLUCTUATION_REGION_TILES
+        margin = FLUCTUATION_SAFE_RADIUS
+        pacman_x, pacman_y = pacman_tile
+        regions = []
+        for chunk_x, chunk_y in sorted(self.chunks):
+            for y0 in range(chunk_y * CHUNK_TILES, (chunk_y + 1) * CHUNK_TILES, size):
+                for x0 in range(chunk_x * CHUNK_TILES, (chunk_x + 1) * CHUNK_TILES, size):
+                    if not (x0 - margin <= pacman_x < x0 + size + margin and
+                            y0 - margin <= pacman_y < y0 + size + margin):
+                        regions.append((x0, y0, min(x0 + size, (chunk_x + 1) * CHUNK_TILES),
+                                        min(y0 + size, (chunk_y + 1) * CHUNK_TILES)))
+        return regions
+
+    def fluctuate(self, seed, pacman_tile, walk_backend=STATEVECTOR, count=FLUCTUATION_REGIONS):
+        """
+        Regenerate a few regions of the resident chunks, away from Pacman (see Maze.fluctuate).
+        Returns:
+            The changed tiles as a list of (x, y)
+        """
+        rng = random.Random(seed)
+        candidates = self.fluctuation_regions(pacman_tile)
+        regions = rng.sample(candidates, min(count, len(candidates)))
+        seeds = [rng.getrandbits(32) for _ in regions]
+        walks = walk_batch([(WALK_STEPS, WALK_ROTATION, seed) for seed in seeds], REGION_WALK_SHOTS, walk_backend)
+        changes = []
+        for region, probs in zip(regions, walks):
+            x0, y0, x1, y1 = region
+            new = generate_region(WORLD_TILES, WORLD_TILES, region, probs=probs)
+            _clear_start(new, region)
+            old = np.array([[self.get_tile(x, y) for x in range(x0, x1)] for y in range(y0, y1)], dtype=np.int8)
+            ys, xs = np.nonzero(new != old)
+            changes.extend(zip((xs + x0).tolist(), (ys + y0).tolist(), new[ys, xs].tolist()))
+        self.set_tiles(changes, regions)
+        tiles = [(x, y) for x, y, _ in changes]
+        self._update_tiles(tiles)
+        return tiles
+
+    def set_tiles(self, changes, regions=None):
+        """Write (x, y, tile) changes to the resident chunks as one layout update (see Maze.set_tiles)"""
+        if not changes:
+            return
+        for x, y, tile in changes:
+            chunk = self.chunk(x // CHUNK_TILES, y // CHUNK_TILES)
+            chunk.tiles[y % CHUNK_TILES][x % CHUNK_TILES] = tile
+            chunk.changed = True
+        self.layout_version += 1
+        self.last_change = (self.layout_version, regions, [(x, y) for x, y, _ in changes])
+
+    def changes_since(self, version):
+        """Get what changed in the layout since an earlier layout_version (see Maze.changes_since)"""
+        if version == self.layout_version:
+            return [], []
+        if self.last_change is not None and self.last_change[0] == version + 1:
+            return self.last_change[1], self.last_change[2]
+        return None
+
+    def _update_tiles(self, tiles):
+        """Drop the pellets and locks of tiles whose type changed"""
+        locks = self.entanglement.locked_measurements
+        for x, y in tiles:
+            locks.pop((x, y), None)
+            self.entanglement.measurement_cache.pop((x, y), None)
+            chunk = self.chunk(x // CHUNK_TILES, y // CHUNK_TILES)
+            if chunk.tiles[y % CHUNK_TILES][x % CHUNK_TILES] in (WALL, GHOST_HOUSE):
+                # Walled-in pellets could never be eaten
+                chunk.pellets[(y % CHUNK_TILES) * CHUNK_TILES + x % CHUNK_TILES] = EMPTY
+
+    def get_tile(self, x, y):
+        """Get tile type at position"""
+        if x < 0 or x >= WORLD_TILES or y < 0 or y >= WORLD_TILES:
+            return WALL
+        # Resident chunks are looked up inline: searches call this for every tile they expand
+        key = (x // CHUNK_TILES, y // CHUNK_TILES)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunk(*key)
+        else:
+            self.chunks.move_to_end(key)
+        return chunk.tiles[y % CHUNK_TILES][x % CHUNK_TILES]
+
+    def is_wall(self, x, y, for_ghost=False):
+        """Check if position is a wall (walls are measured in try_quantum_tunneling, see Maze.is_wall)"""
+        return self.get_tile(x, y) == WALL
+
+    def is_valid_position(self, x, y, for_ghost=False):
+        """Check if position is valid (not a wall)"""
+        return self.get_tile(x, y) != WALL
+
+    def try_quantum_tunneling(self, x, y):
+        """Try quantum tunneling through a wall (see Maze.try_quantum_tunneling)"""
+        # Don't allow tunneling through the world's border
+        if x <= 0 or x >= WORLD_TILES - 1 or y <= 0 or y >= WORLD_TILES - 1:
+            return False
+        if self.get_tile(x, y) == WALL:
+            return self.entanglement.try_entangled_tunneling(x, y)
+        return False
+
+    def update_quantum_state(self, pacman_x, pacman_y):
+        """Return walls far from Pacman to superposition (see Maze.update_quantum_state)"""
+        self.entanglement.unlock_walls_far_from_pacman(int(pacman_x // TILE_SIZE), int(pacman_y // TILE_SIZE))
+
+    def tile_center(self, x, y):
+        """Get the pixel center of a tile"""
+        return x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2
+
+    def eat_pellet(self, x, y):
+        """Remove pellet at position if exists, return score"""
+        grid_x = int(x // TILE_SIZE)
+        grid_y = int(y // TILE_SIZE)
+        chunk = self.chunk(grid_x // CHUNK_TILES, grid_y // CHUNK_TILES)
+        i = (grid_y % CHUNK_TILES) * CHUNK_TILES + grid_x % CHUNK_TILES
+        pellet = chunk.pellets[i]
+        if pellet == EMPTY:
+            return 0
+        chunk.pellets[i] = EMPTY
+        chunk.changed = True
+        return POWER_PELLET_SCORE if pellet == POWER_PELLET else PELLET_SCORE
+
+    def is_power_pellet(self, x, y):
+        """Check if position has a power pellet"""
+        return (int(x // TILE_SIZE), int(y // TILE_SIZE)) in self.power_pellets
+
+    def all_pellets_eaten(self):
+        """An endless maze always has more pellets"""
+        return False
@@ -4,9 +4,19 @@ Game constants and configuration for Pacman
 
 # Screen settings
 TILE_SIZE = 20
-SCREEN_WIDTH = 28 * TILE_SIZE  # Standard Pacman maze is 28x31
-SCREEN_HEIGHT = 31 * TILE_SIZE
-FPS = 60
+MAZE_WIDTH = 28  # Default maze size in tiles (standard Pacman maze is 28x31)
+MAZE_HEIGHT = 31
+SCREEN_WIDTH = MAZE_WIDTH * TILE_SIZE  # Window (viewport) size in pixels
+SCREEN_HEIGHT = MAZE_HEIGHT * TILE_SIZE
+FPS = 60  # Display frame rate cap
+
+# Simulation timing (all game timers count fixed ticks, not frames)
+TICK_RATE = 60  # Simulation ticks per second
+MAX_CATCHUP_TICKS = 5  # Max ticks run per frame before dropping the backlog
+FLUCTUATION_PERIOD = 5  # seconds between quantum wall fluctuations
+FLUCTUATION_REGION_TILES = 8  # Edge length in tiles of the square regions a fluctuation regenerates
+FLUCTUATION_REGIONS = 4  # Regions regenerated per fluctuation
+FLUCTUATION_SAFE_RADIUS = 3  # Regions within this many tiles of Pacman never fluctuate
 
 # Colors
 BLACK = (0, 0, 0)
@@ -19,16 +29,35 @@ CYAN = (0, 255, 255)
 ORANGE = (255, 184, 82)
 DARK_BLUE = (33, 33, 222)
 LIGHT_BLUE = (100, 100, 255)
+GREEN = (0, 255, 0)
 
 # Game settings
 PACMAN_SPEED = 2
 GHOST_SPEED = 1.5
 FRIGHTENED_SPEED = 1
+GHOST_COUNT = 4  # Default number of ghosts (more = swarm mode)
+COLLISION_RADIUS = TILE_SIZE * 0.8  # Ghost/Pacman centers closer than this collide
 POWER_PELLET_DURATION = 10  # seconds
 GHOST_SCORE = 200
 PELLET_SCORE = 10
 POWER_PELLET_SCORE = 50
 
+# Fixed-point movement (see Entity.advance)
+SUBPIXELS = 10  # Position units per pixel; every speed is a multiple of 1/SUBPIXELS
+TILE_UNITS = TILE_SIZE * SUBPIXELS
+HALF_TILE_UNITS = TILE_UNITS // 2
+
+# Movement events (bit flags returned by Entity.advance)
+TILE_ENTERED = 1  # Moved (or was placed) into a new tile
+BLOCKED = 2  # Stopped at a tile center facing a wall
+MEASURED = 4  # Pacman ran into a wall and tried to tunnel through it
+
+# Ghost pathfinding
+BFS_MAX_EXPANSIONS = 2048  # Tiles a single BFS may expand before giving up
+AI_NODE_BUDGET = 4096  # Tiles all ghost searches may expand in one tick
+AI_MIN_SEARCH = 64  # Smallest search worth starting; less budget left defers the rest
+AI_URGENT_RADIUS = 8  # Ghosts within this many tiles re-plan when Pacman changes tile
+
 # Entity types
 WALL = 1
 PELLET = 2
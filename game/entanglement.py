@@ -1,7 +1,8 @@
 """
 Quantum entanglement manager for Pacman walls
 """
-from quantum_logic import hadamard_measure
+from quantum_logic import MeasurementPool
+from profiler import profiler
 
 class EntanglementManager:
     def __init__(self, maze):
@@ -12,6 +13,9 @@ class EntanglementManager:
         # Track which walls have been measured and locked
         # Once measured, the result is locked until Pacman moves away
         self.locked_measurements = {}
+        # Batched Hadamard measurement outcomes (one simulator job per batch)
+        self.measurements = MeasurementPool(noise_profile=maze.noise_profile, executor=maze.executor,
+                                            rng=maze.rng)
         
     def get_local_entangled_group(self, x, y):
         """
@@ -20,7 +24,7 @@ class EntanglementManager:
         This prevents the entire maze from collapsing to one state.
         """
         # Check actual wall status (not the disappeared state)
-        if self.maze.layout[y][x] != 1:  # 1 is WALL constant
+        if self.maze.get_tile(x, y) != 1:  # 1 is WALL constant
             return set()
         
         group = {(x, y)}
@@ -33,7 +37,7 @@ class EntanglementManager:
                 next_x, next_y = x + dx, y + dy
                 if 0 <= next_x < self.maze.width and 0 <= next_y < self.maze.height:
                     # Check actual wall status (not the disappeared state)
-                    if self.maze.layout[next_y][next_x] == 1:  # 1 is WALL constant
+                    if self.maze.get_tile(next_x, next_y) == 1:  # 1 is WALL constant
                         group.add((next_x, next_y))
         
         return group
@@ -70,7 +74,9 @@ class EntanglementManager:
         
         # Perform a NEW quantum measurement for this group
         # This represents preparing a fresh quantum state and measuring it
-        measurement_result = hadamard_measure()
+        t = profiler.start()
+        measurement_result = self.measurements.next()
+        profiler.stop("quantum.measure", t)
         
         # LOCK the result for all walls in the entangled group
         # This prevents re-measuring the same wall by holding against it
@@ -131,7 +137,7 @@ class EntanglementManager:
                 continue
             
             # Check if it's a wall
-            if self.maze.layout[check_y][check_x] == 1:  # 1 is WALL constant
+            if self.maze.get_tile(check_x, check_y) == 1:  # 1 is WALL constant
                 # Check if the wall is locked as SOLID (not passable)
                 if (check_x, check_y) in self.locked_measurements:
                     if not self.locked_measurements[(check_x, check_y)]:
@@ -3,129 +3,202 @@ Entity classes for Pacman game (Pacman and Ghosts)
 """
 import random
 import math
+from abc import ABC, abstractmethod
 from constants import *
-from pathfinding import get_best_direction
+from entity_store import EntityStore, column, direction_column
+from pathfinding import choose_direction
+from profiler import profiler
 
 
-class Entity:
-    """Base class for moveable entities"""
+def fixed_column(name, units, event=0):
+    """
+    Column property that also keeps the entity's fixed-point copy of the value in step.
+    Args:
+        name: store column, in pixels
+        units: slot holding the value in 1/SUBPIXELS pixels
+        event: flags the next advance() reports after a write (placing an
+            entity is a move into a new tile)
+    """
+    pixels = column(name)
+
+    def set(self, value):
+        pixels.fset(self, value)
+        setattr(self, units, round(value * SUBPIXELS))
+        self.events |= event
+
+    return property(pixels.fget, set)
+
+
+class TileEvents:
+    """
+    Dispatches movement events (see Entity.advance) to the handlers subscribed to them.
+    A tick without a subscribed event costs one mask test per handler.
+    """
+    
+    def __init__(self):
+        self.handlers = []  # (event flags, handler) in subscription order
+    
+    def subscribe(self, events, handler):
+        """
+        Call handler(entity, events) on every notification carrying any of the given flags.
+        Args:
+            events: bit flags (TILE_ENTERED, BLOCKED, MEASURED)
+            handler: callable taking the entity and all of its flags for the tick
+        """
+        self.handlers.append((events, handler))
     
-    def __init__(self, x, y, speed):
+    def notify(self, entity, events):
+        """Pass an entity's events for this tick to the matching handlers"""
+        for mask, handler in self.handlers:
+            if events & mask:
+                handler(entity, events)
+
+
+class Entity(ABC):
+    """
+    Base class for moveable entities.
+    Kinematics and timers live in an EntityStore slot; the entity is a view.
+    Movement runs on integer fixed-point coordinates (fx, fy in 1/SUBPIXELS
+    pixels) and only looks at the maze when a tile center is reached; the
+    store's x and y publish the position for rendering and collisions.
+    """
+    __slots__ = ("store", "slot", "fx", "fy", "step", "events")
+    x = fixed_column("x", "fx", TILE_ENTERED)
+    y = fixed_column("y", "fy", TILE_ENTERED)
+    prev_x = column("prev_x")
+    prev_y = column("prev_y")
+    speed = fixed_column("speed", "step")
+    direction = direction_column("direction")
+    next_direction = direction_column("next_direction")
+    
+    def __init__(self, x, y, speed, store=None):
+        # Entities created on their own get a private store
+        self.store = store if store is not None else EntityStore()
+        self.slot = self.store.allocate()
+        self.events = 0  # Events waiting for the next advance()
         self.x = x
         self.y = y
+        # Position at the start of the current tick (for render interpolation)
+        self.prev_x = x
+        self.prev_y = y
         self.speed = speed
         self.direction = LEFT
         self.next_direction = NONE
         
+    def save_previous(self):
+        """Record the current position as the start of the next tick"""
+        self.prev_x = self.x
+        self.prev_y = self.y
+    
+    def get_render_pos(self, alpha):
+        """
+        Get the position interpolated between the last two ticks.
+        Args:
+            alpha: fraction of a tick elapsed since the last update (0..1)
+        """
+        # Don't interpolate across teleports (screen wrap, respawn)
+        if abs(self.x - self.prev_x) > TILE_SIZE or abs(self.y - self.prev_y) > TILE_SIZE:
+            return self.x, self.y
+        return (self.prev_x + (self.x - self.prev_x) * alpha,
+                self.prev_y + (self.y - self.prev_y) * alpha)
+    
     def get_grid_pos(self):
         """Get grid position"""
-        return int(self.x // TILE_SIZE), int(self.y // TILE_SIZE)
+        return self.fx // TILE_UNITS, self.fy // TILE_UNITS
     
     def is_at_intersection(self):
         """Check if entity is at a grid intersection"""
         return (self.x % TILE_SIZE < 5 or self.x % TILE_SIZE > TILE_SIZE - 5) and \
                (self.y % TILE_SIZE < 5 or self.y % TILE_SIZE > TILE_SIZE - 5)
     
-    def move_left(self, maze, grid_x, grid_y, center_y):
-        """Move entity left"""
-        next_x = grid_x - 1
-        # For ghosts, use for_ghost=True to prevent quantum tunneling
-        is_ghost = isinstance(self, Ghost)
-        if maze.is_valid_position(next_x, grid_y, for_ghost=is_ghost):
-            # Can move freely
-            self.x -= self.speed
-            self.y = center_y
-        else:
-            # Only Pacman can try quantum tunneling
-            if not is_ghost and maze.try_quantum_tunneling(next_x, grid_y):
-                # Wall disappeared, can move now
-                self.x -= self.speed
-                self.y = center_y
-            else:
-                # Wall is solid, clamp to current tile center
-                target_x = grid_x * TILE_SIZE + TILE_SIZE // 2
-                if self.x > target_x:
-                    self.x = max(self.x - self.speed, target_x)
-                    self.y = center_y
+    def center_offset(self):
+        """Get the signed distance (in units) past the current tile's center along the direction"""
+        dx, dy = self.direction
+        return (self.fx % TILE_UNITS - HALF_TILE_UNITS) * dx + (self.fy % TILE_UNITS - HALF_TILE_UNITS) * dy
     
-    def move_right(self, maze, grid_x, grid_y, center_y):
-        """Move entity right"""
-        next_x = grid_x + 1
-        # For ghosts, use for_ghost=True to prevent quantum tunneling
-        is_ghost = isinstance(self, Ghost)
-        if maze.is_valid_position(next_x, grid_y, for_ghost=is_ghost):
-            # Can move freely
-            self.x += self.speed
-            self.y = center_y
-        else:
-            # Only Pacman can try quantum tunneling
-            if not is_ghost and maze.try_quantum_tunneling(next_x, grid_y):
-                # Wall disappeared, can move now
-                self.x += self.speed
-                self.y = center_y
-            else:
-                # Wall is solid, clamp to current tile center
-                target_x = grid_x * TILE_SIZE + TILE_SIZE // 2
-                if self.x < target_x:
-                    self.x = min(self.x + self.speed, target_x)
-                    self.y = center_y
+    def reaches_center(self):
+        """Check if this tick's move stops at or crosses a tile center (where advance() turns)"""
+        offset = self.center_offset()
+        return offset == 0 or offset < 0 < offset + self.step
     
-    def move_up(self, maze, grid_x, grid_y, center_x):
-        """Move entity up"""
-        next_y = grid_y - 1
-        # For ghosts, use for_ghost=True to prevent quantum tunneling
-        is_ghost = isinstance(self, Ghost)
-        if maze.is_valid_position(grid_x, next_y, for_ghost=is_ghost):
-            # Can move freely
-            self.y -= self.speed
-            self.x = center_x
+    def advance(self, maze):
+        """
+        Move one tick in the current direction.
+        Between tile centers this is a few integer operations: the maze is
+        only consulted, through at_center(), when the move reaches a center.
+        A move that ends exactly on a center handles it on the next tick.
+        Returns:
+            Bit flags of this tick's events (TILE_ENTERED, BLOCKED, MEASURED)
+        """
+        events = self.events
+        self.events = 0
+        dx, dy = self.direction
+        fx, fy = self.fx, self.fy
+        step = self.step
+        offset = self.center_offset()
+        
+        if offset == 0 or offset < 0 < offset + step:
+            # Reaching the tile center: snap to it, turn, and check the tile ahead
+            tile_x, tile_y = (fx - offset * dx) // TILE_UNITS, (fy - offset * dy) // TILE_UNITS
+            fx = tile_x * TILE_UNITS + HALF_TILE_UNITS
+            fy = tile_y * TILE_UNITS + HALF_TILE_UNITS
+            events |= self.at_center(maze, tile_x, tile_y)
+            if events & BLOCKED:
+                step = 0
+            elif offset < 0:
+                step += offset  # The rest of this tick's move, after the turn
+            dx, dy = self.direction
+            fx += dx * step
+            fy += dy * step
         else:
-            # Only Pacman can try quantum tunneling
-            if not is_ghost and maze.try_quantum_tunneling(grid_x, next_y):
-                # Wall disappeared, can move now
-                self.y -= self.speed
-                self.x = center_x
-            else:
-                # Wall is solid, clamp to current tile center
-                target_y = grid_y * TILE_SIZE + TILE_SIZE // 2
-                if self.y > target_y:
-                    self.y = max(self.y - self.speed, target_y)
-                    self.x = center_x
+            fx += dx * step
+            fy += dy * step
+            # Crossing the edge into the next tile (an edge belongs to the tile right of / below it)
+            crossed = offset + step
+            if crossed > HALF_TILE_UNITS or (crossed == HALF_TILE_UNITS and dx + dy > 0):
+                events |= TILE_ENTERED
+                # Wrap around screen edges
+                if fx < 0:
+                    fx += maze.width * TILE_UNITS
+                elif fx >= maze.width * TILE_UNITS:
+                    fx -= maze.width * TILE_UNITS
+        
+        # Publish the position to the store (bypassing the properties, which mean a teleport)
+        if fx != self.fx:
+            self.fx = fx
+            self.store.x[self.slot] = fx / SUBPIXELS
+        if fy != self.fy:
+            self.fy = fy
+            self.store.y[self.slot] = fy / SUBPIXELS
+        return events
     
-    def move_down(self, maze, grid_x, grid_y, center_x):
-        """Move entity down"""
-        next_y = grid_y + 1
-        # For ghosts, use for_ghost=True to prevent quantum tunneling
-        is_ghost = isinstance(self, Ghost)
-        if maze.is_valid_position(grid_x, next_y, for_ghost=is_ghost):
-            # Can move freely
-            self.y += self.speed
-            self.x = center_x
-        else:
-            # Only Pacman can try quantum tunneling
-            if not is_ghost and maze.try_quantum_tunneling(grid_x, next_y):
-                # Wall disappeared, can move now
-                self.y += self.speed
-                self.x = center_x
-            else:
-                # Wall is solid, clamp to current tile center
-                target_y = grid_y * TILE_SIZE + TILE_SIZE // 2
-                if self.y < target_y:
-                    self.y = min(self.y + self.speed, target_y)
-                    self.x = center_x
+    @abstractmethod
+    def at_center(self, maze, tile_x, tile_y):
+        """
+        Turn at a tile center and check the tile ahead.
+        Returns:
+            Event flags: BLOCKED if the entity must stop here
+        """
 
 
 class Pacman(Entity):
     """Pacman player character"""
+    __slots__ = ("start_x", "start_y", "lives", "mouth_open", "mouth_direction")
     
-    def __init__(self, x, y):
-        super().__init__(x, y, PACMAN_SPEED)
+    def __init__(self, x, y, store=None):
+        super().__init__(x, y, PACMAN_SPEED, store)
+        self.start_x = x
+        self.start_y = y
         self.lives = 3
         self.mouth_open = 0
         self.mouth_direction = 1
         
     def update(self, maze):
-        """Update Pacman position and animation"""
+        """
+        Update Pacman position and animation.
+        Returns:
+            This tick's movement events (see Entity.advance)
+        """
         # Update mouth animation
         self.mouth_open += self.mouth_direction * 0.2
         if self.mouth_open >= 1:
@@ -133,38 +206,23 @@ class Pacman(Entity):
         elif self.mouth_open <= 0:
             self.mouth_direction = 1
         
-        grid_x, grid_y = self.get_grid_pos()
-        center_x = grid_x * TILE_SIZE + TILE_SIZE // 2
-        center_y = grid_y * TILE_SIZE + TILE_SIZE // 2
-        
-        # Check if we're aligned with grid center
-        aligned_x = abs(self.x - center_x) < 1
-        aligned_y = abs(self.y - center_y) < 1
-        
-        # Try to change direction if requested and at intersection
-        if self.next_direction != NONE and aligned_x and aligned_y:
-            next_grid_x = grid_x + self.next_direction[0]
-            next_grid_y = grid_y + self.next_direction[1]
-            
-            if maze.is_valid_position(next_grid_x, next_grid_y, for_ghost=False):
+        return self.advance(maze)
+    
+    def at_center(self, maze, tile_x, tile_y):
+        """Take a requested turn if it's open, then try the tile ahead (tunneling into walls)"""
+        if self.next_direction != NONE:
+            turn_x, turn_y = self.next_direction
+            if maze.is_valid_position(tile_x + turn_x, tile_y + turn_y, for_ghost=False):
                 self.direction = self.next_direction
             self.next_direction = NONE
         
-        # Try to move in current direction
-        if self.direction == LEFT:
-            self.move_left(maze, grid_x, grid_y, center_y)
-        elif self.direction == RIGHT:
-            self.move_right(maze, grid_x, grid_y, center_y)
-        elif self.direction == UP:
-            self.move_up(maze, grid_x, grid_y, center_x)
-        elif self.direction == DOWN:
-            self.move_down(maze, grid_x, grid_y, center_x)
-        
-        # Wrap around screen edges
-        if self.x < 0:
-            self.x = maze.width * TILE_SIZE
-        elif self.x > maze.width * TILE_SIZE:
-            self.x = 0
+        dx, dy = self.direction
+        if maze.is_valid_position(tile_x + dx, tile_y + dy, for_ghost=False):
+            return 0
+        # Wall ahead: measure it (a locked wall keeps its earlier result)
+        if maze.try_quantum_tunneling(tile_x + dx, tile_y + dy):
+            return MEASURED
+        return MEASURED | BLOCKED
     
     def set_next_direction(self, direction):
         """Set the next direction to move"""
@@ -172,17 +230,23 @@ class Pacman(Entity):
     
     def reset_position(self):
         """Reset to starting position"""
-        self.x = 14 * TILE_SIZE + TILE_SIZE // 2
-        self.y = 23 * TILE_SIZE + TILE_SIZE // 2
+        self.x = self.start_x
+        self.y = self.start_y
         self.direction = NONE
         self.next_direction = NONE
 
 
 class Ghost(Entity):
     """Ghost enemy character"""
+    __slots__ = ("rng", "color", "name", "scatter_target", "start_x", "start_y", "target",
+                 "decision_delay", "entangled_with")
+    mode = column("mode")
+    frightened_timer = column("frightened_timer")
+    decision_timer = column("decision_timer")
     
-    def __init__(self, x, y, color, name, scatter_target):
-        super().__init__(x, y, GHOST_SPEED)
+    def __init__(self, x, y, color, name, scatter_target, rng=random, store=None):
+        super().__init__(x, y, GHOST_SPEED, store)
+        self.rng = rng  # Source of randomness (the game's seeded RNG)
         self.color = color
         self.name = name
         self.scatter_target = scatter_target
@@ -191,66 +255,88 @@ class Ghost(Entity):
         self.start_x = x
         self.start_y = y
         self.target = (0, 0)
-        self.decision_timer = 0  # Timer for pathfinding decisions (in frames)
-        self.decision_delay = 3  # 0.5 seconds at 60 FPS
+        self.decision_timer = 0  # Timer for pathfinding decisions (in ticks)
+        self.decision_delay = 3  # Ticks between pathfinding decisions
         self.entangled_with = None  # Reference to entangled ghost
         
     def update(self, maze, pacman, ghosts):
-        """Update ghost position and behavior"""
+        """Update ghost position and behavior, deciding immediately when due"""
+        self.plan(maze, pacman, ghosts)
+        self.move(maze)
+    
+    def plan(self, maze, pacman, ghosts, scheduler=None):
+        """
+        Update mode, and make a pathfinding decision (with a fresh target) when
+        one is due and this tick reaches a tile center.
+        Args:
+            maze: The maze object
+            pacman: Pacman, the pathfinding goal
+            ghosts: all ghosts (for personality targeting)
+            scheduler: if given, decisions are queued with this AIScheduler
+                instead of being made here
+        """
         # Update frightened mode timer
         if self.mode == FRIGHTENED:
             self.frightened_timer -= 1
             if self.frightened_timer <= 0:
                 self.mode = SCATTER
         
-        # Choose target based on mode
+        # Decisions are only taken at tile centers, and the timer counts centers reached
+        if not self.reaches_center():
+            return
+        self.decision_timer -= 1
+        if scheduler is not None:
+            # Ask for a decision when due (or sooner if a re-plan is urgent)
+            if self.decision_timer <= 0 or scheduler.is_urgent(self):
+                self._update_target(maze, pacman, ghosts)
+                scheduler.request(self, self.get_grid_pos())
+        elif self.decision_timer <= 0:
+            # Make a new decision now
+            self._update_target(maze, pacman, ghosts)
+            self.decide(maze, self.get_grid_pos(), pacman.get_grid_pos())
+    
+    def _update_target(self, maze, pacman, ghosts):
+        """Choose target based on mode"""
         if self.mode == FRIGHTENED:
             self.target = self._get_random_target(maze)
         elif self.mode == CHASE:
             self.target = self._get_chase_target(pacman, ghosts)
         else:  # SCATTER
             self.target = self.scatter_target
+    
+    def decide(self, maze, grid_pos, pacman_grid, max_expansions=BFS_MAX_EXPANSIONS):
+        """
+        Use pathfinding to pick the direction to take at this tile center and reset the decision timer.
+        Returns the number of tiles the search expanded.
+        """
+        t = profiler.start()
+        best_direction, expansions = choose_direction(maze, grid_pos, pacman_grid, self.direction, max_expansions)
+        profiler.stop("ghost.pathfinding", t)
         
-        grid_x, grid_y = self.get_grid_pos()
-        center_x = grid_x * TILE_SIZE + TILE_SIZE // 2
-        center_y = grid_y * TILE_SIZE + TILE_SIZE // 2
-        
-        speed = FRIGHTENED_SPEED if self.mode == FRIGHTENED else self.speed
-        
-        # Check if we're at the center of a tile
-        at_center = abs(self.x - center_x) <= speed and abs(self.y - center_y) <= speed
-        
-        if at_center:
-            # Decrement decision timer
-            self.decision_timer -= 1
-            
-            # Make a new decision if timer expired
-            if self.decision_timer <= 0:
-                # Use pathfinding to chase Pacman
-                pacman_grid = pacman.get_grid_pos()
-                best_direction = get_best_direction(maze, (grid_x, grid_y), pacman_grid, self.direction)
-                
-                if best_direction:
-                    self.direction = best_direction
-                
-                # Reset timer
-                self.decision_timer = self.decision_delay
-        
-        # Move in current direction using inherited movement methods
-        if self.direction == LEFT:
-            self.move_left(maze, grid_x, grid_y, center_y)
-        elif self.direction == RIGHT:
-            self.move_right(maze, grid_x, grid_y, center_y)
-        elif self.direction == UP:
-            self.move_up(maze, grid_x, grid_y, center_x)
-        elif self.direction == DOWN:
-            self.move_down(maze, grid_x, grid_y, center_x)
+        if best_direction:
+            self.next_direction = best_direction
         
-        # Wrap around screen edges
-        if self.x < 0:
-            self.x = maze.width * TILE_SIZE
-        elif self.x > maze.width * TILE_SIZE:
-            self.x = 0
+        # Reset timer
+        self.decision_timer = self.decision_delay
+        return expansions
+    
+    def move(self, maze):
+        """
+        Move one tick in the current direction.
+        Returns:
+            This tick's movement events (see Entity.advance)
+        """
+        return self.advance(maze)
+    
+    def at_center(self, maze, tile_x, tile_y):
+        """Take the direction decided for this center, then check the tile ahead"""
+        if self.next_direction != NONE:
+            self.direction = self.next_direction
+            self.next_direction = NONE
+        dx, dy = self.direction
+        if maze.is_valid_position(tile_x + dx, tile_y + dy, for_ghost=True):
+            return 0
+        return BLOCKED
     
     def _choose_direction(self, maze, grid_x, grid_y):
         """Choose best direction towards target"""
@@ -318,15 +404,16 @@ class Ghost(Entity):
         
     def _get_random_target(self, maze):
         """Get random valid target for frightened mode"""
-        return (random.randint(0, maze.width - 1), random.randint(0, maze.height - 1))
+        return (self.rng.randint(0, maze.width - 1), self.rng.randint(0, maze.height - 1))
     
     def set_frightened(self, duration):
         """Set ghost to frightened mode"""
         if self.mode != FRIGHTENED:
             self.mode = FRIGHTENED
             self.frightened_timer = duration
-            # Reverse direction
+            # Reverse direction (dropping a turn decided for the old one)
             self.direction = (-self.direction[0], -self.direction[1])
+            self.next_direction = NONE
             # Clear any existing entanglement
             self.entangled_with = None
 
@@ -346,10 +433,12 @@ class Ghost(Entity):
         self.x = self.start_x
         self.y = self.start_y
         self.direction = UP
+        self.next_direction = NONE
         self.mode = SCATTER
         self.frightened_timer = 0
     
     def collides_with(self, pacman):
-        """Check collision with Pacman"""
-        distance = math.sqrt((self.x - pacman.x)**2 + (self.y - pacman.y)**2)
-        return distance < TILE_SIZE * 0.8
+        """Check collision with Pacman (GameState checks all ghosts at once instead)"""
+        dx = self.x - pacman.x
+        dy = self.y - pacman.y
+        return dx * dx + dy * dy < COLLISION_RADIUS * COLLISION_RADIUS
@@ -0,0 +1,96 @@
+"""
+Struct-of-arrays storage for Pacman entities
+
+Positions, directions, speeds, modes and timers of every entity in a game
+live in contiguous NumPy arrays, one slot per entity. Pacman and Ghost
+objects are thin views that read and write their slot, so per-entity code
+keeps working while whole-game checks (collisions, render interpolation
+bookkeeping) run as single vectorized operations.
+"""
+import numpy as np
+from constants import *
+import kernels
+
+# Directions are stored as an index into this list
+DIRECTIONS = [NONE, UP, DOWN, LEFT, RIGHT]
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+
+# name -> dtype of every per-entity column
+COLUMNS = {
+    "x": np.float64,
+    "y": np.float64,
+    "prev_x": np.float64,
+    "prev_y": np.float64,
+    "speed": np.float64,
+    "direction": np.int8,  # Index into DIRECTIONS
+    "next_direction": np.int8,
+    "mode": np.int8,
+    "frightened_timer": np.int32,
+    "decision_timer": np.int32,
+}
+INITIAL_CAPACITY = 8
+
+
+class EntityStore:
+    """Contiguous per-entity state, grown by doubling"""
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.count = 0
+        self.capacity = capacity
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def allocate(self):
+        """Reserve a slot for a new entity and return its index"""
+        if self.count == self.capacity:
+            self.capacity *= 2
+            for name in COLUMNS:
+                column = getattr(self, name)
+                grown = np.zeros(self.capacity, dtype=column.dtype)
+                grown[:self.count] = column
+                setattr(self, name, grown)
+        self.count += 1
+        return self.count - 1
+
+    def save_previous(self):
+        """Record every entity's position as the start of the next tick"""
+        self.prev_x[:self.count] = self.x[:self.count]
+        self.prev_y[:self.count] = self.y[:self.count]
+
+    def within(self, slot, slots, radius):
+        """
+        Check which entities are near another one.
+        Args:
+            slot: the entity to measure from
+            slots: index array of the entities to check
+            radius: distance in pixels (exclusive)
+        Returns:
+            A boolean array, one entry per index in `slots`
+        """
+        if kernels.ENABLED:
+            return kernels.within_radius(self.x, self.y, slot, np.asarray(slots, dtype=np.intp), radius)
+        dx = self.x[slots] - self.x[slot]
+        dy = self.y[slots] - self.y[slot]
+        return dx * dx + dy * dy < radius * radius
+
+
+def column(name):
+    """Property reading and writing one column of the entity's slot"""
+    def get(self):
+        return getattr(self.store, name).item(self.slot)
+
+    def set(self, value):
+        getattr(self.store, name)[self.slot] = value
+
+    return property(get, set)
+
+
+def direction_column(name):
+    """Property storing a direction tuple as its DIRECTIONS index"""
+    def get(self):
+        return DIRECTIONS[getattr(self.store, name).item(self.slot)]
+
+    def set(self, value):
+        getattr(self.store, name)[self.slot] = DIRECTION_INDEX[value]
+
+    return property(get, set)
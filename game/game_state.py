@@ -1,18 +1,60 @@
 """
 Game state management for Pacman
 """
+import random
 import pygame
 from constants import *
-from entities import Pacman, Ghost
-from maze import Maze
+from entities import Pacman, Ghost, TileEvents
+from ai_scheduler import AIScheduler
+from entity_store import EntityStore
+from spatial_hash import SpatialHash
+from maze import Maze, layout_seed, fluctuation_seed
+from chunks import ChunkedMaze
+from profiler import profiler
+from quantum_backend import AER, STATEVECTOR, noisy_backend
+import snapshot
+
+# Backend for a game's first layout: the NumPy statevector needs no Qiskit,
+# so the game can start while Aer warms up (see quantum_backend.prewarm)
+FIRST_LAYOUT_BACKEND = STATEVECTOR
+# Backend for wall fluctuations: a region's walk then costs microseconds instead of an Aer job
+FLUCTUATION_BACKEND = STATEVECTOR
 
 class GameState:
     """Manages the overall game state"""
     
-    def __init__(self):
-        self.maze = Maze()
-        self.pacman = Pacman(14 * TILE_SIZE + TILE_SIZE // 2, 23 * TILE_SIZE + TILE_SIZE // 2)
-        self.ghosts = self._create_ghosts()
+    def __init__(self, width=MAZE_WIDTH, height=MAZE_HEIGHT, seed=None, layout_source=None, ghost_count=GHOST_COUNT,
+                 cell_block=None, noise_profile=None, executor=None, endless=False, spill_dir=None):
+        if cell_block is not None and noise_profile is not None:
+            # Noise tables are precomputed for the 32-position walk; a per-cell register is far too wide to simulate noisily
+            raise ValueError("cell_block can't be combined with a noise profile")
+        # All gameplay randomness (ghost targets, entanglement pairing) uses this
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.rng = random.Random(self.seed)
+        # Every layout's walk seed is derived from the game seed and a counter,
+        # so a seed reproduces every layout and upcoming ones can be pre-generated
+        self.layout_index = 0
+        self.layout_source = layout_source
+        self.maze_width = width
+        self.maze_height = height
+        self.ghost_count = ghost_count
+        # Per-cell walk block size for layouts (see maze.generate_layout; None = 32 positions)
+        self.cell_block = cell_block
+        # Noisy-device emulation (see noise.py): every walk and tunneling
+        # measurement then comes from the profile's precomputed tables
+        self.noise_profile = noise_profile
+        self.walk_backend = noisy_backend(noise_profile) if noise_profile else AER
+        # Optional QuantumExecutor: Aer jobs then never block a tick past their deadline
+        self.executor = executor
+        # Set while replaying a command whose layout missed the walk deadline (see replay.apply_commands)
+        self.walk_fallback = False
+        # Endless mode streams an unbounded maze in chunks instead (see chunks.py; width and height are unused)
+        self.endless = endless
+        self.spill_dir = spill_dir
+        self.maze = self._create_maze(noisy_backend(noise_profile) if noise_profile else FIRST_LAYOUT_BACKEND)
+        # Ghost decisions are queued here and served within a per-tick budget
+        self.ai = AIScheduler()
+        self._create_entities()
         self.score = 0
         self.level = 1
         self.game_over = False
@@ -20,73 +62,138 @@ class GameState:
         self.paused = False
         self.frightened_timer = 0
         self.death_reason = None  # "ghost" or "wall"
+        self.tick = 0  # Simulation ticks elapsed (game time)
+        self.fluctuation_timer = FLUCTUATION_PERIOD * TICK_RATE
+        # Work that only changes when Pacman enters a tile or measures a wall subscribes
+        # to his movement events: pellets and chunk streaming as soon as he moves,
+        # measurement locks and the trap check once the tick's collisions are settled
+        self.pacman_moved = TileEvents()
+        self.pacman_moved.subscribe(TILE_ENTERED, self._collect_pellet)
+        if endless:
+            self.pacman_moved.subscribe(TILE_ENTERED, self._stream_chunks)
+        self.pacman_settled = TileEvents()
+        self.pacman_settled.subscribe(TILE_ENTERED | MEASURED, self._update_quantum_state)
         
+    def _next_layout_seed(self):
+        """Get the seed for the next layout and queue the ones after it"""
+        seed = layout_seed(self.seed, self.layout_index)
+        self.layout_index += 1
+        if self.layout_source is not None:
+            upcoming = [layout_seed(self.seed, i) for i in range(self.layout_index, self.layout_index + self.layout_source.depth)]
+            self.layout_source.prefetch(self.maze_width, self.maze_height, upcoming)
+        return seed
+    
+    def _create_maze(self, walk_backend):
+        """Create the next game's maze from the next layout seed"""
+        if self.endless:
+            # Chunks stay on the statevector like fluctuations: a chunk then costs well under a millisecond
+            return ChunkedMaze(self._next_layout_seed(),
+                               walk_backend=self.walk_backend if self.noise_profile else FLUCTUATION_BACKEND,
+                               noise_profile=self.noise_profile, executor=self.executor, spill_dir=self.spill_dir,
+                               rng=self.rng)
+        return Maze(self.maze_width, self.maze_height, seed=self._next_layout_seed(), layout_source=self.layout_source,
+                    walk_backend=walk_backend, cell_block=self.cell_block, noise_profile=self.noise_profile,
+                    executor=self.executor, rng=self.rng, walk_fallback=self.walk_fallback)
+    
+    def _create_entities(self):
+        """Create Pacman and the ghosts in a fresh entity store"""
+        self.entities = EntityStore()
+        self.pacman = Pacman(*self.maze.tile_center(*self.maze.pacman_start), store=self.entities)
+        self.ghosts = self._create_ghosts()
+        # Ghost for each store slot (None for Pacman), and a spatial index over the ghosts
+        self.slot_ghosts = [None] * self.entities.count
+        for ghost in self.ghosts:
+            self.slot_ghosts[ghost.slot] = ghost
+        self.spatial = SpatialHash(self.entities, [ghost.slot for ghost in self.ghosts])
+        self.ai.reset(self.ghosts)
+    
     def _create_ghosts(self):
-        """Create the four ghosts with different personalities"""
-        return [
-            Ghost(13 * TILE_SIZE + TILE_SIZE // 2, 14 * TILE_SIZE + TILE_SIZE // 2, RED, "Blinky", (25, 0)),
-            Ghost(14 * TILE_SIZE + TILE_SIZE // 2, 14 * TILE_SIZE + TILE_SIZE // 2, PINK, "Pinky", (2, 0)),
-            Ghost(13 * TILE_SIZE + TILE_SIZE // 2, 15 * TILE_SIZE + TILE_SIZE // 2, CYAN, "Inky", (27, 29)),
-            Ghost(14 * TILE_SIZE + TILE_SIZE // 2, 15 * TILE_SIZE + TILE_SIZE // 2, ORANGE, "Clyde", (0, 29)),
-        ]
+        """Create the ghosts, cycling through the four personalities, start tiles and scatter corners"""
+        personalities = [(RED, "Blinky"), (PINK, "Pinky"), (CYAN, "Inky"), (ORANGE, "Clyde")]
+        ghosts = []
+        for i in range(self.ghost_count):
+            color, name = personalities[i % 4]
+            start = self.maze.ghost_starts[i % len(self.maze.ghost_starts)]
+            scatter_target = self.maze.scatter_targets[i % len(self.maze.scatter_targets)]
+            ghosts.append(Ghost(*self.maze.tile_center(*start), color, name, scatter_target, self.rng,
+                                store=self.entities))
+        return ghosts
+    
+    def ghosts_near(self, tile_x, tile_y, radius=1):
+        """Get the ghosts that may be within `radius` tiles of a tile, in creation order"""
+        self.spatial.sync()
+        return [self.slot_ghosts[slot] for slot in self.spatial.near(tile_x, tile_y, radius)]
+    
+    def ghosts_in_rect(self, x0, y0, x1, y1):
+        """Get the ghosts that may be inside a tile rectangle (x1, y1 exclusive), in creation order"""
+        self.spatial.sync()
+        return [self.slot_ghosts[slot] for slot in self.spatial.in_rect(x0, y0, x1, y1)]
     
     def update(self):
-        """Update game state"""
+        """Advance the game by one fixed simulation tick"""
+        # Remember where entities were so the renderer can interpolate
+        self.entities.save_previous()
+        
         if self.game_over or self.paused or self.won:
             return
         
-        # Update Pacman
-        self.pacman.update(self.maze)
+        self.tick += 1
         
-        # Check pellet collection
-        score_gained = self.maze.eat_pellet(self.pacman.x, self.pacman.y)
-        if score_gained == POWER_PELLET_SCORE:
-            # Power pellet eaten, frighten ghosts
-            self.frightened_timer = POWER_PELLET_DURATION * FPS
-            # First clear any existing entanglements
-            for ghost in self.ghosts:
-                ghost.set_frightened(self.frightened_timer)
-            
-            # Randomly pair up ghosts for entanglement
-            import random
-            frightened_ghosts = [g for g in self.ghosts if g.mode == FRIGHTENED and not g.entangled_with]
-            if len(frightened_ghosts) >= 2:
-                # Shuffle the list
-                random.shuffle(frightened_ghosts)
-                # Pair up ghosts
-                for i in range(0, len(frightened_ghosts) - 1, 2):
-                    frightened_ghosts[i].entangle_with(frightened_ghosts[i + 1])
+        # Quantum fluctuation on the game clock, so it pauses with the game:
+        # a few regions away from Pacman are regenerated
+        self.fluctuation_timer -= 1
+        if self.fluctuation_timer <= 0:
+            t = profiler.start()
+            self.maze.fluctuate(fluctuation_seed(self.seed, self.layout_index, self.tick),
+                                self.pacman.get_grid_pos(),
+                                self.walk_backend if self.noise_profile else FLUCTUATION_BACKEND)
+            profiler.stop("maze.fluctuation", t)
+            self.fluctuation_timer = FLUCTUATION_PERIOD * TICK_RATE
         
-        self.score += score_gained
+        # Update Pacman
+        t = profiler.start()
+        events = self.pacman.update(self.maze)
+        profiler.stop("pacman.update", t)
+        self.pacman_moved.notify(self.pacman, events)
         
         # Update frightened timer
         if self.frightened_timer > 0:
             self.frightened_timer -= 1
 
-        # Check if any ghost was eaten
-        ate = False
-
-        # Update ghosts
+        # Update ghosts: plan (queueing decisions), serve decisions within the budget, then move
+        t = profiler.start()
+        self.ai.observe(self)
         for ghost in self.ghosts:
-            ghost.update(self.maze, self.pacman, self.ghosts)
-            
-            # Check collision with Pacman
-            if ghost.collides_with(self.pacman):
-                if ghost.mode == FRIGHTENED:
-                    ate = True
-                else:
-                    # Pacman dies
-                    self.pacman.lives -= 1
-                    if self.pacman.lives <= 0:
-                        self.game_over = True
-                        self.death_reason = "ghost"
-                    else:
-                        self._reset_positions()
+            ghost.plan(self.maze, self.pacman, self.ghosts, self.ai)
+        self.ai.run(self.maze, self.pacman.get_grid_pos())
+        for ghost in self.ghosts:
+            ghost.move(self.maze)
+        if self.endless:
+            self._leash_ghosts()
+        profiler.stop("ghost.update", t)
         
-        # Handle ghost eating
-        if ate:
-            eaten_ghosts = [g for g in self.ghosts if g.collides_with(self.pacman)]
-            for ghost in eaten_ghosts:
+        # Check the ghosts near Pacman in one vectorized test; the result is reused below
+        t = profiler.start()
+        colliding = []
+        nearby = self.ghosts_near(*self.pacman.get_grid_pos())
+        if nearby:
+            hits = self.entities.within(self.pacman.slot, [ghost.slot for ghost in nearby], COLLISION_RADIUS)
+            colliding = [ghost for ghost, hit in zip(nearby, hits.tolist()) if hit]
+        profiler.stop("collision", t)
+        
+        if any(ghost.mode != FRIGHTENED for ghost in colliding):
+            # Pacman dies
+            self.pacman.lives -= 1
+            if self.pacman.lives <= 0:
+                self.game_over = True
+                self.death_reason = "ghost"
+            else:
+                self._reset_positions()
+        else:
+            # Handle ghost eating
+            for ghost in colliding:
+                if ghost.mode != FRIGHTENED:
+                    continue  # Already reset as an eaten ghost's entangled partner
                 # If ghost is entangled, eat its partner too
                 if ghost.entangled_with:
                     entangled_partner = ghost.entangled_with
@@ -104,17 +211,59 @@ class GameState:
         if self.maze.all_pellets_eaten():
             self.won = True
         
+        # A respawn is a tile entry too, reported with the next move (see Entity.advance)
+        self.pacman_settled.notify(self.pacman, events)
+    
+    def _collect_pellet(self, pacman, events):
+        """Eat the pellet on the tile Pacman just entered (only a new tile can hold one)"""
+        score_gained = self.maze.eat_pellet(pacman.x, pacman.y)
+        if score_gained == POWER_PELLET_SCORE:
+            # Power pellet eaten, frighten ghosts
+            self.frightened_timer = POWER_PELLET_DURATION * TICK_RATE
+            # First clear any existing entanglements
+            for ghost in self.ghosts:
+                ghost.set_frightened(self.frightened_timer)
+            
+            # Randomly pair up ghosts for entanglement
+            frightened_ghosts = [g for g in self.ghosts if g.mode == FRIGHTENED and not g.entangled_with]
+            if len(frightened_ghosts) >= 2:
+                # Shuffle the list
+                self.rng.shuffle(frightened_ghosts)
+                # Pair up ghosts
+                for i in range(0, len(frightened_ghosts) - 1, 2):
+                    frightened_ghosts[i].entangle_with(frightened_ghosts[i + 1])
+        
+        self.score += score_gained
+    
+    def _stream_chunks(self, pacman, events):
+        """Endless mode: generate the chunks Pacman is heading for before they come into view"""
+        self.maze.stream(pacman.get_grid_pos(), pacman.direction)
+    
+    def _update_quantum_state(self, pacman, events):
+        """Release far measurement locks and check for a trap after Pacman entered a tile or measured a wall"""
         # Update quantum measurement locks based on Pacman's position
         # Walls far from Pacman return to superposition
-        self.maze.update_quantum_state(self.pacman.x, self.pacman.y)
+        t = profiler.start()
+        self.maze.update_quantum_state(pacman.x, pacman.y)
+        profiler.stop("maze.update_quantum_state", t)
         
         # Check if Pacman is trapped by quantum walls
         if not self.game_over:
-            pacman_grid_x = int(self.pacman.x // TILE_SIZE)
-            pacman_grid_y = int(self.pacman.y // TILE_SIZE)
-            if self.maze.entanglement.is_pacman_trapped(pacman_grid_x, pacman_grid_y):
+            t = profiler.start()
+            if self.maze.entanglement.is_pacman_trapped(*pacman.get_grid_pos()):
                 self.game_over = True
                 self.death_reason = "wall"
+            profiler.stop("trap_check", t)
+    
+    def _leash_ghosts(self):
+        """Endless mode: bring ghosts that fell far behind Pacman back near Pacman (see ChunkedMaze.leash)"""
+        pacman_tile = self.pacman.get_grid_pos()
+        for ghost in self.ghosts:
+            leashed = self.maze.leash(ghost.get_grid_pos(), pacman_tile)
+            if leashed is not None:
+                tile, ghost.direction = leashed
+                ghost.x, ghost.y = self.maze.tile_center(*tile)
+                ghost.next_direction = NONE
     
     def _reset_positions(self):
         """Reset entity positions after death"""
@@ -124,19 +273,25 @@ class GameState:
     
     def reset_game(self):
         """Reset game to initial state"""
-        self.maze = Maze()
-        self.pacman = Pacman(14 * TILE_SIZE, 23 * TILE_SIZE)
-        self.ghosts = self._create_ghosts()
+        if self.endless:
+            self.maze.close()
+        self.maze = self._create_maze(self.walk_backend)
+        self._create_entities()
         self.score = 0
         self.level = 1
         self.game_over = False
         self.won = False
         self.frightened_timer = 0
         self.death_reason = None
+        self.tick = 0
+        self.fluctuation_timer = FLUCTUATION_PERIOD * TICK_RATE
     
     def next_level(self):
         """Progress to next level"""
         self.level += 1
+        # Every level gets a fresh maze (instant when a LevelPool is attached)
+        self.maze.reset_all_walls(seed=self._next_layout_seed(), walk_backend=self.walk_backend,
+                                  walk_fallback=self.walk_fallback)
         self.maze.reset_pellets()
         self._reset_positions()
         self.won = False
@@ -156,6 +311,14 @@ class GameState:
         if keys[pygame.K_RIGHT]:
             self.pacman.set_next_direction(RIGHT)
     
+    def snapshot(self):
+        """Get a compact binary snapshot of the whole game (see snapshot.py)"""
+        return snapshot.take(self)
+    
+    def restore(self, data):
+        """Roll the game back to a snapshot taken with snapshot()"""
+        snapshot.restore(self, data)
+    
     def toggle_pause(self):
         """Toggle pause state"""
         self.paused = not self.paused
@@ -0,0 +1,274 @@
+"""
+Optional compiled kernels for Pacman's hottest loops
+
+When Numba is installed, the kernels below are compiled with @njit at import
+time and ENABLED is True; callers then hand them NumPy arrays instead of
+running their pure-Python reference implementations:
+    bfs_kernel        pathfinding.bfs_search_python (ghost pathfinding, through bfs_search)
+    flood_components  the flood fill in maze_library.connectivity_stats
+    within_radius     the NumPy distance test in EntityStore.within
+Without Numba (or with ENTANGLE_KERNELS=python) ENABLED is False and the
+references run, so results never depend on whether Numba is installed. The
+kernels are plain Python underneath, so `check` can compare them with the
+references either way.
+
+Searches run up to a few hundred times per tick, so bfs_search keeps its
+buffers between calls: queues sized by the expansion budget and a visited
+grid stamped with a per-search epoch, which never needs clearing.
+
+Layout generation is not here: generate_region is already whole-array NumPy.
+
+Usage:
+    python kernels.py check mazes.eml        # compare kernels and references on a maze library
+    python benchmark.py kernels mazes.eml    # time both paths
+"""
+import argparse
+import os
+import sys
+import threading
+import numpy as np
+from constants import COLLISION_RADIUS, TILE_SIZE, WALL
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+ENABLED = njit is not None and os.environ.get("ENTANGLE_KERNELS", "") != "python"
+# Direction order shared with pathfinding (index -> (dx, dy)); -1 is "no direction"
+STEP_X = (0, 0, -1, 1)
+STEP_Y = (-1, 1, 0, 0)
+EPOCH_LIMIT = 2 ** 31 - 1  # Searches before the visited stamps are cleared
+
+
+def kernel(fn):
+    """Compile a kernel when ENABLED; the plain function stays reachable as .py_func"""
+    if ENABLED:
+        return njit(cache=True, nogil=True)(fn)
+    fn.py_func = fn
+    return fn
+
+
+class SearchScratch:
+    """Buffers reused by every bfs_search on one thread"""
+
+    def __init__(self):
+        self.stamps = np.zeros((0, 0), dtype=np.int32)  # Epoch of the last search that visited each tile
+        self.epoch = EPOCH_LIMIT
+        self.queue = np.empty((3, 1), dtype=np.int64)  # x, y and first direction of queued tiles
+
+    def fit(self, shape, max_expansions):
+        """Make room for a search over a grid of this shape (only expanded tiles queue neighbours, four at most)"""
+        if self.stamps.shape != shape or self.epoch >= EPOCH_LIMIT:
+            self.stamps = np.zeros(shape, dtype=np.int32)
+            self.epoch = 0
+        queue_length = min(shape[0] * shape[1], 4 * max(max_expansions, 0)) + 1
+        if self.queue.shape[1] < queue_length:
+            self.queue = np.empty((3, queue_length), dtype=np.int64)
+
+
+_local = threading.local()
+
+
+def bfs_search(walls, start_x, start_y, target_x, target_y, max_expansions, search=None):
+    """
+    Bounded BFS over a wall grid, expanding tiles in the same order as pathfinding.bfs_search_python.
+    Args:
+        walls: (height, width) uint8 array, nonzero for walls
+        start_x, start_y: tile to search from
+        target_x, target_y: tile to reach
+        max_expansions: tiles to expand before heading for the closest one seen
+        search: kernel to run (default bfs_kernel; `check` passes its plain version)
+    Returns:
+        (index of the first direction in STEP_X/STEP_Y or -1, tiles expanded)
+    """
+    try:
+        scratch = _local.scratch
+    except AttributeError:
+        scratch = _local.scratch = SearchScratch()
+    queue = scratch.queue
+    if scratch.stamps.shape != walls.shape or scratch.epoch >= EPOCH_LIMIT \
+            or (queue.shape[1] <= 4 * max_expansions and queue.shape[1] <= walls.size):
+        scratch.fit(walls.shape, max_expansions)
+        queue = scratch.queue
+    scratch.epoch += 1
+    return (search or bfs_kernel)(walls, scratch.stamps, scratch.epoch, queue,
+                                  start_x, start_y, target_x, target_y, max_expansions)
+
+
+@kernel
+def bfs_kernel(walls, stamps, epoch, queue, start_x, start_y, target_x, target_y, max_expansions):
+    """
+    bfs_search on caller-owned buffers.
+    Args:
+        stamps: (height, width) int32 array; tiles equal to epoch count as visited
+        epoch: this search's stamp, not yet in stamps
+        queue: (3, n) int64 array with room for every tile the search can queue
+    """
+    height, width = walls.shape
+    queue_x = queue[0]
+    queue_y = queue[1]
+    queue_first = queue[2]
+
+    queue_x[0] = start_x
+    queue_y[0] = start_y
+    queue_first[0] = -1
+    if 0 <= start_x < width and 0 <= start_y < height:
+        stamps[start_y, start_x] = epoch
+    head = 0
+    tail = 1
+    best_dist = abs(start_x - target_x) + abs(start_y - target_y)
+    best_first = -1
+    expansions = 0
+
+    while head < tail:
+        x = queue_x[head]
+        y = queue_y[head]
+        first = queue_first[head]
+        head += 1
+        if x == target_x and y == target_y:
+            return first, expansions
+        dist = abs(x - target_x) + abs(y - target_y)
+        if dist < best_dist:
+            best_dist = dist
+            best_first = first
+        expansions += 1
+        if expansions > max_expansions:
+            return best_first, expansions
+        for d in range(4):
+            next_x = x + STEP_X[d]
+            next_y = y + STEP_Y[d]
+            if 0 <= next_x < width and 0 <= next_y < height \
+                    and stamps[next_y, next_x] != epoch and walls[next_y, next_x] == 0:
+                stamps[next_y, next_x] = epoch
+                queue_x[tail] = next_x
+                queue_y[tail] = next_y
+                queue_first[tail] = d if first < 0 else first
+                tail += 1
+    return -1, expansions
+
+
+@kernel
+def flood_components(open_tiles, start_x, start_y):
+    """
+    Count the 4-connected regions of open tiles (the border must be closed).
+    Args:
+        open_tiles: (height, width) boolean array
+        start_x, start_y: Pacman's start tile
+    Returns:
+        (components, size of the region holding the start tile or 0)
+    """
+    height, width = open_tiles.shape
+    unseen = open_tiles.copy()
+    queue_x = np.empty(height * width, dtype=np.int64)
+    queue_y = np.empty(height * width, dtype=np.int64)
+    components = 0
+    reachable = 0
+    for y in range(height):
+        for x in range(width):
+            if not unseen[y, x]:
+                continue
+            components += 1
+            unseen[y, x] = False
+            queue_x[0] = x
+            queue_y[0] = y
+            head = 0
+            tail = 1
+            contains_start = False
+            while head < tail:
+                cx = queue_x[head]
+                cy = queue_y[head]
+                head += 1
+                if cx == start_x and cy == start_y:
+                    contains_start = True
+                for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+                    if unseen[ny, nx]:
+                        unseen[ny, nx] = False
+                        queue_x[tail] = nx
+                        queue_y[tail] = ny
+                        tail += 1
+            if contains_start:
+                reachable = tail
+    return components, reachable
+
+
+@kernel
+def within_radius(xs, ys, slot, slots, radius):
+    """Check which of `slots` lie closer than radius to `slot` (see EntityStore.within)"""
+    hits = np.empty(len(slots), dtype=np.bool_)
+    x = xs[slot]
+    y = ys[slot]
+    limit = radius * radius
+    for i in range(len(slots)):
+        dx = xs[slots[i]] - x
+        dy = ys[slots[i]] - y
+        hits[i] = dx * dx + dy * dy < limit
+    return hits
+
+
+def _variants(fn):
+    """Get the versions of a kernel to check: compiled and plain when ENABLED, else plain"""
+    return (fn, fn.py_func) if ENABLED else (fn,)
+
+
+def _check_layout(grid, rng, searches):
+    """
+    Compare every kernel with its reference on one layout.
+    Returns the number of mismatches.
+    """
+    from maze import Maze, pacman_start
+    from maze_library import flood_components_python
+    from pathfinding import bfs_search_python
+
+    height, width = grid.shape
+    mismatches = 0
+
+    open_tiles = grid != WALL
+    start = pacman_start(width, height)
+    expected = flood_components_python(open_tiles, *start)
+    for variant in _variants(flood_components):
+        mismatches += tuple(variant(open_tiles, *start)) != expected
+
+    maze = Maze(width, height, layout=grid)
+    walls = maze.walls()
+    ys, xs = np.nonzero(open_tiles)
+    for _ in range(searches):
+        i, j = rng.integers(len(xs), size=2)
+        budget = int(rng.choice([16, 256, 4096]))
+        expected = bfs_search_python(maze, (int(xs[i]), int(ys[i])), (int(xs[j]), int(ys[j])), budget)
+        for variant in _variants(bfs_kernel):
+            index, expansions = bfs_search(walls, int(xs[i]), int(ys[i]), int(xs[j]), int(ys[j]), budget, variant)
+            direction = None if index < 0 else (STEP_X[index], STEP_Y[index])
+            mismatches += (direction, expansions) != expected
+
+    xs, ys = rng.uniform(0, width * TILE_SIZE, size=(2, 64))
+    slots = np.arange(1, 64)
+    dx = xs[slots] - xs[0]
+    dy = ys[slots] - ys[0]
+    expected = dx * dx + dy * dy < COLLISION_RADIUS * COLLISION_RADIUS
+    for variant in _variants(within_radius):
+        mismatches += not np.array_equal(variant(xs, ys, 0, slots, COLLISION_RADIUS), expected)
+    return mismatches
+
+
+def main():
+    """Compare the kernels with the pure-Python references"""
+    parser = argparse.ArgumentParser(description="EntangleMan compiled kernels")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("check", help="compare kernels and references on a maze library")
+    check.add_argument("path", help="maze library (see maze_library.py)")
+    check.add_argument("--searches", type=int, default=50, help="random searches per layout")
+    check.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from maze_library import MazeLibrary
+    library = MazeLibrary(args.path)
+    rng = np.random.default_rng(args.seed)
+    mismatches = sum(_check_layout(np.asarray(library.layout(i)), rng, args.searches) for i in range(len(library)))
+    mode = "compiled and plain kernels" if ENABLED else "plain kernels (Numba not enabled)"
+    print(f"{len(library)} layouts, {mode}: {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 """
 Main game loop for Pacman
 """
+import argparse
+import os
 import pygame
 import sys
 import maze
@@ -8,26 +10,118 @@ import time
 from constants import *
 from game_state import GameState
 from renderer import Renderer
+from profiler import profiler
+import replay
+from pregen import LevelPool
+from maze_library import MazeLibrary
+import quantum_backend
+from spectator import SpectatorServer
+from quantum_executor import QuantumExecutor
+import noise
+
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="EntangleMan")
+    parser.add_argument("--width", type=int, default=MAZE_WIDTH, help="maze width in tiles")
+    parser.add_argument("--height", type=int, default=MAZE_HEIGHT, help="maze height in tiles")
+    parser.add_argument("--ghosts", type=int, default=GHOST_COUNT, help="number of ghosts (swarm mode)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for a reproducible game")
+    parser.add_argument("--record", metavar="PATH", help="record the session to a replay file")
+    parser.add_argument("--pregen-workers", type=int, default=0,
+                        help="worker processes pre-generating upcoming mazes (0 = generate inline)")
+    parser.add_argument("--library", metavar="PATH",
+                        help="play layouts from a maze library (see maze_library.py)")
+    parser.add_argument("--spectate", metavar="PORT", type=int,
+                        help="stream the game to spectators on a TCP port (see spectator.py)")
+    parser.add_argument("--noise", metavar="PROFILE", choices=list(noise.NOISE_PROFILES),
+                        help="emulate a noisy device: " + ", ".join(noise.NOISE_PROFILES) + " (see noise.py)")
+    parser.add_argument("--endless", action="store_true",
+                        help="endless mode: the maze is streamed in chunks as Pacman travels (see chunks.py)")
+    parser.add_argument("--spill", metavar="DIR",
+                        help="with --endless, write changed chunks to this directory when they are evicted")
+    parser.add_argument("--profile", action="store_true",
+                        help="enable the frame profiler (F3: overlay, F4: dump to file)")
+    args = parser.parse_args()
+    if args.noise and args.record:
+        # Replay files don't store the noise profile, so later layouts would not replay
+        parser.error("--record can't be combined with --noise")
+    if args.endless and (args.record or args.library or args.spectate is not None or args.pregen_workers):
+        # Those all work on whole layouts, which an endless maze doesn't have
+        parser.error("--endless can't be combined with --record, --library, --spectate or --pregen-workers")
+    if args.spill and not args.endless:
+        parser.error("--spill needs --endless")
+    return args
 
 
 def main():
     """Main game function"""
+    args = parse_args()
+    if args.profile:
+        profiler.set_enabled(True)
+    if args.noise:
+        # Simulating a profile's tables takes a while the first time; later runs load the cache
+        if not os.path.exists(noise.cache_path(args.noise)):
+            print(f"Precomputing {args.noise} noise tables (cached in {noise.cache_path(args.noise)})...")
+        noise.tables(args.noise)
+    library = None
+    if args.library:
+        library = MazeLibrary(args.library)
+        args.width, args.height = library.width, library.height
+        if args.seed is None:
+            # Default to the game the library was generated for, so every layout is a hit
+            args.seed = library.params.get("game_seed")
+    
     # Initialize Pygame
     pygame.init()
-    last_time = time.time()
-    # Create screen
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    # Create screen (larger mazes scroll inside a window of the default size)
+    screen = pygame.display.set_mode((min(SCREEN_WIDTH, args.width * TILE_SIZE),
+                                      min(SCREEN_HEIGHT, args.height * TILE_SIZE)))
     pygame.display.set_caption("Pacman")
+    # Import Qiskit and warm up Aer in the background while the first frames render
+    quantum_backend.prewarm(maze.WALK_STEPS)
     
     # Create game objects
     clock = pygame.time.Clock()
-    game_state = GameState()
+    level_pool = LevelPool(workers=args.pregen_workers) if args.pregen_workers > 0 else None
+    layout_source = library if library is not None else level_pool
+    # Simulator jobs run in the background, so a slow one can never freeze the game
+    executor = QuantumExecutor()
+    game_state = GameState(args.width, args.height, seed=args.seed, layout_source=layout_source,
+                           ghost_count=args.ghosts, noise_profile=args.noise, executor=executor,
+                           endless=args.endless, spill_dir=args.spill)
     renderer = Renderer(screen)
+    recorder = replay.Recorder(args.record, game_state) if args.record else None
+    spectators = None
+    if args.spectate is not None:
+        spectators = SpectatorServer(port=args.spectate)
+        spectators.start_in_thread()
+        print(f"Spectators can watch on port {spectators.port}")
+    
+    def run_command(command):
+        """Apply a command now and log it for the next recorded tick"""
+        layout_index = game_state.layout_index
+        replay.apply_commands(game_state, command)
+        if game_state.layout_index != layout_index and game_state.maze.layout_fell_back:
+            command |= replay.COMMAND_WALK_FALLBACK  # So the replay generates this level's layout the same way
+        if recorder:
+            recorder.note_command(command)
+    
+    # Fixed-timestep loop: the simulation advances in constant ticks while
+    # rendering runs as often as the display allows
+    tick_seconds = 1.0 / TICK_RATE
+    accumulator = 0.0
+    previous_time = time.perf_counter()
     
     # Game loop
     running = True
     while running:
+        current_time = time.perf_counter()
+        accumulator += current_time - previous_time
+        previous_time = current_time
+        
         # Handle events
+        t = profiler.start()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
@@ -35,33 +129,53 @@ def main():
                 if event.key == pygame.K_ESCAPE:
                     running = False
                 elif event.key == pygame.K_p:
-                    game_state.toggle_pause()
+                    run_command(replay.COMMAND_PAUSE)
                 elif event.key == pygame.K_r and game_state.game_over:
-                    game_state.reset_game()
+                    run_command(replay.COMMAND_RESET)
                 elif event.key == pygame.K_SPACE and game_state.won:
-                    game_state.next_level()
+                    run_command(replay.COMMAND_NEXT_LEVEL)
+                elif event.key == pygame.K_F3:
+                    profiler.toggle_overlay()
+                elif event.key == pygame.K_F4 and profiler.enabled:
+                    print(f"Profile written to {profiler.dump()}")
         
         # Handle continuous input
         keys = pygame.key.get_pressed()
         game_state.handle_input(keys)
+        profiler.stop("input", t)
         
-
-        # Update wall
-        cur_time = time.time()
-        if cur_time - last_time > 5:
-            game_state.maze.reset_all_walls()
-            last_time = cur_time
-        
-        # Update game state
-        game_state.update()
+        # Update game state in fixed ticks, capping catch-up after a slow frame
+        steps = 0
+        while accumulator >= tick_seconds and steps < MAX_CATCHUP_TICKS:
+            if recorder:
+                recorder.step(game_state)
+            else:
+                game_state.update()
+            if spectators:
+                spectators.publish(game_state)
+            accumulator -= tick_seconds
+            steps += 1
+        if steps == MAX_CATCHUP_TICKS:
+            # Too far behind - drop the backlog instead of spiralling
+            accumulator = min(accumulator, tick_seconds)
         
-        # Render
-        renderer.render(game_state)
+        # Render, interpolating entities between the last two ticks
+        renderer.render(game_state, accumulator / tick_seconds)
         
         # Control frame rate
         clock.tick(FPS)
     
     # Cleanup
+    if recorder:
+        recorder.close()
+    if level_pool:
+        print(f"Level pool: {level_pool.stats()}")
+        level_pool.close()
+    if args.endless:
+        print(f"Chunks: {game_state.maze.stats}")
+        game_state.maze.close()
+    print(f"Quantum jobs: {executor.stats()}")
+    executor.close()
     pygame.quit()
     sys.exit()
 
@@ -1,165 +1,376 @@
 """
 Maze generation and management for Pacman
 """
+import hashlib
+import random
+import struct
 import numpy as np
-from qiskit import QuantumCircuit, transpile
-from qiskit_aer import AerSimulator
 from constants import *
+from quantum_backend import (AER, STATEVECTOR, WALK_QUBITS, WALK_ROTATION, quantum_walk_backend,
+                             register_probabilities, walk_batch)
+from quantum_executor import WALK, FallbackExecutor
+
+# Layout generator parameters
+WALK_STEPS = 8  # Quantum walk steps per layout
+WALK_SHOTS = 1000  # Simulator shots used to estimate the walk distribution
+PATH_THRESHOLD = 0.02  # Walk probability above which an inner tile becomes a path
+REGION_WALK_SHOTS = 100  # Shots per fluctuating region: the noisier estimate makes walls visibly change
+CELL_SHOTS = 32  # Per-cell walks: shots per register state (fewer = layouts vary more between seeds)
+
+
+def maze_center(width, height):
+    """Get the ghost house center tile for a maze size"""
+    return width // 2, height // 2
+
+
+def pacman_start(width, height):
+    """Get Pacman's starting tile for a maze size"""
+    return width // 2, height * 3 // 4
+
+
+def layout_seed(game_seed, index):
+    """
+    Get the walk seed for a game's index-th layout.
+    Seeds depend only on (game seed, index), so upcoming layouts can be
+    generated ahead of time and still match a replay.
+    """
+    digest = hashlib.blake2b(struct.pack("<QQ", game_seed, index), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def fluctuation_seed(game_seed, layout_index, tick):
+    """Get the seed for the wall fluctuation at a tick (layouts generated so far tell games apart)"""
+    digest = hashlib.blake2b(struct.pack("<QQQ", game_seed, layout_index, tick), digest_size=4,
+                             person=b"fluctuation").digest()
+    return int.from_bytes(digest, "little")
+
+
+def quantum_walk(steps=10, seed=None, backend=AER, shots=WALK_SHOTS):
+    """
+    Perform a quantum walk to generate probability distribution.
+    Returns a probability distribution over positions.
+    A seed fixes the simulator's sampling so the result is reproducible.
+    The backend (see quantum_backend.py) chooses Aer or an exact NumPy
+    statevector; Qiskit is only imported when Aer is used.
+    """
+    return quantum_walk_backend(backend)(steps, shots, seed)
+
+
+def cell_register(width, height, cell_block=1):
+    """
+    Get the register that gives every block of cell_block x cell_block tiles
+    its own basis state.
+    Returns:
+        (qubits, blocks per row)
+    """
+    blocks_x = -(-width // cell_block)
+    blocks_y = -(-height // cell_block)
+    return max(1, (blocks_x * blocks_y - 1).bit_length()), blocks_x
+
+
+def cell_paths(width, height, xs, ys, cell_block, seed=None, backend=AER):
+    """
+    Decide which tiles are paths from a per-cell walk.
+    Every block of tiles is a basis state of a register wide enough for the
+    whole maze, so no two blocks share a probability. A block's measurement
+    count is drawn from its exact probability (a binomial per block is the
+    marginal of sampling the whole register), so the cost scales with the
+    tiles asked for, not with the register.
+    Args:
+        width, height: maze size in tiles
+        xs, ys: tile coordinate arrays
+        cell_block: edge length in tiles of the blocks sharing a basis state
+        seed: seed for the measurement counts
+        backend: quantum walk backend (see quantum_backend.register_probabilities)
+    Returns:
+        Boolean array shaped like xs, True for paths
+    """
+    qubits, blocks_x = cell_register(width, height, cell_block)
+    probabilities = register_probabilities(WALK_STEPS, qubits, backend)
+    cells, inverse = np.unique((ys // cell_block) * blocks_x + xs // cell_block, return_inverse=True)
+    counts = np.random.default_rng(seed).binomial(CELL_SHOTS << qubits, probabilities[cells])
+    # The 5-qubit rule, relative to a uniform distribution: PATH_THRESHOLD is 0.64 / 32
+    return (counts > PATH_THRESHOLD * 2 ** WALK_QUBITS * CELL_SHOTS)[inverse].reshape(xs.shape)
+
+
+def generate_layout(width, height, seed=None, probs=None, backend=AER, cell_block=None):
+    """
+    Generate a Pacman maze using quantum walk algorithm.
+    Returns the layout as an int8 (height, width) array.
+    Args:
+        width, height: maze size in tiles
+        seed: seed for the quantum walk
+        probs: a precomputed walk distribution (skips the simulator)
+        backend: quantum walk backend (layouts differ between backends)
+        cell_block: give every block of this many tiles square its own walk
+            probability (see cell_paths); None folds tiles onto 32 positions
+    """
+    return generate_region(width, height, (0, 0, width, height), seed, probs, backend, cell_block)
+
+
+def generate_layouts(width, height, seeds, backend=AER, cell_block=None):
+    """
+    Generate the layouts for many seeds, sampling all their walks with one walk_batch() call.
+    Each layout is the same as generate_layout() gives for its seed.
+    Returns:
+        (layouts, walk distributions), one of each per seed (per-cell layouts
+        have no 32-position distribution, theirs are empty)
+    """
+    if cell_block is not None:
+        return [generate_layout(width, height, seed, backend=backend, cell_block=cell_block) for seed in seeds], \
+            [{} for _ in seeds]
+    distributions = walk_batch([(WALK_STEPS, WALK_ROTATION, seed) for seed in seeds], WALK_SHOTS, backend)
+    return [generate_layout(width, height, probs=probs) for probs in distributions], distributions
+
+
+def generate_region(width, height, region, seed=None, probs=None, backend=AER, cell_block=None):
+    """
+    Generate one rectangle of a maze, following the same rules as a whole layout.
+    Only the rectangle is computed, so the cost scales with its area.
+    Returns the tiles as an int8 array of the rectangle's shape.
+    Args:
+        width, height: size of the whole maze in tiles
+        region: (x0, y0, x1, y1) tile rectangle, x1/y1 exclusive
+        seed: seed for the quantum walk
+        probs: a precomputed walk distribution (skips the simulator)
+        backend: quantum walk backend
+        cell_block: per-cell walk block size (see generate_layout)
+    """
+    x0, y0, x1, y1 = region
+    # Start with all walls (this also creates the border)
+    grid = np.full((y1 - y0, x1 - x0), WALL, dtype=np.int8)
+    ys, xs = np.mgrid[y0:y1, x0:x1]
+    inner = (xs >= 1) & (xs < width - 1) & (ys >= 1) & (ys < height - 1)
+
+    def fill(left, top, right, bottom, value, keep=None):
+        """Set the part of a maze rectangle inside the region (skipping `keep` tiles)"""
+        area = grid[max(top, y0) - y0:max(min(bottom, y1) - y0, 0), max(left, x0) - x0:max(min(right, x1) - x0, 0)]
+        if keep is None:
+            area[:] = value
+        else:
+            area[area != keep] = value
+
+    if cell_block is None:
+        # Get quantum walk probability distribution
+        if probs is None:
+            probs = quantum_walk(steps=WALK_STEPS, seed=seed, backend=backend)
+        prob_table = np.array([probs.get(i, 0.5) for i in range(32)])
+
+        # Create corridors using quantum walk probabilities
+        position_hash = (xs * ys + xs + ys) % 32
+        # Higher probability = more likely to be a path
+        paths = prob_table[position_hash] > PATH_THRESHOLD  # Threshold for creating paths
+    else:
+        paths = cell_paths(width, height, xs, ys, cell_block, seed, backend)
+    grid[inner & paths] = PELLET
+
+    # Ensure minimum connectivity - create main corridors
+    grid[inner & ((ys % 5 == 1) | (ys == height // 2))] = PELLET  # Horizontal corridors
+    grid[inner & ((xs % 5 == 1) | (xs == width // 2))] = PELLET  # Vertical corridors
+
+    # Add power pellets in corners
+    for x, y in [(1, 3), (width - 2, 3), (1, height - 4), (width - 2, height - 4)]:
+        if x0 <= x < x1 and y0 <= y < y1 and grid[y - y0, x - x0] == PELLET:
+            grid[y - y0, x - x0] = POWER_PELLET
+
+    # Create ghost house in center
+    center_x, center_y = maze_center(width, height)
+    fill(center_x - 3, center_y - 2, center_x + 4, center_y + 3, EMPTY)
+    fill(center_x - 2, center_y - 1, center_x + 3, center_y + 2, GHOST_HOUSE)
+
+    # Create entrance to ghost house
+    fill(center_x - 1, center_y - 3, center_x + 2, center_y - 2, EMPTY)
+
+    # Ensure Pacman starting position is clear
+    pacman_start_x, pacman_start_y = pacman_start(width, height)
+    # Clear area around Pacman start
+    fill(pacman_start_x - 1, pacman_start_y - 1, pacman_start_x + 2, pacman_start_y + 2, PELLET, keep=GHOST_HOUSE)
+
+    return grid
+
 
 class Maze:
     """Handles maze layout, pellets, and collision detection"""
     
-    def __init__(self):
-        self.width = 28
-        self.height = 31
-        self.layout = self._generate_quantum_layout()
+    def __init__(self, width=MAZE_WIDTH, height=MAZE_HEIGHT, seed=None, layout_source=None, layout=None,
+                 walk_backend=AER, cell_block=None, noise_profile=None, executor=None, rng=random, walk_fallback=False):
+        if width < 9 or height < 11:
+            raise ValueError(f"Maze must be at least 9x11 tiles, got {width}x{height}")
+        self.width = width
+        self.height = height
+        # Spawn points and scatter corners are derived from the maze size
+        self.center = maze_center(width, height)
+        self.pacman_start = pacman_start(width, height)
+        cx, cy = self.center
+        self.ghost_starts = [(cx - 1, cy - 1), (cx, cy - 1), (cx - 1, cy), (cx, cy)]
+        self.scatter_targets = [(width - 3, 0), (2, 0), (width - 1, height - 2), (0, height - 2)]
+        # Optional LevelPool (see pregen.py) serving pre-generated layouts
+        self.layout_source = layout_source
+        # Per-cell walk block size for generated layouts and fluctuations (None = 32 positions)
+        self.cell_block = cell_block
+        # Noise profile emulated by tunneling measurements (see noise.py; None = ideal)
+        self.noise_profile = noise_profile
+        # Source of randomness for noisy measurement batches (the game's seeded RNG)
+        self.rng = rng
+        # Optional QuantumExecutor bounding how long Aer jobs may block (see quantum_executor.py)
+        self.executor = executor
+        # Whether the current layout missed the walk deadline and came from the fallback
+        self.layout_fell_back = False
+        # A given layout (e.g. from a maze library) skips generation entirely
+        self.layout = np.asarray(layout).tolist() if layout is not None else \
+            self._generate_quantum_layout(seed, walk_backend, walk_fallback)
+        # Bumped whenever the layout changes, so derived data can be cached
+        self.layout_version = 0
+        # (layout_version, regions, tiles) of the latest partial update, see changes_since()
+        self.last_change = None
+        self._layout_bytes = None
+        self._walls = None  # (layout_version, wall array), see walls()
         self.pellets = set()
         self.power_pellets = set()
+        # Row-major mirror of the pellet sets: PELLET, POWER_PELLET or EMPTY per tile
+        self.pellet_mask = bytearray(width * height)
         self._initialize_pellets()
         self.total_pellets = len(self.pellets) + len(self.power_pellets)
         # Initialize entanglement after maze is created
         from entanglement import EntanglementManager
         self.entanglement = EntanglementManager(self)
         
-    def reset_all_walls(self):
-       self.layout = self._generate_quantum_layout()
+    def reset_all_walls(self, seed=None, walk_backend=AER, walk_fallback=False):
+        """
+        Regenerate the whole layout (seed makes the quantum walk reproducible).
+        Pellets on tiles that became walls are dropped and every measurement lock is released.
+        Args:
+            walk_fallback: take the walk deadline's fallback layout (see _generate_quantum_layout)
+        """
+        self.layout = self._generate_quantum_layout(seed, walk_backend, walk_fallback)
+        self.layout_version += 1
+        self.last_change = None
+        self._update_tiles(list(self.pellets | self.power_pellets))
+        self.entanglement.locked_measurements.clear()
+        self.entanglement.measurement_cache.clear()
+    
+    def fluctuation_regions(self, pacman_tile):
+        """Get the regions a fluctuation may regenerate: every region not close to Pacman"""
+        size = FLUCTUATION_REGION_TILES
+        margin = FLUCTUATION_SAFE_RADIUS
+        pacman_x, pacman_y = pacman_tile
+        return [(x0, y0, min(x0 + size, self.width), min(y0 + size, self.height))
+                for y0 in range(0, self.height, size) for x0 in range(0, self.width, size)
+                if not (x0 - margin <= pacman_x < x0 + size + margin and y0 - margin <= pacman_y < y0 + size + margin)]
+    
+    def fluctuate(self, seed, pacman_tile, walk_backend=AER, count=FLUCTUATION_REGIONS):
+        """
+        Regenerate a few regions of the layout, away from Pacman.
+        Each region gets its own small quantum walk, so the cost scales with
+        the regions' size rather than the maze's. Only tiles that actually changed
+        are written, and pellets and measurement locks are updated for those alone.
+        Args:
+            seed: picks the regions and seeds their walks
+            pacman_tile: Pacman's (x, y) tile, whose surroundings stay as they are
+            walk_backend: quantum walk backend for the regions
+            count: number of regions to regenerate
+        Returns:
+            The changed tiles as a list of (x, y)
+        """
+        rng = random.Random(seed)
+        candidates = self.fluctuation_regions(pacman_tile)
+        regions = rng.sample(candidates, min(count, len(candidates)))
+        seeds = [rng.getrandbits(32) for _ in regions]
+        if self.cell_block is None:
+            walks = walk_batch([(WALK_STEPS, WALK_ROTATION, seed) for seed in seeds], REGION_WALK_SHOTS, walk_backend)
+        else:
+            walks = [None] * len(regions)  # Per-cell walks draw only the regions' cells
+        changes = []
+        for region, seed, probs in zip(regions, seeds, walks):
+            x0, y0, x1, y1 = region
+            new = generate_region(self.width, self.height, region, seed, probs, walk_backend, self.cell_block)
+            old = np.array([row[x0:x1] for row in self.layout[y0:y1]], dtype=np.int8)
+            ys, xs = np.nonzero(new != old)
+            changes.extend(zip((xs + x0).tolist(), (ys + y0).tolist(), new[ys, xs].tolist()))
+        self.set_tiles(changes, regions)
+        tiles = [(x, y) for x, y, _ in changes]
+        self._update_tiles(tiles)
+        return tiles
+    
+    def set_tiles(self, changes, regions=None):
+        """
+        Write (x, y, tile) changes to the layout as one layout update.
+        Pellets and locks are left alone (see fluctuate()).
+        Args:
+            changes: (x, y, tile) tuples
+            regions: the (x0, y0, x1, y1) rectangles the changes came from, if known
+        """
+        if not changes:
+            return
+        layout = self.layout
+        for x, y, tile in changes:
+            layout[y][x] = tile
+        self.layout_version += 1
+        self.last_change = (self.layout_version, regions, [(x, y) for x, y, _ in changes])
+    
+    def changes_since(self, version):
+        """
+        Get what changed in the layout since an earlier layout_version.
+        Returns:
+            (regions, tiles) when only one partial update happened since then
+            (regions may be None), ([], []) when nothing changed, or None when
+            the whole layout has to be re-read
+        """
+        if version == self.layout_version:
+            return [], []
+        if self.last_change is not None and self.last_change[0] == version + 1:
+            return self.last_change[1], self.last_change[2]
+        return None
+    
+    def _update_tiles(self, tiles):
+        """Drop the pellets and locks of tiles whose type changed"""
+        locks = self.entanglement.locked_measurements
+        cache = self.entanglement.measurement_cache
+        for x, y in tiles:
+            locks.pop((x, y), None)
+            cache.pop((x, y), None)
+            if self.layout[y][x] in (WALL, GHOST_HOUSE):
+                # Walled-in pellets could never be eaten
+                self.pellets.discard((x, y))
+                self.power_pellets.discard((x, y))
+                self.pellet_mask[y * self.width + x] = EMPTY
       
-    def _quantum_walk(self, steps=10):
+    def _generate_quantum_layout(self, seed=None, walk_backend=AER, walk_fallback=False):
         """
-        Perform a quantum walk to generate probability distribution.
-        Returns a probability distribution over positions.
+        Generate a layout, from the layout source (pool or library) when one is attached.
+        With an executor, an Aer layout that misses the walk deadline is
+        replaced by the statevector layout of the same seed.
+        Args:
+            walk_fallback: take that fallback without running the job (replays
+                use it to repeat a recorded miss for this layout only)
         """
-        # Use 5 qubits for position (can represent 32 positions)
-        n_qubits = 5
-        qc = QuantumCircuit(n_qubits, n_qubits)
-        
-        # Initialize in superposition
-        for i in range(n_qubits):
-            qc.h(i)
-        
-        # Apply quantum walk steps
-        for _ in range(steps):
-            # Apply Hadamard gates (coin operator)
-            for i in range(n_qubits):
-                qc.h(i)
-            
-            # Apply conditional shifts (walking operator)
-            for i in range(n_qubits - 1):
-                qc.cx(i, i + 1)
-            
-            # Add some rotation for variety
-            for i in range(n_qubits):
-                qc.rz(0.5, i)
-        
-        # Measure
-        qc.measure(range(n_qubits), range(n_qubits))
-        
-        # Simulate
-        simulator = AerSimulator()
-        compiled_circuit = transpile(qc, simulator)
-        result = simulator.run(compiled_circuit, shots=1000).result()
-        counts = result.get_counts()
-        
-        # Convert to probability distribution
-        total = sum(counts.values())
-        probs = {int(k, 2): v / total for k, v in counts.items()}
-        
-        return probs
+        self.layout_fell_back = False
+        executor = FallbackExecutor() if walk_fallback else self.executor
+        if executor is not None and walk_backend == AER:
+            def fallback():
+                self.layout_fell_back = True
+                return generate_layout(self.width, self.height, seed, backend=STATEVECTOR, cell_block=self.cell_block)
+            grid = executor.call(WALK, self._quantum_layout, (seed, walk_backend), fallback)
+        else:
+            grid = self._quantum_layout(seed, walk_backend)
+        # Plain lists keep per-tile lookups fast
+        return grid.tolist()
     
-    def _generate_quantum_layout(self):
-        """Generate a Pacman maze using quantum walk algorithm"""
-        # Start with all walls
-        layout = [[WALL for _ in range(self.width)] for _ in range(self.height)]
-        
-        # Create border
-        for x in range(self.width):
-            layout[0][x] = WALL
-            layout[self.height - 1][x] = WALL
-        for y in range(self.height):
-            layout[y][0] = WALL
-            layout[y][self.width - 1] = WALL
-        
-        # Get quantum walk probability distribution
-        probs = self._quantum_walk(steps=8)
-        
-        # Create corridors using quantum walk probabilities
-        for y in range(1, self.height - 1):
-            for x in range(1, self.width - 1):
-                # Use quantum walk to determine if this should be a path
-                position_hash = (x * y + x + y) % 32
-                prob = probs.get(position_hash, 0.5)
-                
-                # Higher probability = more likely to be a path
-                if prob > 0.02:  # Threshold for creating paths
-                    layout[y][x] = PELLET
-        
-        # Ensure minimum connectivity - create main corridors
-        for y in range(1, self.height - 1):
-            # Horizontal corridors
-            if y % 5 == 1 or y == self.height // 2:
-                for x in range(1, self.width - 1):
-                    if layout[y][x] == WALL:
-                        layout[y][x] = PELLET
-        
-        for x in range(1, self.width - 1):
-            # Vertical corridors
-            if x % 5 == 1 or x == self.width // 2:
-                for y in range(1, self.height - 1):
-                    if layout[y][x] == WALL:
-                        layout[y][x] = PELLET
-        
-        # Add power pellets in corners
-        if layout[3][1] == PELLET:
-            layout[3][1] = POWER_PELLET
-        if layout[3][self.width - 2] == PELLET:
-            layout[3][self.width - 2] = POWER_PELLET
-        if layout[self.height - 4][1] == PELLET:
-            layout[self.height - 4][1] = POWER_PELLET
-        if layout[self.height - 4][self.width - 2] == PELLET:
-            layout[self.height - 4][self.width - 2] = POWER_PELLET
-        
-        # Create ghost house in center
-        center_x = self.width // 2
-        center_y = self.height // 2
-        for dy in range(-2, 3):
-            for dx in range(-3, 4):
-                y = center_y + dy
-                x = center_x + dx
-                if 0 < y < self.height - 1 and 0 < x < self.width - 1:
-                    if abs(dy) <= 1 and abs(dx) <= 2:
-                        layout[y][x] = GHOST_HOUSE
-                    else:
-                        layout[y][x] = EMPTY
-        
-        # Create entrance to ghost house
-        layout[center_y - 3][center_x] = EMPTY
-        layout[center_y - 3][center_x - 1] = EMPTY
-        layout[center_y - 3][center_x + 1] = EMPTY
-        
-        # Ensure Pacman starting position is clear
-        pacman_start_y = 23
-        pacman_start_x = 14
-        if 0 < pacman_start_y < self.height - 1 and 0 < pacman_start_x < self.width - 1:
-            layout[pacman_start_y][pacman_start_x] = EMPTY
-            # Clear area around Pacman start
-            for dx in [-1, 0, 1]:
-                for dy in [-1, 0, 1]:
-                    y = pacman_start_y + dy
-                    x = pacman_start_x + dx
-                    if 0 < y < self.height - 1 and 0 < x < self.width - 1:
-                        if layout[y][x] != GHOST_HOUSE:
-                            layout[y][x] = PELLET
-        
-        return layout
+    def _quantum_layout(self, seed, walk_backend):
+        """Get a layout's grid from the layout source or the quantum walk"""
+        if self.layout_source is not None and self.cell_block is None:
+            return self.layout_source.get(self.width, self.height, seed, walk_backend)
+        return generate_layout(self.width, self.height, seed, backend=walk_backend, cell_block=self.cell_block)
     
     def _initialize_pellets(self):
         """Initialize pellet positions from layout"""
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.layout[y][x] == PELLET:
-                    self.pellets.add((x, y))
-                elif self.layout[y][x] == POWER_PELLET:
-                    self.power_pellets.add((x, y))
+        grid = np.array(self.layout, dtype=np.int8)
+        ys, xs = np.nonzero(grid == PELLET)
+        self.pellets.update(zip(xs.tolist(), ys.tolist()))
+        ys, xs = np.nonzero(grid == POWER_PELLET)
+        self.power_pellets.update(zip(xs.tolist(), ys.tolist()))
+        mask = np.where((grid == PELLET) | (grid == POWER_PELLET), grid, EMPTY)
+        self.pellet_mask[:] = mask.astype(np.uint8).tobytes()
     
     def is_wall(self, x, y, for_ghost=False):
         """
@@ -218,6 +429,45 @@ class Maze:
         """Check if position is valid (not a wall)"""
         return not self.is_wall(x, y, for_ghost)
     
+    def layout_bytes(self):
+        """Get the layout as row-major bytes (one tile per byte), cached per version"""
+        if self._layout_bytes is None or self._layout_bytes[0] != self.layout_version:
+            self._layout_bytes = (self.layout_version, bytes(np.array(self.layout, dtype=np.int8)))
+        return self._layout_bytes[1]
+    
+    def walls(self):
+        """Get a (height, width) uint8 array, 1 for walls, cached per version (for kernels.bfs_search)"""
+        if self._walls is None or self._walls[0] != self.layout_version:
+            grid = np.frombuffer(self.layout_bytes(), dtype=np.int8).reshape(self.height, self.width)
+            self._walls = (self.layout_version, (grid == WALL).astype(np.uint8))
+        return self._walls[1]
+    
+    def load_layout_bytes(self, data):
+        """Replace the layout with row-major bytes from layout_bytes()"""
+        grid = np.frombuffer(data, dtype=np.int8).reshape(self.height, self.width)
+        self.layout = grid.tolist()
+        self.layout_version += 1
+        self.last_change = None
+        self._layout_bytes = (self.layout_version, bytes(data))
+    
+    def load_pellet_mask(self, mask):
+        """Set the pellets from a pellet_mask, touching only tiles that differ"""
+        old = np.frombuffer(self.pellet_mask, dtype=np.uint8)
+        new = np.frombuffer(mask, dtype=np.uint8)
+        for i in np.flatnonzero(old != new).tolist():
+            pos = (i % self.width, i // self.width)
+            self.pellets.discard(pos)
+            self.power_pellets.discard(pos)
+            if new[i] == PELLET:
+                self.pellets.add(pos)
+            elif new[i] == POWER_PELLET:
+                self.power_pellets.add(pos)
+        self.pellet_mask[:] = mask
+    
+    def tile_center(self, x, y):
+        """Get the pixel center of a tile"""
+        return x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2
+    
     def get_tile(self, x, y):
         """Get tile type at position"""
         if x < 0 or x >= self.width or y < 0 or y >= self.height:
@@ -231,9 +481,11 @@ class Maze:
         
         if (grid_x, grid_y) in self.pellets:
             self.pellets.remove((grid_x, grid_y))
+            self.pellet_mask[grid_y * self.width + grid_x] = EMPTY
             return PELLET_SCORE
         elif (grid_x, grid_y) in self.power_pellets:
             self.power_pellets.remove((grid_x, grid_y))
+            self.pellet_mask[grid_y * self.width + grid_x] = EMPTY
             return POWER_PELLET_SCORE
         return 0
     
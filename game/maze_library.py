@@ -0,0 +1,303 @@
+"""
+On-disk maze libraries for Pacman
+
+A library file stores many generated layouts of one maze size so experiments,
+benchmarks and regression runs can reuse a fixed set of mazes without running
+the quantum simulator. Layout: a fixed header, the generator parameters as
+JSON, then three 64-byte aligned blocks:
+    tiles          int8  (count, height, width) - the layouts themselves
+    entries        one record per layout (seed and connectivity stats)
+    distributions  float32 (count, 32) - the quantum walk distribution used
+Tiles are kept one byte each (rather than packed 2-bit codes) so every block
+is memory-mapped and a layout is a zero-copy view, directly usable by Maze.
+
+Usage:
+    python maze_library.py generate mazes.eml --count 1000 --game-seed 7
+    python maze_library.py generate cells.eml --cell-block 2   # per-cell walk layouts
+    python maze_library.py info mazes.eml
+    python main.py --seed 7 --library mazes.eml   # plays layouts from the file
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import struct
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from constants import *
+from maze import Maze, generate_layout, generate_layouts, layout_seed, pacman_start
+from maze import WALK_STEPS, WALK_SHOTS, PATH_THRESHOLD
+from quantum_backend import AER, STATEVECTOR, WALK_BATCH_SIZE
+import kernels
+
+MAGIC = b"EML1"
+# magic, width, height, layout count, parameters JSON length
+HEADER = struct.Struct("<4sIIII")
+ALIGNMENT = 64
+WALK_POSITIONS = 32  # Outcomes of the 5-qubit walk
+ENTRY_DTYPE = np.dtype([
+    ("seed", "<u4"),
+    ("open_tiles", "<u4"),  # Tiles that are not walls
+    ("pellets", "<u4"),
+    ("power_pellets", "<u2"),
+    ("components", "<u2"),  # 4-connected regions of open tiles
+    ("reachable", "<u4"),  # Open tiles reachable from Pacman's start
+    ("dead_ends", "<u4"),  # Open tiles with a single open neighbour
+])
+
+
+def _align(offset):
+    """Round an offset up to the block alignment"""
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _block_offsets(width, height, count, params_length):
+    """Get the file offsets of the tiles, entries and distributions blocks"""
+    tiles = _align(HEADER.size + params_length)
+    entries = _align(tiles + count * width * height)
+    distributions = _align(entries + count * ENTRY_DTYPE.itemsize)
+    end = distributions + count * WALK_POSITIONS * 4
+    return tiles, entries, distributions, end
+
+
+def connectivity_stats(grid):
+    """
+    Get connectivity statistics for a layout.
+    Returns (open tiles, components, tiles reachable from Pacman's start, dead ends).
+    """
+    height, width = grid.shape
+    open_tiles = grid != WALL
+    # Open neighbours per tile (the border is always wall, so rolling is safe)
+    neighbours = (np.roll(open_tiles, 1, 0).astype(np.int8) + np.roll(open_tiles, -1, 0)
+                  + np.roll(open_tiles, 1, 1) + np.roll(open_tiles, -1, 1))
+    dead_ends = int(np.count_nonzero(open_tiles & (neighbours == 1)))
+
+    # Flood fill each region, remembering the size of the one Pacman starts in
+    start_x, start_y = pacman_start(width, height)
+    flood = kernels.flood_components if kernels.ENABLED else flood_components_python
+    components, reachable = flood(open_tiles, start_x, start_y)
+    return int(np.count_nonzero(open_tiles)), int(components), int(reachable), dead_ends
+
+
+def flood_components_python(open_tiles, start_x, start_y):
+    """
+    Count the 4-connected regions of open tiles (the border must be closed).
+    Pure-Python reference of kernels.flood_components.
+    Returns (components, size of the region holding the start tile or 0).
+    """
+    unseen = open_tiles.tolist()
+    components = 0
+    reachable = 0
+    for y, x in zip(*np.nonzero(open_tiles)):
+        if not unseen[y][x]:
+            continue
+        components += 1
+        unseen[y][x] = False
+        queue = deque([(x, y)])
+        size = 0
+        contains_start = False
+        while queue:
+            cx, cy = queue.popleft()
+            size += 1
+            contains_start |= (cx, cy) == (start_x, start_y)
+            for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+                if unseen[ny][nx]:
+                    unseen[ny][nx] = False
+                    queue.append((nx, ny))
+        if contains_start:
+            reachable = size
+    return components, reachable
+
+
+def _generate_entries(width, height, seeds, backend=AER, cell_block=None):
+    """Worker entry point: generate a batch of layouts with their distributions and stats"""
+    entries = []
+    for seed, grid, probs in zip(seeds, *generate_layouts(width, height, seeds, backend, cell_block)):
+        distribution = np.array([probs.get(i, 0.0) for i in range(WALK_POSITIONS)], dtype=np.float32)
+        open_tiles, components, reachable, dead_ends = connectivity_stats(grid)
+        entry = (seed, open_tiles, np.count_nonzero(grid == PELLET), np.count_nonzero(grid == POWER_PELLET),
+                 components, reachable, dead_ends)
+        entries.append((grid, entry, distribution))
+    return entries
+
+
+def write_library(path, width, height, seeds, workers=0, params=None, backend=AER, cell_block=None):
+    """
+    Generate a layout for every seed and write them as a library.
+    Args:
+        path: output file
+        width, height: maze size in tiles
+        seeds: walk seeds, one layout each
+        workers: worker processes generating layouts (0 = generate here)
+        params: extra JSON-serializable values stored with the generator parameters
+        backend: quantum walk backend (see quantum_backend.py)
+        cell_block: per-cell walk block size (see maze.generate_layout; distributions are then left zero)
+    Returns:
+        The number of layouts written
+    """
+    seeds = list(seeds)
+    count = len(seeds)
+    header_params = {
+        "walk_steps": WALK_STEPS,
+        "walk_shots": WALK_SHOTS,
+        "path_threshold": PATH_THRESHOLD,
+        "walk_backend": backend,
+        "cell_block": cell_block,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **(params or {}),
+    }
+    params_json = json.dumps(header_params).encode()
+    tiles_offset, entries_offset, distributions_offset, end = _block_offsets(width, height, count, len(params_json))
+
+    # Size the file up front and fill the blocks in place through memory maps
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, width, height, count, len(params_json)))
+        f.write(params_json)
+        f.truncate(end)
+    if count == 0:
+        return 0
+    tiles = np.memmap(path, dtype=np.int8, mode="r+", offset=tiles_offset, shape=(count, height, width))
+    entries = np.memmap(path, dtype=ENTRY_DTYPE, mode="r+", offset=entries_offset, shape=(count,))
+    distributions = np.memmap(path, dtype=np.float32, mode="r+", offset=distributions_offset,
+                              shape=(count, WALK_POSITIONS))
+
+    # Walks are sampled in batches; workers each take whole batches
+    batches = [seeds[i:i + WALK_BATCH_SIZE] for i in range(0, count, WALK_BATCH_SIZE)]
+    if workers > 0:
+        # Spawned workers get a clean interpreter (see pregen.py)
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = executor.map(_generate_entries, [width] * len(batches), [height] * len(batches), batches,
+                               [backend] * len(batches), [cell_block] * len(batches))
+    else:
+        executor = None
+        results = (_generate_entries(width, height, batch, backend, cell_block) for batch in batches)
+    results = (result for batch in results for result in batch)
+    try:
+        for i, (grid, entry, distribution) in enumerate(results):
+            tiles[i] = grid
+            entries[i] = entry
+            distributions[i] = distribution
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    for block in (tiles, entries, distributions):
+        block.flush()
+    return count
+
+
+class MazeLibrary:
+    """
+    Read-only, memory-mapped maze library.
+    Also works as a GameState layout source: layouts are looked up by walk
+    seed, so a library generated with --game-seed S serves every layout of a
+    game started with seed S; other seeds are generated as usual.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, self.width, self.height, self.count, params_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a maze library")
+            self.params = json.loads(f.read(params_length))
+        tiles_offset, entries_offset, distributions_offset, end = _block_offsets(
+            self.width, self.height, self.count, params_length)
+        if os.path.getsize(path) < end:
+            raise ValueError(f"{path} is truncated")
+        self.path = path
+        if self.count:
+            self.tiles = np.memmap(path, dtype=np.int8, mode="r", offset=tiles_offset,
+                                   shape=(self.count, self.height, self.width))
+            self.entries = np.memmap(path, dtype=ENTRY_DTYPE, mode="r", offset=entries_offset, shape=(self.count,))
+            self.distributions = np.memmap(path, dtype=np.float32, mode="r", offset=distributions_offset,
+                                           shape=(self.count, WALK_POSITIONS))
+        else:
+            self.tiles = np.zeros((0, self.height, self.width), dtype=np.int8)
+            self.entries = np.zeros(0, dtype=ENTRY_DTYPE)
+            self.distributions = np.zeros((0, WALK_POSITIONS), dtype=np.float32)
+        self.index = {seed: i for i, seed in enumerate(self.entries["seed"].tolist())}
+        self.depth = 0  # Nothing to queue ahead
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.count
+
+    def layout(self, i):
+        """Get the i-th layout as a read-only (height, width) view into the file"""
+        return self.tiles[i]
+
+    def entry(self, i):
+        """Get the i-th layout's seed and connectivity stats as a dict"""
+        return dict(zip(ENTRY_DTYPE.names, self.entries[i].tolist()))
+
+    def distribution(self, i):
+        """Get the quantum walk distribution the i-th layout was generated from"""
+        return {position: p for position, p in enumerate(self.distributions[i].tolist()) if p > 0}
+
+    def maze(self, i):
+        """Build a Maze from the i-th layout"""
+        return Maze(self.width, self.height, layout=self.tiles[i])
+
+    def prefetch(self, width, height, seeds):
+        """Layout source interface: every stored layout is already available"""
+        pass
+
+    def get(self, width, height, seed, backend=AER):
+        """Layout source interface: get the layout for a seed, generating it if not stored"""
+        stored = (width, height, backend) == (self.width, self.height, self.params.get("walk_backend", AER))
+        i = self.index.get(seed) if stored else None
+        if i is None:
+            self.misses += 1
+            return generate_layout(width, height, seed, backend=backend, cell_block=self.params.get("cell_block"))
+        self.hits += 1
+        return self.tiles[i]
+
+
+def main():
+    """Generate or inspect maze libraries"""
+    parser = argparse.ArgumentParser(description="Generate or inspect EntangleMan maze libraries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="generate a library")
+    generate.add_argument("path", help="library file to write")
+    generate.add_argument("--count", type=int, default=100, help="layouts to generate")
+    generate.add_argument("--width", type=int, default=MAZE_WIDTH, help="maze width in tiles")
+    generate.add_argument("--height", type=int, default=MAZE_HEIGHT, help="maze height in tiles")
+    generate.add_argument("--game-seed", type=int, default=0,
+                          help="derive walk seeds like a game with this seed (see maze.layout_seed)")
+    generate.add_argument("--backend", choices=[AER, STATEVECTOR], default=AER, help="quantum walk backend")
+    generate.add_argument("--cell-block", type=int, default=None,
+                          help="give every block of this many tiles square its own walk probability")
+    generate.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    info = commands.add_parser("info", help="summarize a library")
+    info.add_argument("path", help="library file to read")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        if args.width < 9 or args.height < 11:
+            parser.error("mazes must be at least 9x11 tiles")
+        start = time.perf_counter()
+        seeds = [layout_seed(args.game_seed, i) for i in range(args.count)]
+        count = write_library(args.path, args.width, args.height, seeds, workers=args.workers,
+                              params={"game_seed": args.game_seed}, backend=args.backend,
+                              cell_block=args.cell_block)
+        elapsed = time.perf_counter() - start
+        print(f"Wrote {count} {args.width}x{args.height} layouts to {args.path} "
+              f"in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} layouts/s)")
+    else:
+        library = MazeLibrary(args.path)
+        print(f"{library.path}: {library.count} layouts of {library.width}x{library.height}")
+        print(f"Parameters: {json.dumps(library.params)}")
+        if library.count:
+            tiles = library.width * library.height
+            for name in ENTRY_DTYPE.names[1:]:
+                values = library.entries[name]
+                print(f"  {name:14s} min {values.min():6d}  mean {values.mean():9.1f}  max {values.max():6d}")
+            connected = np.count_nonzero(library.entries["reachable"] == library.entries["open_tiles"])
+            print(f"  fully connected: {connected}/{library.count}, "
+                  f"mean open fraction {library.entries['open_tiles'].mean() / tiles:.2f}")
+
+
+if __name__ == "__main__":
+    main()
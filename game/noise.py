@@ -0,0 +1,218 @@
+"""
+Noisy-device emulation for Pacman
+
+A noise profile is a locally defined Aer noise model (depolarizing gate
+errors and asymmetric readout error, no cloud access) that makes the game's
+circuits behave like a small real device: tunneling measurements lean
+towards 0 the way qubit relaxation does, and walk distributions flatten out.
+Noisy simulation is far slower than the ideal one, so each profile's results
+are computed once in bulk and cached on disk:
+    outcomes  TABLE_SHOTS noisy Hadamard measurements, which MeasurementPool
+              refills copy instead of running a job (see quantum_logic.py)
+    walks     the noisy distribution of every walk circuit used, which the
+              noisy walk backend samples (see quantum_backend.noisy_backend)
+At runtime a tunneling measurement is still a byte read and a layout a
+multinomial draw, exactly as on the ideal path.
+
+Usage:
+    python noise.py build --profile device     # precompute and cache the tables
+    python noise.py info --profile device      # tunneling bias and walk distortion
+    python main.py --noise device              # play with noisy-device outcomes
+"""
+import argparse
+import json
+import os
+import time
+from functools import lru_cache
+import numpy as np
+from quantum_backend import WALK_QUBITS, WALK_ROTATION, walk_circuit, walk_probabilities
+
+# gate_error: depolarizing probability of every single-qubit gate
+# cx_error: depolarizing probability of every CX
+# readout_error: (P(read 1 | 0), P(read 0 | 1))
+NOISE_PROFILES = {
+    "low": {"gate_error": 0.001, "cx_error": 0.01, "readout_error": (0.01, 0.03)},
+    "device": {"gate_error": 0.004, "cx_error": 0.03, "readout_error": (0.02, 0.08)},
+    "heavy": {"gate_error": 0.02, "cx_error": 0.1, "readout_error": (0.05, 0.15)},
+}
+SINGLE_QUBIT_GATES = ["h", "rz", "sx", "x", "u"]
+TABLE_SHOTS = 1 << 16  # Noisy shots behind every table
+NOISE_CACHE_DIR = os.environ.get("ENTANGLE_NOISE_CACHE",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "entangleman"))
+
+
+def noise_model(profile):
+    """Build the Aer noise model of a profile"""
+    from qiskit_aer.noise import NoiseModel, ReadoutError, depolarizing_error
+    if profile not in NOISE_PROFILES:
+        raise ValueError(f"Unknown noise profile {profile!r} (choose from {', '.join(NOISE_PROFILES)})")
+    params = NOISE_PROFILES[profile]
+    model = NoiseModel()
+    model.add_all_qubit_quantum_error(depolarizing_error(params["gate_error"], 1), SINGLE_QUBIT_GATES)
+    model.add_all_qubit_quantum_error(depolarizing_error(params["cx_error"], 2), ["cx"])
+    p01, p10 = params["readout_error"]
+    model.add_all_qubit_readout_error(ReadoutError([[1 - p01, p01], [p10, 1 - p10]]))
+    return model
+
+
+@lru_cache(maxsize=None)
+def simulator(profile):
+    """Get the AerSimulator running a profile's noise model"""
+    from qiskit_aer import AerSimulator
+    return AerSimulator(noise_model=noise_model(profile))
+
+
+def measure_outcomes(profile, shots=TABLE_SHOTS):
+    """Run `shots` noisy |0> -> H -> measure preparations in one job; returns one 0/1 byte per shot"""
+    from qiskit import QuantumCircuit, transpile
+    qc = QuantumCircuit(1, 1)
+    qc.h(0)
+    qc.measure(0, 0)
+    backend = simulator(profile)
+    memory = backend.run(transpile(qc, backend), shots=shots, memory=True).result().get_memory()
+    return bytes(int(bit) for bit in memory)
+
+
+def walk_distribution(profile, steps, rotation=WALK_ROTATION, shots=TABLE_SHOTS):
+    """Estimate the noisy walk distribution from `shots` shots; returns 2**WALK_QUBITS probabilities"""
+    from qiskit import transpile
+    backend = simulator(profile)
+    counts = backend.run(transpile(walk_circuit(steps, rotation), backend), shots=shots).result().get_counts()
+    probabilities = np.zeros(2 ** WALK_QUBITS)
+    for key, count in counts.items():
+        probabilities[int(key, 2)] = count / shots
+    return probabilities
+
+
+def cache_path(profile):
+    """Get the file a profile's tables are cached in"""
+    return os.path.join(NOISE_CACHE_DIR, f"noise_{profile}.npz")
+
+
+class NoiseTables:
+    """A profile's precomputed noisy measurement outcomes and walk distributions"""
+
+    def __init__(self, profile, outcomes, walks=None, path=None):
+        self.profile = profile
+        self.outcomes = outcomes  # bytes, one 0/1 outcome each
+        self.walks = dict(walks or {})  # (steps, rotation) -> read-only probabilities
+        self.path = path  # Cache file new walk distributions are saved to (None = memory only)
+
+    def tunnel_probability(self):
+        """Get the fraction of outcomes that allow tunneling"""
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def walk(self, steps, rotation=WALK_ROTATION):
+        """Get a walk's noisy distribution, simulating (and caching) it on first use"""
+        key = (steps, float(rotation))
+        if key not in self.walks:
+            probabilities = walk_distribution(self.profile, steps, rotation)
+            probabilities.flags.writeable = False
+            self.walks[key] = probabilities
+            if self.path is not None:
+                self.save(self.path)
+        return self.walks[key]
+
+    def save(self, path):
+        """Write the tables to a cache file"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        keys = sorted(self.walks)
+        params = json.dumps(NOISE_PROFILES[self.profile]).encode()
+        # Write then rename, so a reader never sees a half-written file
+        partial = path + ".partial.npz"
+        np.savez(partial, params=np.frombuffer(params, dtype=np.uint8),
+                 outcomes=np.frombuffer(self.outcomes, dtype=np.uint8),
+                 walk_keys=np.array(keys, dtype=np.float64).reshape(-1, 2),
+                 walk_probabilities=np.array([self.walks[key] for key in keys]).reshape(-1, 2 ** WALK_QUBITS))
+        os.replace(partial, path)
+
+
+def build_tables(profile, steps, shots=TABLE_SHOTS, path=None):
+    """
+    Simulate a profile's tables in bulk.
+    Args:
+        profile: NOISE_PROFILES name
+        steps: walk lengths to precompute
+        shots: noisy shots per table
+        path: cache file to write (None = don't save)
+    """
+    walks = {}
+    for n in steps:
+        probabilities = walk_distribution(profile, n, shots=shots)
+        probabilities.flags.writeable = False
+        walks[(n, float(WALK_ROTATION))] = probabilities
+    tables = NoiseTables(profile, measure_outcomes(profile, shots), walks, path)
+    if path is not None:
+        tables.save(path)
+    return tables
+
+
+def load_tables(profile, path):
+    """Load a profile's cached tables, or None if there are none for its current parameters"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if json.loads(data["params"].tobytes()) != json.loads(json.dumps(NOISE_PROFILES[profile])):
+            return None  # The profile changed since the tables were built
+        walks = {}
+        for (steps, rotation), probabilities in zip(data["walk_keys"].tolist(), data["walk_probabilities"]):
+            probabilities.flags.writeable = False
+            walks[(int(steps), rotation)] = probabilities
+        return NoiseTables(profile, data["outcomes"].tobytes(), walks, path)
+
+
+@lru_cache(maxsize=None)
+def tables(profile):
+    """Get a profile's tables: from the cache file, or simulated now and cached"""
+    if profile not in NOISE_PROFILES:
+        raise ValueError(f"Unknown noise profile {profile!r} (choose from {', '.join(NOISE_PROFILES)})")
+    path = cache_path(profile)
+    loaded = load_tables(profile, path)
+    if loaded is not None:
+        return loaded
+    from maze import WALK_STEPS
+    return build_tables(profile, [WALK_STEPS], path=path)
+
+
+def _measurement_cost(pool, count=1 << 14):
+    """Get the mean microseconds per tunneling measurement drawn from a pool, refills included"""
+    pool.next()  # Leave Qiskit's import and the table load out of the timing
+    start = time.perf_counter()
+    for _ in range(count):
+        pool.next()
+    return 1e6 * (time.perf_counter() - start) / count
+
+
+def main():
+    """Build or inspect noise tables"""
+    parser = argparse.ArgumentParser(description="EntangleMan noisy-device emulation tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="precompute and cache a profile's tables")
+    build.add_argument("--profile", choices=list(NOISE_PROFILES), nargs="+", default=list(NOISE_PROFILES))
+    build.add_argument("--shots", type=int, default=TABLE_SHOTS, help="noisy shots per table")
+    info = commands.add_parser("info", help="compare a profile's tables with the ideal circuits")
+    info.add_argument("--profile", choices=list(NOISE_PROFILES), nargs="+", default=list(NOISE_PROFILES))
+    args = parser.parse_args()
+
+    from maze import WALK_STEPS
+    from quantum_logic import MeasurementPool
+    if args.command == "info":
+        ideal_cost = _measurement_cost(MeasurementPool())
+    for profile in args.profile:
+        if args.command == "build":
+            start = time.perf_counter()
+            build_tables(profile, [WALK_STEPS], args.shots, cache_path(profile))
+            print(f"{profile}: {args.shots} shots per table in {time.perf_counter() - start:.1f}s "
+                  f"-> {cache_path(profile)}")
+        else:
+            noisy = tables(profile)
+            ideal = walk_probabilities(WALK_STEPS)
+            distance = 0.5 * np.abs(noisy.walk(WALK_STEPS) - ideal).sum()
+            print(f"{profile}: P(tunnel) {noisy.tunnel_probability():.4f} (ideal 0.5), "
+                  f"walk total variation distance from ideal {distance:.4f}, "
+                  f"{_measurement_cost(MeasurementPool(noise_profile=profile)):.2f} us per measurement "
+                  f"(ideal {ideal_cost:.2f})")
+
+
+if __name__ == "__main__":
+    main()
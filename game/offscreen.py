@@ -0,0 +1,152 @@
+"""
+Offscreen rendering for Pacman: frames as NumPy arrays without a window
+"""
+import os
+import shutil
+import subprocess
+
+# The dummy driver must be selected before pygame initializes its display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame
+from constants import *
+from renderer import Renderer
+
+# ITU-R BT.601 luma weights for grayscale frames, in 1/256 fixed point
+GRAY_WEIGHTS = (77, 150, 29)
+
+
+class OffscreenRenderer(Renderer):
+    """
+    Renders into an in-memory Surface and exposes each frame as a NumPy array.
+
+    Frames are (height, width, 3) uint8 views straight into the surface pixels
+    (no copy). A view keeps its surface locked, so rendering alternates between
+    two surfaces: the frame returned by render() stays valid through the next
+    render() call. Copy a frame if it has to outlive that.
+    """
+    
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, scale=1, grayscale=False):
+        """
+        Args:
+            width: frame width in pixels
+            height: frame height in pixels
+            scale: integer downscale factor for frame_small() (1 = disabled)
+            grayscale: if True, pre-allocate buffers for frame_gray()
+        """
+        if not pygame.get_init():
+            pygame.init()
+        self._surfaces = [pygame.Surface((width, height), depth=32) for _ in range(2)]
+        super().__init__(self._surfaces[0], present=False)
+        self.scale = scale
+        self.encoders = []
+        self._frame = None
+        
+        # Pre-allocated buffers for the optional variants
+        small_shape = ((height + scale - 1) // scale, (width + scale - 1) // scale)
+        self._small = np.empty(small_shape + (3,), dtype=np.uint8) if scale > 1 else None
+        self._gray_acc = np.empty((height, width), dtype=np.uint16) if grayscale else None
+        self._gray_tmp = np.empty((height, width), dtype=np.uint16) if grayscale else None
+        self._gray = np.empty((height, width), dtype=np.uint8) if grayscale else None
+    
+    def render(self, game_state, alpha=1.0):
+        """Render the game state and return the frame array"""
+        # Draw on the surface the previous frame view is not locking
+        self._frame = None
+        self.screen = self._surfaces[1] if self.screen is self._surfaces[0] else self._surfaces[0]
+        if self.screen.get_locked():
+            raise RuntimeError("Frames from two renders ago are still referenced; copy frames that must be kept")
+        
+        super().render(game_state, alpha)
+        
+        # pixels3d is (width, height, 3); transpose to row-major image order (still a view)
+        self._frame = pygame.surfarray.pixels3d(self.screen).transpose(1, 0, 2)
+        for encoder in self.encoders:
+            encoder.write(self._frame)
+        return self._frame
+    
+    def frame(self):
+        """Get the most recent frame as a (height, width, 3) view"""
+        return self._frame
+    
+    def frame_small(self):
+        """Get the most recent frame downscaled by `scale` (nearest neighbour)"""
+        if self._small is None:
+            return self._frame
+        np.copyto(self._small, self._frame[::self.scale, ::self.scale])
+        return self._small
+    
+    def frame_gray(self):
+        """Get the most recent frame as a (height, width) uint8 grayscale array"""
+        if self._gray is None:
+            raise RuntimeError("OffscreenRenderer was created without grayscale=True")
+        # Integer weighted sum in uint16 buffers, then divide by 256
+        red, green, blue = GRAY_WEIGHTS
+        np.multiply(self._frame[..., 0], red, out=self._gray_acc, dtype=np.uint16)
+        np.multiply(self._frame[..., 1], green, out=self._gray_tmp, dtype=np.uint16)
+        self._gray_acc += self._gray_tmp
+        np.multiply(self._frame[..., 2], blue, out=self._gray_tmp, dtype=np.uint16)
+        self._gray_acc += self._gray_tmp
+        np.right_shift(self._gray_acc, 8, out=self._gray, casting="unsafe")
+        return self._gray
+    
+    def add_encoder(self, encoder):
+        """Stream every rendered frame to an encoder (see RawFrameWriter, FFmpegWriter)"""
+        self.encoders.append(encoder)
+    
+    def close(self):
+        """Release the frame view and close all encoders"""
+        self._frame = None
+        for encoder in self.encoders:
+            encoder.close()
+        self.encoders.clear()
+
+
+class RawFrameWriter:
+    """Streams frames as raw RGB24 bytes to a file, one frame after another"""
+    
+    def __init__(self, path, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        self.file = open(path, "wb")
+        # Frame views are not contiguous, so stage them in one reusable buffer
+        self._staging = np.empty((height, width, 3), dtype=np.uint8)
+        self.frames_written = 0
+    
+    def _contiguous(self, frame):
+        """Get a C-contiguous version of the frame without allocating"""
+        if frame.flags.c_contiguous:
+            return frame
+        np.copyto(self._staging, frame)
+        return self._staging
+    
+    def write(self, frame):
+        """Append one frame"""
+        self.file.write(self._contiguous(frame).data)
+        self.frames_written += 1
+    
+    def close(self):
+        """Flush and close the output file"""
+        self.file.close()
+
+
+class FFmpegWriter(RawFrameWriter):
+    """Streams frames into an ffmpeg process that encodes them to a video file"""
+    
+    def __init__(self, path, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, fps=TICK_RATE):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg was not found on PATH; use RawFrameWriter instead")
+        self.process = subprocess.Popen(
+            [ffmpeg, "-loglevel", "error", "-y",
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+             "-i", "-", "-pix_fmt", "yuv420p", path],
+            stdin=subprocess.PIPE,
+        )
+        self.file = self.process.stdin
+        self._staging = np.empty((height, width, 3), dtype=np.uint8)
+        self.frames_written = 0
+    
+    def close(self):
+        """Finish the stream and wait for ffmpeg to write the file"""
+        self.file.close()
+        self.process.wait()
@@ -2,39 +2,76 @@
 Pathfinding algorithms for ghost AI
 """
 from collections import deque
-from constants import UP, DOWN, LEFT, RIGHT
+from constants import UP, DOWN, LEFT, RIGHT, BFS_MAX_EXPANSIONS
+import kernels
 
 
-def bfs_find_path(maze, start_pos, target_pos):
+def bfs_find_path(maze, start_pos, target_pos, max_expansions=BFS_MAX_EXPANSIONS):
     """
     Use BFS to find the shortest path from start to target.
     Returns the first direction to take.
     
+    On large mazes the search is bounded: after max_expansions tiles it
+    heads for the explored tile closest to the target instead.
+    
     Args:
         maze: The maze object
         start_pos: Tuple (x, y) of starting grid position
         target_pos: Tuple (x, y) of target grid position
+        max_expansions: Maximum number of tiles to expand
     
     Returns:
         Direction tuple (dx, dy) or None if no path found
     """
+    return bfs_search(maze, start_pos, target_pos, max_expansions)[0]
+
+
+def bfs_search(maze, start_pos, target_pos, max_expansions=BFS_MAX_EXPANSIONS):
+    """
+    Same as bfs_find_path, but also report the work done.
+    Returns (direction or None, number of tiles expanded).
+    Runs the compiled kernel when kernels.ENABLED, else bfs_search_python
+    (both give the same result).
+    """
+    if kernels.ENABLED and hasattr(maze, "walls"):
+        index, expansions = kernels.bfs_search(maze.walls(), start_pos[0], start_pos[1],
+                                               target_pos[0], target_pos[1], max_expansions)
+        return (None if index < 0 else (kernels.STEP_X[index], kernels.STEP_Y[index])), expansions
+    return bfs_search_python(maze, start_pos, target_pos, max_expansions)
+
+
+def bfs_search_python(maze, start_pos, target_pos, max_expansions=BFS_MAX_EXPANSIONS):
+    """Pure-Python bfs_search: the reference implementation, and the fallback without Numba"""
     start_x, start_y = start_pos
     target_x, target_y = target_pos
     
-    # BFS queue: (x, y, path)
-    queue = deque([(start_x, start_y, [])])
+    # BFS queue: (x, y, first direction of the path to this tile)
+    # Carrying only the first step avoids copying whole paths
+    queue = deque([(start_x, start_y, None)])
     visited = {(start_x, start_y)}
     
     directions = [UP, DOWN, LEFT, RIGHT]
     
+    # Closest tile seen so far, used when the budget runs out
+    best_dist = abs(start_x - target_x) + abs(start_y - target_y)
+    best_first = None
+    expansions = 0
+    
     while queue:
-        x, y, path = queue.popleft()
+        x, y, first = queue.popleft()
         
         # Found target
-        if (x, y) == (target_x, target_y):
-            if path:
-                return path[0]  # Return first direction in path
-            return None
+        if x == target_x and y == target_y:
+            return first, expansions  # First direction in path (None if already there)
+        
+        dist = abs(x - target_x) + abs(y - target_y)
+        if dist < best_dist:
+            best_dist = dist
+            best_first = first
+        
+        expansions += 1
+        if expansions > max_expansions:
+            return best_first, expansions  # Budget exhausted - head for the closest tile
         
         # Explore neighbors
         for direction in directions:
@@ -44,9 +81,9 @@ def bfs_find_path(maze, start_pos, target_pos):
             
             if (next_x, next_y) not in visited and maze.is_valid_position(next_x, next_y):
                 visited.add((next_x, next_y))
-                queue.append((next_x, next_y, path + [direction]))
+                queue.append((next_x, next_y, first or direction))
     
-    return None  # No path found
+    return None, expansions  # No path found
 
 
 def get_best_direction(maze, current_pos, target_pos, current_direction):
@@ -63,14 +100,22 @@ def get_best_direction(maze, current_pos, target_pos, current_direction):
     Returns:
         Best direction tuple (dx, dy)
     """
+    return choose_direction(maze, current_pos, target_pos, current_direction)[0]
+
+
+def choose_direction(maze, current_pos, target_pos, current_direction, max_expansions=BFS_MAX_EXPANSIONS):
+    """
+    Same as get_best_direction, with a bounded search.
+    Returns (direction, number of tiles expanded).
+    """
     # First try pathfinding
-    best_dir = bfs_find_path(maze, current_pos, target_pos)
+    best_dir, expansions = bfs_search(maze, current_pos, target_pos, max_expansions)
     
     if best_dir:
         # Avoid reversing direction unless it's the only option
         reverse_dir = (-current_direction[0], -current_direction[1])
         if best_dir != reverse_dir:
-            return best_dir
+            return best_dir, expansions
         
         # Check if there are other valid directions
         x, y = current_pos
@@ -79,10 +124,10 @@ def get_best_direction(maze, current_pos, target_pos, current_direction):
                 next_x = x + direction[0]
                 next_y = y + direction[1]
                 if maze.is_valid_position(next_x, next_y):
-                    return direction
+                    return direction, expansions
         
         # No choice but to reverse
-        return best_dir
+        return best_dir, expansions
     
     # No path found, try any valid direction
     x, y = current_pos
@@ -93,7 +138,7 @@ def get_best_direction(maze, current_pos, target_pos, current_direction):
             next_x = x + direction[0]
             next_y = y + direction[1]
             if maze.is_valid_position(next_x, next_y):
-                return direction
+                return direction, expansions
     
     # Last resort: reverse
-    return reverse_dir
+    return reverse_dir, expansions
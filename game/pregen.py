@@ -0,0 +1,125 @@
+"""
+Ahead-of-time level generation for Pacman
+
+A LevelPool keeps a bounded queue of layouts being generated by worker
+processes. Games ask for the layouts they will need next (their seeds are
+known in advance, see maze.layout_seed), so new levels and restarts just
+pop a finished layout instead of running the quantum walk on the game
+thread. The seeds queued by one prefetch are split into one walk batch per
+worker.
+
+A pool may be used from two threads: the game thread prefetches while a
+layout job that missed its walk deadline (see quantum_executor.py) may still
+call get() from the executor's thread. The queue is guarded by a lock that
+is never held while waiting for a layout.
+"""
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from maze import generate_layout, generate_layouts
+from quantum_backend import AER
+
+PREGEN_DEPTH = 4  # Layouts queued ahead per game
+PREGEN_WORKERS = 2
+
+
+def _generate(width, height, seeds):
+    """Worker entry point: generate a batch of layouts and time it"""
+    start = time.perf_counter()
+    grids = generate_layouts(width, height, seeds)[0]
+    return grids, time.perf_counter() - start
+
+
+class LevelPool:
+    """Bounded queue of layouts generated by worker processes"""
+
+    def __init__(self, workers=PREGEN_WORKERS, depth=PREGEN_DEPTH):
+        # Spawned workers get a clean interpreter (forking a process that
+        # already runs simulator threads is not safe)
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.workers = workers
+        self.depth = depth
+        self.pending = OrderedDict()  # (width, height, seed) -> (Future of its batch, index in the batch)
+        # Guards pending and the counters (re-entrant: a done callback may run inside prefetch or get)
+        self._lock = threading.RLock()
+        self.started = time.perf_counter()
+        self.generated = 0  # Layouts finished by workers
+        self.generation_seconds = 0.0  # Worker time spent generating
+        self.hits = 0  # Requests served from a finished layout
+        self.waits = 0  # Requests that waited for a worker still generating
+        self.misses = 0  # Requests generated synchronously
+
+    def prefetch(self, width, height, seeds):
+        """Queue layouts for the given seeds, up to the pool depth"""
+        with self._lock:
+            queued = []
+            for seed in seeds:
+                if (width, height, seed) in self.pending:
+                    continue
+                if len(self.pending) + len(queued) >= self.depth:
+                    break
+                queued.append(seed)
+            if not queued:
+                return
+            # One batch per worker, so every worker gets a share
+            size = -(-len(queued) // self.workers)
+            for start in range(0, len(queued), size):
+                batch = queued[start:start + size]
+                future = self.executor.submit(_generate, width, height, batch)
+                future.add_done_callback(self._on_generated)
+                for i, seed in enumerate(batch):
+                    self.pending[(width, height, seed)] = (future, i)
+
+    def _on_generated(self, future):
+        """Count a finished layout (runs on the executor's thread)"""
+        if not future.cancelled() and future.exception() is None:
+            grids, seconds = future.result()
+            with self._lock:
+                self.generated += len(grids)
+                self.generation_seconds += seconds
+
+    def get(self, width, height, seed, backend=AER):
+        """Get the layout for a seed, generating it here if it was never queued"""
+        if backend != AER:
+            return generate_layout(width, height, seed, backend=backend)  # Workers only queue Aer layouts
+        with self._lock:
+            future, index = self.pending.pop((width, height, seed), (None, 0))
+            if future is not None and not future.done() and future.cancel():
+                # Never started - faster to generate it right here (the rest of its batch is queued again later)
+                for key in [key for key, (other, _) in self.pending.items() if other is future]:
+                    del self.pending[key]
+                future = None
+            if future is None:
+                self.misses += 1
+            elif future.done():
+                self.hits += 1
+            else:
+                self.waits += 1
+        if future is None:
+            return generate_layout(width, height, seed)
+        return future.result()[0][index]
+
+    def stats(self):
+        """Get queue depth and generation rate"""
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            return {
+                "queued": len(self.pending),
+                "ready": sum(future.done() for future, _ in self.pending.values()),
+                "generated": self.generated,
+                "layouts_per_second": self.generated / elapsed if elapsed > 0 else 0.0,
+                "mean_generation_ms": 1000 * self.generation_seconds / self.generated if self.generated else 0.0,
+                "hits": self.hits,
+                "waits": self.waits,
+                "misses": self.misses,
+            }
+
+    def close(self):
+        """Stop the workers, dropping queued layouts"""
+        with self._lock:
+            for future, _ in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
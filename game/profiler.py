@@ -0,0 +1,133 @@
+"""
+Per-subsystem frame profiler for Pacman
+
+Usage in hot paths:
+    t = profiler.start()
+    ...work...
+    profiler.stop("section.name", t)
+
+When disabled, start/stop are bound to no-op functions, so instrumented
+code pays only for two trivial calls. Enable with ENTANGLE_PROFILE=1 or
+main.py --profile.
+"""
+import json
+import os
+import time
+from array import array
+from time import perf_counter_ns
+
+PROFILE_WINDOW = 600  # Samples kept per section (10 seconds at 60 ticks)
+
+
+def _zero():
+    """Disabled start(): no timestamp needed"""
+    return 0
+
+
+def _noop(name, start):
+    """Disabled stop(): record nothing"""
+    pass
+
+
+class Section:
+    """Rolling window of timings (in nanoseconds) for one subsystem"""
+
+    def __init__(self, window):
+        self.samples = array("q", bytes(8 * window))
+        self.cursor = 0
+        self.count = 0
+        self.total_ns = 0
+        self.calls = 0
+
+    def add(self, elapsed_ns):
+        """Record one timing, overwriting the oldest when full"""
+        self.samples[self.cursor] = elapsed_ns
+        self.cursor = (self.cursor + 1) % len(self.samples)
+        if self.count < len(self.samples):
+            self.count += 1
+        self.total_ns += elapsed_ns
+        self.calls += 1
+
+    def percentiles(self, points=(50, 95, 99)):
+        """Get the requested percentiles over the current window"""
+        if self.count == 0:
+            return [0] * len(points)
+        ordered = sorted(self.samples[:self.count])
+        return [ordered[min(self.count - 1, self.count * p // 100)] for p in points]
+
+    def recent(self):
+        """Get the window samples in chronological order"""
+        if self.count < len(self.samples):
+            return list(self.samples[:self.count])
+        return list(self.samples[self.cursor:]) + list(self.samples[:self.cursor])
+
+
+class Profiler:
+    """Collects per-section timings with perf_counter_ns"""
+
+    def __init__(self, enabled=False, window=PROFILE_WINDOW):
+        self.window = window
+        self.sections = {}
+        self.overlay_visible = False
+        self.set_enabled(enabled)
+
+    def set_enabled(self, enabled):
+        """Turn profiling on or off by rebinding the hot-path methods"""
+        self.enabled = enabled
+        if enabled:
+            self.start = perf_counter_ns
+            self.stop = self._stop
+        else:
+            self.start = _zero
+            self.stop = _noop
+            self.overlay_visible = False
+
+    def _stop(self, name, start):
+        """Record the time elapsed since `start` under `name`"""
+        elapsed = perf_counter_ns() - start
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self.window)
+        section.add(elapsed)
+
+    def toggle_overlay(self):
+        """Show or hide the on-screen overlay (only while enabled)"""
+        self.overlay_visible = self.enabled and not self.overlay_visible
+
+    def summary(self):
+        """Get {name: (p50, p95, p99, calls)} in nanoseconds, sorted by name"""
+        return {name: (*self.sections[name].percentiles(), self.sections[name].calls)
+                for name in sorted(self.sections)}
+
+    def reset(self):
+        """Drop all collected samples"""
+        self.sections.clear()
+
+    def dump(self, path=None):
+        """
+        Write the capture to a JSON file.
+        Returns the path written.
+        """
+        if path is None:
+            path = f"profile_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        capture = {
+            "window": self.window,
+            "sections": {
+                name: {
+                    "p50_ns": p50,
+                    "p95_ns": p95,
+                    "p99_ns": p99,
+                    "calls": calls,
+                    "total_ns": self.sections[name].total_ns,
+                    "samples_ns": self.sections[name].recent(),
+                }
+                for name, (p50, p95, p99, calls) in self.summary().items()
+            },
+        }
+        with open(path, "w") as f:
+            json.dump(capture, f, indent=1)
+        return path
+
+
+# Shared profiler used by all instrumented modules
+profiler = Profiler(enabled=os.environ.get("ENTANGLE_PROFILE") == "1")
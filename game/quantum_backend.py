@@ -0,0 +1,279 @@
+"""
+Lazily loaded quantum simulation backends for Pacman
+
+Importing Qiskit and building an AerSimulator takes seconds, so nothing here
+touches Qiskit until a simulator is first needed. prewarm() does that work on
+a background thread while the first frames render.
+
+Quantum walks (maze generation) can run on two backends:
+    AER          - the walk circuit sampled on Qiskit Aer
+    STATEVECTOR  - the same circuit's exact statevector computed with NumPy,
+                   sampled with a seeded NumPy generator (no Qiskit needed)
+Both are deterministic for a given seed, but they sample differently, so the
+backend is part of a layout's identity (see maze.generate_layout).
+noisy_backend(profile) names a third kind: the walk's distribution under a
+device noise model, precomputed in bulk (see noise.py) and sampled like the
+statevector one.
+
+walk_batch() samples many walk variants in one call, e.g. all the layouts a
+library or level pool needs, or all regions of a wall fluctuation. On Aer
+every variant is still a job of its own (see aer_walk_batch); the batch
+shares the simulator and the compiled circuit, and worker processes are
+what scale it across cores.
+"""
+import threading
+from functools import lru_cache, partial
+import numpy as np
+
+AER = "aer"
+STATEVECTOR = "statevector"
+WALK_QUBITS = 5  # Walk positions are 5-bit numbers (32 positions)
+WALK_ROTATION = 0.5  # RZ angle applied after every walk step
+STATEVECTOR_MAX_QUBITS = 20  # Widest register simulated exactly with NumPy (16 MiB of amplitudes)
+MPS_MIN_QUBITS = 17  # From this width on, Aer's matrix product state simulator beats NumPy
+WALK_BATCH_SIZE = 32  # Walks per batch for callers that split work across processes
+NOISY_PREFIX = "noisy:"  # Backend names "noisy:<profile>" sample a noise profile's walk tables
+
+_simulator = None
+_simulator_lock = threading.Lock()
+_warm = threading.Event()
+_prewarm_thread = None
+
+
+def simulator():
+    """Get the shared AerSimulator, importing Qiskit Aer on first use"""
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                from qiskit_aer import AerSimulator
+                _simulator = AerSimulator()
+    return _simulator
+
+
+def walk_circuit(steps, rotation=WALK_ROTATION, qubits=WALK_QUBITS, measure=True):
+    """
+    Build the quantum walk circuit.
+    Args:
+        steps: walk steps
+        rotation: RZ angle applied after every step
+        qubits: register width (positions are qubits-bit numbers)
+        measure: end with measurements of every qubit
+    """
+    from qiskit import QuantumCircuit
+    qc = QuantumCircuit(qubits, qubits if measure else 0)
+
+    # Initialize in superposition
+    for i in range(qubits):
+        qc.h(i)
+
+    # Apply quantum walk steps
+    for _ in range(steps):
+        # Apply Hadamard gates (coin operator)
+        for i in range(qubits):
+            qc.h(i)
+
+        # Apply conditional shifts (walking operator)
+        for i in range(qubits - 1):
+            qc.cx(i, i + 1)
+
+        # Add some rotation for variety
+        for i in range(qubits):
+            qc.rz(rotation, i)
+
+    if measure:
+        qc.measure(range(qubits), range(qubits))
+    return qc
+
+
+@lru_cache(maxsize=None)
+def compiled_walk(steps, rotation=WALK_ROTATION):
+    """Get the walk circuit transpiled for the simulator (transpiling costs far more than running it)"""
+    from qiskit import transpile
+    return transpile(walk_circuit(steps, rotation), simulator())
+
+
+def _distribution(counts):
+    """Turn measurement counts into {position: probability}"""
+    total = sum(counts.values())
+    return {int(k, 2): v / total for k, v in counts.items()}
+
+
+def aer_walk(steps, shots, seed=None, rotation=WALK_ROTATION):
+    """Sample the walk circuit on Aer; returns {position: probability}"""
+    return aer_walk_batch([(steps, rotation, seed)], shots)[0]
+
+
+def aer_walk_batch(variants, shots):
+    """
+    Sample many walk variants on Aer, one job per variant.
+    Aer seeds every experiment of a job from the job's seed and the
+    experiment's position, so variants sharing a job could not keep their
+    own seeds; with a job each, a seed gives the same distribution alone or
+    in any batch, which pre-generated and library layouts rely on. Every job
+    reuses the shared simulator and the cached compiled circuits.
+    Args:
+        variants: (steps, rotation, seed) tuples
+        shots: shots per variant
+    Returns:
+        {position: probability} for each variant, in order
+    """
+    backend = simulator()
+    distributions = []
+    for steps, rotation, seed in variants:
+        options = {} if seed is None else {"seed_simulator": seed}
+        result = backend.run(compiled_walk(steps, rotation), shots=shots, **options).result()
+        distributions.append(_distribution(result.get_counts()))
+    return distributions
+
+
+@lru_cache(maxsize=None)
+def walk_probabilities(steps, rotation=WALK_ROTATION, qubits=WALK_QUBITS):
+    """
+    Get the exact measurement distribution of the walk circuit.
+    Simulates the circuit's statevector with NumPy (qubit i is bit i of the
+    basis index, as in Qiskit). Cached per register width, steps and angle.
+    Returns a read-only array of 2**qubits probabilities.
+    """
+    if qubits > STATEVECTOR_MAX_QUBITS:
+        raise ValueError(f"{qubits} qubits is too wide for the NumPy statevector (max {STATEVECTOR_MAX_QUBITS})")
+    size = 2 ** qubits
+    state = np.zeros(size, dtype=np.complex128)
+    state[0] = 1.0
+    # RZ(theta) = diag(e^{-i theta/2}, e^{i theta/2}) on every qubit: a phase per number of set bits
+    index = np.arange(size)
+    ones = np.zeros(size)
+    for qubit in range(qubits):
+        ones += (index >> qubit) & 1
+    phase = np.exp(1j * rotation * (ones - qubits / 2))
+
+    def hadamard_all(state):
+        for qubit in range(qubits):
+            # Pair every basis state with its partner differing in this qubit
+            pairs = state.reshape(-1, 2, 2 ** qubit)
+            low = pairs[:, 0].copy()
+            pairs[:, 0] = (low + pairs[:, 1]) / np.sqrt(2)
+            pairs[:, 1] = (low - pairs[:, 1]) / np.sqrt(2)
+        return state
+
+    state = hadamard_all(state)
+    for _ in range(steps):
+        state = hadamard_all(state)
+        for control in range(qubits - 1):
+            # CX flips the target bit (control + 1) wherever the control bit is set
+            blocks = state.reshape(-1, 2, 2, 2 ** control)
+            blocks[:, [0, 1], 1] = blocks[:, [1, 0], 1]
+        state = state * phase
+
+    probabilities = np.abs(state) ** 2
+    probabilities /= probabilities.sum()
+    probabilities.flags.writeable = False
+    return probabilities
+
+
+@lru_cache(maxsize=None)
+def aer_walk_probabilities(steps, rotation=WALK_ROTATION, qubits=WALK_QUBITS):
+    """
+    Get the exact measurement distribution of the walk circuit from Aer's
+    matrix product state simulator. Cached per register width, steps and angle.
+    Returns a read-only array of 2**qubits probabilities.
+    """
+    from qiskit import transpile
+    from qiskit_aer import AerSimulator
+    backend = AerSimulator(method="matrix_product_state")
+    qc = walk_circuit(steps, rotation, qubits, measure=False)
+    qc.save_probabilities()
+    result = backend.run(transpile(qc, backend)).result()
+    probabilities = np.asarray(result.data()["probabilities"], dtype=np.float64)
+    probabilities /= probabilities.sum()
+    probabilities.flags.writeable = False
+    return probabilities
+
+
+def register_probabilities(steps, qubits, backend=AER, rotation=WALK_ROTATION):
+    """
+    Get the exact walk distribution over a register of any width.
+    Both results are exact: STATEVECTOR always uses the NumPy statevector,
+    AER uses it for narrow registers and the matrix product state simulator
+    from MPS_MIN_QUBITS on (the walk's state stays weakly entangled, so MPS
+    scales far better).
+    """
+    if backend == AER and qubits >= MPS_MIN_QUBITS:
+        return aer_walk_probabilities(steps, rotation, qubits)
+    if backend not in (AER, STATEVECTOR):
+        raise ValueError(f"Unknown quantum walk backend {backend!r}")
+    return walk_probabilities(steps, rotation, qubits)
+
+
+def statevector_walk(steps, shots, seed=None, rotation=WALK_ROTATION):
+    """Sample the exact walk distribution with NumPy; returns {position: probability}"""
+    counts = np.random.default_rng(seed).multinomial(shots, walk_probabilities(steps, rotation))
+    return {position: count / shots for position, count in enumerate(counts.tolist()) if count}
+
+
+def noisy_backend(profile):
+    """Get the walk backend name for a noise profile (see noise.py)"""
+    return NOISY_PREFIX + profile
+
+
+def noisy_walk(profile, steps, shots, seed=None, rotation=WALK_ROTATION):
+    """Sample a noise profile's precomputed walk distribution; returns {position: probability}"""
+    import noise
+    counts = np.random.default_rng(seed).multinomial(shots, noise.tables(profile).walk(steps, rotation))
+    return {position: count / shots for position, count in enumerate(counts.tolist()) if count}
+
+
+def quantum_walk_backend(name):
+    """Get the walk function for a backend name"""
+    if name == AER:
+        return aer_walk
+    if name == STATEVECTOR:
+        return statevector_walk
+    if name.startswith(NOISY_PREFIX):
+        return partial(noisy_walk, name[len(NOISY_PREFIX):])
+    raise ValueError(f"Unknown quantum walk backend {name!r}")
+
+
+def walk_batch(variants, shots, backend=AER):
+    """
+    Sample many walk variants on a backend.
+    Args:
+        variants: (steps, rotation, seed) tuples
+        shots: shots per variant
+        backend: AER, STATEVECTOR or a noisy_backend()
+    Returns:
+        {position: probability} for each variant, in order
+    """
+    if backend == AER:
+        return aer_walk_batch(variants, shots)
+    walk = quantum_walk_backend(backend)
+    return [walk(steps, shots, seed, rotation) for steps, rotation, seed in variants]
+
+
+def _warm_up(steps):
+    """Import Qiskit, build the simulator and run a tiny job so first use is fast"""
+    try:
+        # Also compiles (and caches) the walk circuit for these steps
+        aer_walk(steps=steps, shots=1, seed=0)
+    finally:
+        _warm.set()
+
+
+def prewarm(steps=1):
+    """
+    Start warming up the Aer backend on a background thread (once).
+    Args:
+        steps: walk length whose circuit to compile ahead of use
+    Returns:
+        The warm-up thread
+    """
+    global _prewarm_thread
+    if _prewarm_thread is None:
+        _prewarm_thread = threading.Thread(target=_warm_up, args=(steps,), name="qiskit-prewarm", daemon=True)
+        _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def is_warm():
+    """Check if the Aer backend has finished warming up"""
+    return _warm.is_set()
@@ -0,0 +1,115 @@
+"""
+Deadline-bound quantum jobs for Pacman
+
+A QuantumExecutor runs simulator jobs on a background thread and hands back
+futures, so the game thread never blocks on a simulator for longer than a
+deadline. A call that misses its deadline takes a classical fallback instead,
+and the miss is counted in the executor's metrics. What happens to the late
+result is fixed per kind of job, never left to timing:
+    measurement  batches of tunneling outcomes are prefetched before the pool
+                 runs dry; a miss is served a classical random bit, and the
+                 late batch is appended to the pool when it arrives
+                 (reconciled: outcomes are still consumed in arrival order)
+    walk         an Aer layout that misses its deadline is replaced by the
+                 statevector sample of the same seed (an exact NumPy
+                 simulation of the walk, no Qiskit), and the late Aer layout
+                 is discarded, so a maze never changes under the player
+Replays log each level whose layout fell back (see replay.COMMAND_WALK_FALLBACK)
+and repeat the miss with a FallbackExecutor for that layout alone.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+MEASUREMENT_DEADLINE = 0.004  # Seconds a tunneling check may wait for a measurement batch
+WALK_DEADLINE = 0.1  # Seconds a new level may wait for its Aer layout
+MEASUREMENT = "measurement"
+WALK = "walk"
+
+
+class QuantumExecutor:
+    """
+    Runs quantum jobs on a background thread with per-call deadlines.
+    A job is waited for once: after it has missed a deadline, later waits on
+    it fall back at once until it finishes.
+    """
+
+    def __init__(self, walk_deadline=WALK_DEADLINE, measurement_deadline=MEASUREMENT_DEADLINE):
+        # One thread: jobs run in submission order and share the simulator
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quantum")
+        self.deadlines = {WALK: walk_deadline, MEASUREMENT: measurement_deadline}
+        self._lock = threading.Lock()  # Late-result callbacks update metrics from the job thread
+        # kind -> counters (see stats())
+        self.metrics = {kind: {"submitted": 0, "fallbacks": 0, "late": 0, "max_wait_ms": 0.0}
+                        for kind in self.deadlines}
+
+    def submit(self, kind, fn, *args):
+        """Start a job in the background; returns its Future"""
+        self.metrics[kind]["submitted"] += 1
+        return self.pool.submit(fn, *args)
+
+    def result(self, kind, future, fallback):
+        """
+        Wait for a job until the kind's deadline.
+        Args:
+            kind: MEASUREMENT or WALK
+            future: from submit()
+            fallback: called for the value to use when the deadline is missed
+        Returns:
+            The job's result, or fallback()'s
+        """
+        if getattr(future, "missed", False) and not future.done():
+            # Already late for an earlier caller: fall back without waiting again
+            with self._lock:
+                self.metrics[kind]["fallbacks"] += 1
+            return fallback()
+        start = time.perf_counter()
+        try:
+            return future.result(timeout=self.deadlines[kind])
+        except TimeoutError:
+            with self._lock:
+                self.metrics[kind]["fallbacks"] += 1
+            future.missed = True
+            future.add_done_callback(lambda _: self._count_late(kind))
+            return fallback()
+        finally:
+            waited = 1000 * (time.perf_counter() - start)
+            self.metrics[kind]["max_wait_ms"] = max(self.metrics[kind]["max_wait_ms"], waited)
+
+    def call(self, kind, fn, args, fallback):
+        """Run a job and wait for it until the deadline (see result())"""
+        return self.result(kind, self.submit(kind, fn, *args), fallback)
+
+    def _count_late(self, kind):
+        """Count a result that arrived after its caller had fallen back"""
+        with self._lock:
+            self.metrics[kind]["late"] += 1
+
+    def fallbacks(self, kind):
+        """Get how many calls of a kind have fallen back so far"""
+        return self.metrics[kind]["fallbacks"]
+
+    def stats(self):
+        """Get the metrics of every kind of job"""
+        with self._lock:
+            return {kind: dict(counters) for kind, counters in self.metrics.items()}
+
+    def close(self):
+        """Stop the job thread, dropping jobs that have not started"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class FallbackExecutor:
+    """Executor that never runs a job: every call takes its fallback (replays use it to repeat misses)"""
+
+    def submit(self, kind, fn, *args):
+        """Jobs are never started"""
+        return None
+
+    def result(self, kind, future, fallback):
+        """Always fall back"""
+        return fallback()
+
+    def call(self, kind, fn, args, fallback):
+        """Always fall back"""
+        return fallback()
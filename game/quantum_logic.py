@@ -1,47 +1,104 @@
 """
 Quantum logic for Pacman using Qiskit for real quantum simulation
+(Qiskit is imported on first use, see quantum_backend.py)
 """
-from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
+import random
+from quantum_backend import simulator
+from quantum_executor import MEASUREMENT
+import noise
 
-# Initialize the quantum simulator
-simulator = AerSimulator()
+# Number of measurements prepared per simulator job
+MEASUREMENT_POOL_SIZE = 1024
 
-def hadamard_measure():
+
+class MeasurementPool:
     """
-    Measures a qubit after applying a Hadamard gate using Qiskit.
-    
-    QUANTUM MECHANICS JUSTIFICATION:
-    Each call creates a new quantum circuit, prepares a fresh qubit in superposition,
-    and performs a measurement. This represents a new quantum interaction each time.
+    Serves Hadamard measurement outcomes from a batch of pre-run shots.
     
-    In quantum mechanics, measuring a qubit collapses it to a definite state. 
-    However, each collision attempt in the game represents preparing a NEW quantum 
-    state and measuring it - like repeatedly preparing |0⟩ → H|0⟩ → measure.
-    This is why we get probabilistic results on each call, not deterministic ones.
+    Every shot is an independent |0⟩ → H|0⟩ → measure preparation, so each
+    outcome is a fresh 50/50 measurement; one simulator job produces a whole
+    batch of them.
+    The unread outcomes and read position are plain data, so game snapshots
+    can save and restore them without touching the simulator.
     
-    The walls exist in quantum superposition (can be passed through OR solid)
-    until Pacman attempts to move through them (observation/measurement).
-    Each movement attempt is a new quantum measurement event.
+    With a noise profile, batches are copied from the profile's precomputed
+    noisy outcomes (see noise.py) at an offset drawn from `rng` instead of
+    running a job.
     
-    Returns:
-        1 or 0 with equal probability (50/50 chance)
-        1 = wall disappears (quantum tunneling successful)
-        0 = wall stays solid (tunneling failed)
+    With an executor (see quantum_executor.py), the next batch is run in the
+    background once the pool runs low, and an empty pool waits for it only
+    until the measurement deadline; a miss is served a classical random bit
+    and the late batch is appended when it arrives.
     """
-    # Create a quantum circuit with 1 qubit and 1 classical bit
-    qc = QuantumCircuit(1, 1)
     
-    # Apply Hadamard gate to put qubit in superposition: |0⟩ → (|0⟩ + |1⟩)/√2
-    qc.h(0)
+    def __init__(self, size=MEASUREMENT_POOL_SIZE, noise_profile=None, executor=None, rng=random):
+        self.size = size
+        self.noise_profile = noise_profile
+        self.rng = rng  # Picks noise table offsets (the game's seeded RNG)
+        # Table batches are copies, not jobs, so only simulator batches go through the executor
+        self.executor = executor if noise_profile is None else None
+        self.pending = None  # Future of the batch running in the background
+        self.outcomes = bytearray()  # One 0/1 outcome per byte
+        self.position = 0
+    
+    def _run_batch(self):
+        """Get a batch of `size` outcomes: one simulator job, or a window of the noise table"""
+        if self.noise_profile is not None:
+            table = noise.tables(self.noise_profile).outcomes
+            start = self.rng.randrange(len(table))
+            outcomes = bytearray(table[start:start + self.size])
+            while len(outcomes) < self.size:
+                outcomes += table[:self.size - len(outcomes)]
+            return outcomes
+        from qiskit import QuantumCircuit
+        qc = QuantumCircuit(1, 1)
+        qc.h(0)
+        qc.measure(0, 0)
+        result = simulator().run(qc, shots=self.size, memory=True).result()
+        return bytearray(int(bit) for bit in result.get_memory())
+    
+    def refill(self):
+        """Run one job with `size` shots and keep every shot's outcome"""
+        self.outcomes = self._run_batch()
+        self.position = 0
+    
+    def _append(self, batch):
+        """Add a batch behind the unread outcomes"""
+        self.outcomes = self.outcomes[self.position:] + batch
+        self.position = 0
+    
+    def next(self):
+        """Get the next measurement outcome (1 = tunneling allowed)"""
+        if self.executor is not None:
+            return self._next_async()
+        if self.position >= len(self.outcomes):
+            self.refill()
+        outcome = self.outcomes[self.position]
+        self.position += 1
+        return outcome
     
-    # Measure the qubit - collapses superposition to definite state
-    qc.measure(0, 0)
+    def _next_async(self):
+        """next() through the executor: never waits longer than the measurement deadline"""
+        if self.pending is not None and self.pending.done():
+            self._append(self.pending.result())
+            self.pending = None
+        if self.pending is None and len(self.outcomes) - self.position <= self.size // 4:
+            self.pending = self.executor.submit(MEASUREMENT, self._run_batch)
+        if self.position >= len(self.outcomes):
+            batch = self.executor.result(MEASUREMENT, self.pending, lambda: None)
+            if batch is None:
+                return random.getrandbits(1)  # Classical fallback; the batch joins the pool when it lands
+            self._append(batch)
+            self.pending = None
+        outcome = self.outcomes[self.position]
+        self.position += 1
+        return outcome
     
-    # Execute the circuit on the simulator
-    job = simulator.run(qc, shots=1)
-    result = job.result()
-    counts = result.get_counts()
+    def remaining(self):
+        """Get the unread outcomes"""
+        return bytes(self.outcomes[self.position:])
     
-    # Return the measured value (0 or 1)
-    return int(list(counts.keys())[0])
\ No newline at end of file
+    def load(self, outcomes):
+        """Replace the pool contents with the given unread outcomes"""
+        self.outcomes = bytearray(outcomes)
+        self.position = 0
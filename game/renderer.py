@@ -4,28 +4,97 @@ Rendering logic for Pacman game
 import pygame
 import math
 from constants import *
+from profiler import profiler
+
+
+class Camera:
+    """Scrolling viewport over the maze, in world pixel coordinates"""
+    
+    def __init__(self, view_width, view_height):
+        self.view_width = view_width
+        self.view_height = view_height
+        # Top-left corner of the viewport in world pixels
+        self.offset_x = 0
+        self.offset_y = 0
+    
+    def follow(self, x, y, maze):
+        """Center the viewport on (x, y), clamped to the maze bounds"""
+        max_x = maze.width * TILE_SIZE - self.view_width
+        max_y = maze.height * TILE_SIZE - self.view_height
+        self.offset_x = int(max(0, min(x - self.view_width // 2, max_x)))
+        self.offset_y = int(max(0, min(y - self.view_height // 2, max_y)))
+    
+    def visible_tiles(self, maze):
+        """Get the (x0, y0, x1, y1) tile range overlapping the viewport (end-exclusive)"""
+        x0 = self.offset_x // TILE_SIZE
+        y0 = self.offset_y // TILE_SIZE
+        x1 = min(maze.width, (self.offset_x + self.view_width) // TILE_SIZE + 1)
+        y1 = min(maze.height, (self.offset_y + self.view_height) // TILE_SIZE + 1)
+        return x0, y0, x1, y1
+    
+    def is_visible(self, x, y, margin=TILE_SIZE):
+        """Check if a world pixel position is inside the viewport (plus margin)"""
+        return (self.offset_x - margin <= x < self.offset_x + self.view_width + margin and
+                self.offset_y - margin <= y < self.offset_y + self.view_height + margin)
 
 
 class Renderer:
     """Handles all game rendering"""
     
-    def __init__(self, screen):
+    def __init__(self, screen, present=True):
         self.screen = screen
+        self.width, self.height = screen.get_size()
+        # Only the part of the maze under the camera is drawn
+        self.camera = Camera(self.width, self.height)
+        # When False, frames are left on the surface instead of flipped to a window
+        self.present = present
         self.font = pygame.font.Font(None, 36)
         self.small_font = pygame.font.Font(None, 24)
+        # Rendered text keyed by label: {key: (text, surface)}
+        # A label is only re-rendered when its text changes (e.g. score)
+        self._text_cache = {}
+        # Full-screen overlays keyed by alpha, built once and reused
+        self._overlays = {}
+        # End screen text surfaces and positions keyed by screen name
+        self._end_screens = {}
+        # Monospace font for the profiler overlay, loaded on first use
+        self.profiler_font = None
+        # Profiler overlay lines, refreshed a few times per second
+        self._profiler_lines = []
+        self._profiler_refresh = 0
         
-    def render(self, game_state):
-        """Render the entire game state"""
+    def render(self, game_state, alpha=1.0):
+        """
+        Render the entire game state
+        Args:
+            game_state: the game to draw
+            alpha: fraction of a simulation tick elapsed since the last update,
+                used to interpolate entity positions between ticks
+        """
+        t = profiler.start()
         self.screen.fill(BLACK)
+        self.camera.follow(*game_state.pacman.get_render_pos(alpha), game_state.maze)
+        profiler.stop("render.clear", t)
         
         # Render each component
+        t = profiler.start()
         self._render_maze(game_state.maze, game_state.pacman)
+        profiler.stop("render.maze", t)
+        
+        t = profiler.start()
         self._render_pellets(game_state.maze)
-        self._render_pacman(game_state.pacman)
+        profiler.stop("render.pellets", t)
         
-        for ghost in game_state.ghosts:
-            self._render_ghost(ghost)
+        t = profiler.start()
+        self._render_pacman(game_state.pacman, alpha)
+        # Only ghosts filed near the viewport (plus a tile of margin) are considered
+        x0, y0, x1, y1 = self.camera.visible_tiles(game_state.maze)
+        for ghost in game_state.ghosts_in_rect(x0 - 1, y0 - 1, x1 + 1, y1 + 1):
+            if self.camera.is_visible(ghost.x, ghost.y):
+                self._render_ghost(ghost, alpha)
+        profiler.stop("render.entities", t)
         
+        t = profiler.start()
         self._render_ui(game_state)
         
         if game_state.game_over:
@@ -34,16 +103,69 @@ class Renderer:
             self._render_win()
         elif game_state.paused:
             self._render_pause()
+        profiler.stop("render.ui", t)
         
-        pygame.display.flip()
+        if profiler.overlay_visible:
+            self._render_profiler()
+        
+        if self.present:
+            t = profiler.start()
+            pygame.display.flip()
+            profiler.stop("render.flip", t)
+    
+    def _get_text(self, key, text, font, color):
+        """Get a rendered text surface, re-rendering only when the text changes"""
+        cached = self._text_cache.get(key)
+        if cached is not None and cached[0] == text:
+            return cached[1]
+        surface = font.render(text, True, color)
+        self._text_cache[key] = (text, surface)
+        return surface
+    
+    def _get_overlay(self, alpha):
+        """Get a full-screen translucent black overlay, built once per alpha"""
+        overlay = self._overlays.get(alpha)
+        if overlay is None:
+            overlay = pygame.Surface((self.width, self.height))
+            overlay.set_alpha(alpha)
+            overlay.fill(BLACK)
+            self._overlays[alpha] = overlay
+        return overlay
+    
+    def _draw_end_screen(self, name, alpha, lines):
+        """
+        Draw an end screen (overlay plus centered text), building its text once.
+        Args:
+            name: cache key for the screen
+            alpha: overlay transparency
+            lines: list of (text, font, color, center_y_offset)
+        """
+        texts = self._end_screens.get(name)
+        if texts is None:
+            texts = []
+            for text, font, color, offset in lines:
+                text_surface = font.render(text, True, color)
+                text_rect = text_surface.get_rect(center=(self.width // 2, self.height // 2 + offset))
+                texts.append((text_surface, text_rect))
+            self._end_screens[name] = texts
+        
+        self.screen.blit(self._get_overlay(alpha), (0, 0))
+        for text_surface, text_rect in texts:
+            self.screen.blit(text_surface, text_rect)
     
     def _render_maze(self, maze, pacman=None):
-        """Render the maze walls"""
-        for y in range(maze.height):
-            for x in range(maze.width):
+        """Render the maze walls inside the viewport"""
+        x0, y0, x1, y1 = self.camera.visible_tiles(maze)
+        ox = self.camera.offset_x
+        oy = self.camera.offset_y
+        for y in range(y0, y1):
+            for x in range(x0, x1):
                 tile = maze.get_tile(x, y)
                 if tile == WALL:
-                    rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                    # Tile corner in screen coordinates
+                    sx = x * TILE_SIZE - ox
+                    sy = y * TILE_SIZE - oy
+                    rect = pygame.Rect(sx, sy, TILE_SIZE, TILE_SIZE)
                     
                     # Check if wall has been measured and locked as passable
                     pos = (x, y)
@@ -70,44 +192,57 @@ class Renderer:
                         for i in range(0, TILE_SIZE, dash_length * 2):
                             # Top border
                             pygame.draw.line(self.screen, CYAN, 
-                                (x * TILE_SIZE + i, y * TILE_SIZE),
-                                (x * TILE_SIZE + i + dash_length, y * TILE_SIZE))
+                                (sx + i, sy),
+                                (sx + i + dash_length, sy))
                             # Bottom border
                             pygame.draw.line(self.screen, CYAN,
-                                (x * TILE_SIZE + i, (y + 1) * TILE_SIZE - 1),
-                                (x * TILE_SIZE + i + dash_length, (y + 1) * TILE_SIZE - 1))
+                                (sx + i, sy + TILE_SIZE - 1),
+                                (sx + i + dash_length, sy + TILE_SIZE - 1))
                             # Left border
                             pygame.draw.line(self.screen, CYAN,
-                                (x * TILE_SIZE, y * TILE_SIZE + i),
-                                (x * TILE_SIZE, y * TILE_SIZE + i + dash_length))
+                                (sx, sy + i),
+                                (sx, sy + i + dash_length))
                             # Right border
                             pygame.draw.line(self.screen, CYAN,
-                                ((x + 1) * TILE_SIZE - 1, y * TILE_SIZE + i),
-                                ((x + 1) * TILE_SIZE - 1, y * TILE_SIZE + i + dash_length))
+                                (sx + TILE_SIZE - 1, sy + i),
+                                (sx + TILE_SIZE - 1, sy + i + dash_length))
                     else:
                         # Wall in superposition (normal state)
                         # Draw as solid blue wall
                         pygame.draw.rect(self.screen, BLUE, rect)
     
+    def _visible_pellets(self, maze, pellets):
+        """Get the pellets from a set that lie inside the viewport"""
+        x0, y0, x1, y1 = self.camera.visible_tiles(maze)
+        if len(pellets) <= (x1 - x0) * (y1 - y0):
+            # Few pellets left: filter the set
+            return [(x, y) for (x, y) in pellets if x0 <= x < x1 and y0 <= y < y1]
+        # Large board: probe only the visible tiles
+        return [(x, y) for y in range(y0, y1) for x in range(x0, x1) if (x, y) in pellets]
+    
     def _render_pellets(self, maze):
         """Render pellets and power pellets"""
+        ox = self.camera.offset_x - TILE_SIZE // 2
+        oy = self.camera.offset_y - TILE_SIZE // 2
+        
         # Regular pellets
-        for (x, y) in maze.pellets:
-            center_x = x * TILE_SIZE + TILE_SIZE // 2
-            center_y = y * TILE_SIZE + TILE_SIZE // 2
+        for (x, y) in self._visible_pellets(maze, maze.pellets):
+            center_x = x * TILE_SIZE - ox
+            center_y = y * TILE_SIZE - oy
             pygame.draw.circle(self.screen, WHITE, (center_x, center_y), 3)
         
         # Power pellets (blinking)
         if pygame.time.get_ticks() % 500 < 250:  # Blink every 500ms
-            for (x, y) in maze.power_pellets:
-                center_x = x * TILE_SIZE + TILE_SIZE // 2
-                center_y = y * TILE_SIZE + TILE_SIZE // 2
+            for (x, y) in self._visible_pellets(maze, maze.power_pellets):
+                center_x = x * TILE_SIZE - ox
+                center_y = y * TILE_SIZE - oy
                 pygame.draw.circle(self.screen, WHITE, (center_x, center_y), 8)
     
-    def _render_pacman(self, pacman):
+    def _render_pacman(self, pacman, alpha=1.0):
         """Render Pacman with mouth animation"""
-        center_x = int(pacman.x)
-        center_y = int(pacman.y)
+        x, y = pacman.get_render_pos(alpha)
+        center_x = int(x) - self.camera.offset_x
+        center_y = int(y) - self.camera.offset_y
         radius = TILE_SIZE // 2 - 2
         
         # Calculate mouth angle based on direction
@@ -140,15 +275,16 @@ class Renderer:
             if len(mouth_points) > 2:
                 pygame.draw.polygon(self.screen, BLACK, mouth_points)
     
-    def _render_ghost(self, ghost):
+    def _render_ghost(self, ghost, alpha=1.0):
         """Render a ghost"""
-        center_x = int(ghost.x)
-        center_y = int(ghost.y)
+        x, y = ghost.get_render_pos(alpha)
+        center_x = int(x) - self.camera.offset_x
+        center_y = int(y) - self.camera.offset_y
         radius = TILE_SIZE // 2 - 2
         
         # Choose color based on mode
         if ghost.mode == FRIGHTENED:
-            if ghost.frightened_timer < FPS * 2:  # Flash white in last 2 seconds
+            if ghost.frightened_timer < TICK_RATE * 2:  # Flash white in last 2 seconds
                 color = WHITE if pygame.time.get_ticks() % 400 < 200 else BLUE
             else:
                 color = BLUE
@@ -158,9 +294,10 @@ class Renderer:
         # Draw entanglement line if ghost is entangled
         if ghost.entangled_with and ghost.mode == FRIGHTENED:
             # Draw line between entangled ghosts
+            partner_x, partner_y = ghost.entangled_with.get_render_pos(alpha)
             pygame.draw.line(self.screen, RED, 
                            (center_x, center_y),
-                           (int(ghost.entangled_with.x), int(ghost.entangled_with.y)), 2)
+                           (int(partner_x) - self.camera.offset_x, int(partner_y) - self.camera.offset_y), 2)
 
         # Draw ghost body (circle for simplicity)
         pygame.draw.circle(self.screen, color, (center_x, center_y), radius)
@@ -188,74 +325,69 @@ class Renderer:
             pygame.draw.circle(self.screen, WHITE, 
                              (center_x + 4, center_y - 2), 2)
     
+    def _render_profiler(self):
+        """Render the profiler overlay (p50/p95/p99 per section, in microseconds)"""
+        if self.profiler_font is None:
+            self.profiler_font = pygame.font.SysFont("monospace", 14)
+        
+        # Percentiles sort the whole window, so don't recompute every frame
+        self._profiler_refresh -= 1
+        if self._profiler_refresh <= 0:
+            self._profiler_lines = [f"{'section':<26}{'p50':>8}{'p95':>8}{'p99':>8}"]
+            for name, (p50, p95, p99, calls) in profiler.summary().items():
+                self._profiler_lines.append(f"{name:<26}{p50 / 1000:8.1f}{p95 / 1000:8.1f}{p99 / 1000:8.1f}")
+            self._profiler_refresh = FPS // 4
+        
+        panel = self._get_overlay(180)
+        line_height = self.profiler_font.get_linesize()
+        self.screen.blit(panel, (0, 40), pygame.Rect(0, 0, self.width, line_height * len(self._profiler_lines) + 8))
+        for i, line in enumerate(self._profiler_lines):
+            text = self._get_text(f"profiler:{i}", line, self.profiler_font, GREEN)
+            self.screen.blit(text, (8, 44 + i * line_height))
+    
     def _render_ui(self, game_state):
         """Render score, lives, and level"""
         # Score
-        score_text = self.font.render(f"Score: {game_state.score}", True, WHITE)
+        score_text = self._get_text("score", f"Score: {game_state.score}", self.font, WHITE)
         self.screen.blit(score_text, (10, 5))
         
         # Level
-        level_text = self.small_font.render(f"Level: {game_state.level}", True, WHITE)
-        self.screen.blit(level_text, (SCREEN_WIDTH - 120, 10))
+        level_text = self._get_text("level", f"Level: {game_state.level}", self.small_font, WHITE)
+        self.screen.blit(level_text, (self.width - 120, 10))
         
         # Lives
-        lives_text = self.small_font.render("Lives:", True, WHITE)
-        self.screen.blit(lives_text, (10, SCREEN_HEIGHT - 30))
+        lives_text = self._get_text("lives", "Lives:", self.small_font, WHITE)
+        self.screen.blit(lives_text, (10, self.height - 30))
         
         for i in range(game_state.pacman.lives):
             x = 80 + i * 30
-            y = SCREEN_HEIGHT - 20
+            y = self.height - 20
             pygame.draw.circle(self.screen, YELLOW, (x, y), 10)
     
     def _render_game_over(self, game_state):
         """Render game over screen"""
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.set_alpha(200)
-        overlay.fill(BLACK)
-        self.screen.blit(overlay, (0, 0))
-        
         # Show different message based on death reason
         if game_state.death_reason == "wall":
-            game_over_text = self.font.render("KILLED BY THE WALL", True, RED)
-            reason_text = self.small_font.render("Quantum trap collapsed!", True, CYAN)
+            self._draw_end_screen("game_over_wall", 200, [
+                ("KILLED BY THE WALL", self.font, RED, -40),
+                ("Quantum trap collapsed!", self.small_font, CYAN, 0),
+                ("Press R to Restart", self.small_font, WHITE, 40),
+            ])
         else:
-            game_over_text = self.font.render("GAME OVER", True, RED)
-            reason_text = None
-        
-        restart_text = self.small_font.render("Press R to Restart", True, WHITE)
-        
-        text_rect = game_over_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 40))
-        restart_rect = restart_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 40))
-        
-        self.screen.blit(game_over_text, text_rect)
-        if reason_text:
-            reason_rect = reason_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-            self.screen.blit(reason_text, reason_rect)
-        self.screen.blit(restart_text, restart_rect)
+            self._draw_end_screen("game_over", 200, [
+                ("GAME OVER", self.font, RED, -40),
+                ("Press R to Restart", self.small_font, WHITE, 40),
+            ])
     
     def _render_win(self):
         """Render win screen"""
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.set_alpha(200)
-        overlay.fill(BLACK)
-        self.screen.blit(overlay, (0, 0))
-        
-        win_text = self.font.render("LEVEL COMPLETE!", True, YELLOW)
-        continue_text = self.small_font.render("Press SPACE to Continue", True, WHITE)
-        
-        text_rect = win_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 30))
-        continue_rect = continue_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 20))
-        
-        self.screen.blit(win_text, text_rect)
-        self.screen.blit(continue_text, continue_rect)
+        self._draw_end_screen("win", 200, [
+            ("LEVEL COMPLETE!", self.font, YELLOW, -30),
+            ("Press SPACE to Continue", self.small_font, WHITE, 20),
+        ])
     
     def _render_pause(self):
         """Render pause screen"""
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.set_alpha(150)
-        overlay.fill(BLACK)
-        self.screen.blit(overlay, (0, 0))
-        
-        pause_text = self.font.render("PAUSED", True, WHITE)
-        text_rect = pause_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-        self.screen.blit(pause_text, text_rect)
+        self._draw_end_screen("pause", 150, [
+            ("PAUSED", self.font, WHITE, 0),
+        ])
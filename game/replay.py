@@ -0,0 +1,286 @@
+"""
+Deterministic input-log recording and replay for Pacman
+
+A replay file holds the game seed, the initial state snapshot and one
+fixed-size record per simulation tick: Pacman's requested direction, the
+number of commands applied before the tick (pause/restart/next level) and of
+quantum measurement outcomes consumed during it, the first outcomes and a
+hash of the state after it. A tick with commands or more outcomes than fit
+in its record is followed by extension records holding the commands in the
+order they were applied and the remaining outcome bits. Records are
+appended as the game runs and can be memory-mapped, so long sessions load
+instantly.
+
+Usage:
+    python replay.py session.emr              # re-simulate at max speed and verify
+    python replay.py session.emr --render     # watch it at normal speed
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import numpy as np
+from constants import *
+from game_state import GameState
+import snapshot
+
+MAGIC = b"EMR2"
+# magic, width, height, seed, initial snapshot length
+HEADER = struct.Struct("<4sIIQI")
+# direction, first measurement outcome bits, command count, measurement count, state hash
+RECORD = struct.Struct("<BBHIQ")
+RECORD_DTYPE = np.dtype([
+    ("direction", "u1"), ("outcomes", "u1"), ("n_commands", "<u2"), ("n_outcomes", "<u4"), ("hash", "<u8"),
+])
+INLINE_OUTCOMES = 8  # Outcome bits held in the tick record itself
+FLUSH_INTERVAL = TICK_RATE  # Ticks between flushes to disk
+
+# Commands, applied before a tick in this order
+COMMAND_PAUSE = 1
+COMMAND_RESET = 2
+COMMAND_NEXT_LEVEL = 4
+# Flag on the commands above: the level's layout they generated missed its
+# deadline and came from the fallback (see quantum_executor.py)
+COMMAND_WALK_FALLBACK = 8
+
+
+class ReplayDivergence(Exception):
+    """Raised when a replayed game stops matching its log"""
+
+
+def apply_commands(game_state, commands):
+    """Apply a command (or a set of command bits) to the game"""
+    # Repeat a recorded deadline miss: only the layout generated by this command takes the fallback
+    game_state.walk_fallback = bool(commands & COMMAND_WALK_FALLBACK)
+    try:
+        if commands & COMMAND_PAUSE:
+            game_state.toggle_pause()
+        if commands & COMMAND_RESET:
+            game_state.reset_game()
+        if commands & COMMAND_NEXT_LEVEL:
+            game_state.next_level()
+    finally:
+        game_state.walk_fallback = False
+
+
+def _data_offset(snapshot_length):
+    """Get the file offset of the first record (8-byte aligned)"""
+    return (HEADER.size + snapshot_length + 7) // 8 * 8
+
+
+def _extension_length(n_commands, n_outcomes):
+    """Get the bytes of commands and overflow outcome bits following a tick record"""
+    return n_commands + (max(0, n_outcomes - INLINE_OUTCOMES) + 7) // 8
+
+
+def _extension_records(n_commands, n_outcomes):
+    """Get the number of extension records following a tick record"""
+    return -(-_extension_length(n_commands, n_outcomes) // RECORD.size)
+
+
+class RecordingMeasurements:
+    """Wraps a MeasurementPool and remembers the outcomes handed out"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.log = []
+
+    def next(self):
+        outcome = self.pool.next()
+        self.log.append(outcome)
+        return outcome
+
+    def remaining(self):
+        return self.pool.remaining()
+
+    def load(self, outcomes):
+        self.pool.load(outcomes)
+
+
+class ScriptedMeasurements:
+    """Hands out the measurement outcomes logged for the current tick"""
+
+    def __init__(self):
+        self.outcomes = []
+
+    def next(self):
+        if not self.outcomes:
+            raise ReplayDivergence("the game measured more walls than were recorded")
+        return self.outcomes.pop(0)
+
+    def remaining(self):
+        return b""
+
+    def load(self, outcomes):
+        pass
+
+
+class Recorder:
+    """Appends one record per tick to a replay file"""
+
+    def __init__(self, path, game_state):
+        self.file = open(path, "wb")
+        initial = snapshot.take(game_state, include_pool=False)
+        self.file.write(HEADER.pack(MAGIC, game_state.maze.width, game_state.maze.height,
+                                    game_state.seed, len(initial)))
+        self.file.write(initial)
+        self.file.write(bytes(_data_offset(len(initial)) - HEADER.size - len(initial)))
+        self.pending_commands = []
+        self.ticks = 0
+
+    def note_command(self, command):
+        """Remember a command applied to the game since the last tick"""
+        self.pending_commands.append(command)
+
+    def step(self, game_state):
+        """Run one tick and log it"""
+        entanglement = game_state.maze.entanglement
+        if not isinstance(entanglement.measurements, RecordingMeasurements):
+            entanglement.measurements = RecordingMeasurements(entanglement.measurements)
+        measurements = entanglement.measurements
+        measurements.log.clear()
+        direction = snapshot.DIRECTION_INDEX[game_state.pacman.next_direction]
+
+        game_state.update()
+
+        outcomes = measurements.log
+        commands = self.pending_commands
+        bits = sum(outcome << i for i, outcome in enumerate(outcomes[:INLINE_OUTCOMES]))
+        self.file.write(RECORD.pack(direction, bits, len(commands), len(outcomes),
+                                    snapshot.state_hash(game_state)))
+        if commands or len(outcomes) > INLINE_OUTCOMES:
+            extension = bytes(commands) + np.packbits(np.array(outcomes[INLINE_OUTCOMES:], dtype=np.uint8),
+                                                      bitorder="little").tobytes()
+            self.file.write(extension.ljust(_extension_records(len(commands), len(outcomes)) * RECORD.size, b"\0"))
+        self.pending_commands = []
+        self.ticks += 1
+        if self.ticks % FLUSH_INTERVAL == 0:
+            self.file.flush()
+
+    def close(self):
+        """Flush and close the replay file"""
+        self.file.close()
+
+
+class Player:
+    """Re-simulates a replay file and checks it tick by tick"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, self.width, self.height, self.seed, snapshot_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a replay file")
+            self.initial = f.read(snapshot_length)
+        # The snapshot header knows the ghost count (swarm games have more than four)
+        self.ghost_count = snapshot.HEADER.unpack_from(self.initial)[11]
+        offset = _data_offset(snapshot_length)
+        count = (os.path.getsize(path) - offset) // RECORD.size
+        # Records are memory-mapped; a partially written last record is ignored
+        self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=offset, shape=(count,)) \
+            if count else np.zeros(0, dtype=RECORD_DTYPE)
+        self.played = 0  # Ticks re-simulated by the last play()
+
+    def new_game(self):
+        """Create the game in the state the recording started from"""
+        game_state = GameState(self.width, self.height, seed=self.seed, ghost_count=self.ghost_count)
+        game_state.restore(self.initial)
+        return game_state
+
+    def ticks(self):
+        """
+        Iterate over the logged ticks.
+        Yields:
+            (direction index, commands in order, measurement outcomes, state hash)
+        """
+        records = self.records
+        rows = records.tolist()
+        i = 0
+        while i < len(rows):
+            direction, bits, n_commands, n_outcomes, expected_hash = rows[i]
+            outcomes = [(bits >> j) & 1 for j in range(min(n_outcomes, INLINE_OUTCOMES))]
+            commands = []
+            extra = _extension_records(n_commands, n_outcomes)
+            if extra:
+                if i + extra >= len(rows):
+                    return  # The extension of the last tick was only partly written
+                extension = records[i + 1:i + 1 + extra].tobytes()
+                commands = list(extension[:n_commands])
+                if n_outcomes > INLINE_OUTCOMES:
+                    overflow = np.frombuffer(extension, dtype=np.uint8, offset=n_commands)
+                    outcomes += np.unpackbits(overflow, bitorder="little")[:n_outcomes - INLINE_OUTCOMES].tolist()
+            yield direction, commands, outcomes, expected_hash
+            i += 1 + extra
+
+    def play(self, renderer=None, speed=1.0):
+        """
+        Replay the log, checking the state hash after every tick.
+        Args:
+            renderer: if given, draw every tick and run at `speed` times real time;
+                otherwise simulate headlessly at maximum speed
+            speed: playback speed multiplier when rendering
+        Returns:
+            The index of the first tick whose state differs from the log, or None
+        """
+        game_state = self.new_game()
+        measurements = ScriptedMeasurements()
+        tick_seconds = 1.0 / (TICK_RATE * speed)
+        next_frame = time.perf_counter()
+
+        self.played = 0
+        for tick, (direction, commands, outcomes, expected_hash) in enumerate(self.ticks()):
+            self.played = tick + 1
+            for command in commands:
+                apply_commands(game_state, command)
+            game_state.pacman.next_direction = snapshot.DIRECTIONS[direction]
+            game_state.maze.entanglement.measurements = measurements
+            measurements.outcomes = outcomes
+            try:
+                game_state.update()
+            except ReplayDivergence:
+                return tick
+            if measurements.outcomes or snapshot.state_hash(game_state) != expected_hash:
+                return tick
+
+            if renderer is not None:
+                renderer.render(game_state)
+                next_frame += tick_seconds
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        return None
+
+
+def main():
+    """Verify or watch a replay file"""
+    parser = argparse.ArgumentParser(description="Replay a recorded EntangleMan session")
+    parser.add_argument("path", help="replay file written with main.py --record")
+    parser.add_argument("--render", action="store_true", help="draw the replay in a window")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed when rendering")
+    args = parser.parse_args()
+
+    player = Player(args.path)
+    renderer = None
+    if args.render:
+        import pygame
+        from renderer import Renderer
+        pygame.init()
+        screen = pygame.display.set_mode((min(SCREEN_WIDTH, player.width * TILE_SIZE),
+                                          min(SCREEN_HEIGHT, player.height * TILE_SIZE)))
+        pygame.display.set_caption("Pacman replay")
+        renderer = Renderer(screen)
+
+    start = time.perf_counter()
+    divergence = player.play(renderer, args.speed)
+    elapsed = time.perf_counter() - start
+    ticks = player.played
+    print(f"{ticks} ticks in {elapsed:.2f}s ({ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+    if divergence is None:
+        print("Replay matches the recording")
+    else:
+        print(f"Replay diverged at tick {divergence}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
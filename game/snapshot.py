@@ -0,0 +1,216 @@
+"""
+Compact binary snapshots of a running Pacman game
+
+A snapshot captures everything needed to fork or rewind a game: the maze
+layout, remaining pellets, measurement locks, Pacman and ghost kinematics,
+modes and timers, entanglement pairs, score/lives/level, the ghost decision
+scheduler's queue state, the game RNG and the unread part of the quantum
+measurement pool. Restoring never runs the quantum simulator.
+"""
+import hashlib
+import struct
+from array import array
+import numpy as np
+from constants import *
+# Directions are stored as their index in DIRECTIONS, as in the entity store
+from entity_store import DIRECTIONS, DIRECTION_INDEX
+
+MAGIC = b"EMS2"
+
+DEATH_REASONS = [None, "ghost", "wall"]
+
+# magic, width, height, score, level, flags, death reason, frightened timer,
+# tick, fluctuation timer, layouts generated, ghosts, locks, pool outcomes
+HEADER = struct.Struct("<4sIIqiBBiqiIHII")
+# x, y, prev_x, prev_y, speed, direction, next direction, pending movement events,
+# lives, mouth_open, mouth_direction
+PACMAN = struct.Struct("<5dBBBbdb")
+# x, y, prev_x, prev_y, speed, direction, next direction, pending movement events,
+# mode, frightened timer, decision timer, target x, target y, entangled partner index (-1 = none)
+GHOST = struct.Struct("<5dBBBBiiiih")
+# AIScheduler: tick, has Pacman tile, Pacman tile x, y, in step with the layout (0 = re-read it)
+SCHEDULER = struct.Struct("<qBqqB")
+# Per ghost, by position in the roster: urgent, tick first deferred (-1 = not waiting),
+# mode at the scheduler's last check (-1 = none yet)
+SCHEDULED_GHOST = struct.Struct("<Bqb")
+# Mersenne Twister state: position plus 624 words, then gauss_next
+RNG_WORDS = 625
+RNG_GAUSS = struct.Struct("<Bd")
+
+
+def _pack_mask(mask, value):
+    """Pack the tiles of a row-major mask equal to `value` as a bitmap"""
+    return np.packbits(np.frombuffer(mask, dtype=np.uint8) == value).tobytes()
+
+
+def take(game_state, include_pool=True):
+    """
+    Get a snapshot of the game as bytes.
+    Args:
+        game_state: the game to capture
+        include_pool: if False, leave out the unread measurement outcomes
+    """
+    maze = game_state.maze
+    width = maze.width
+    # Locks in row-major order so equal games give equal bytes
+    locks = dict(sorted(maze.entanglement.locked_measurements.items(), key=lambda item: (item[0][1], item[0][0])))
+    pool = maze.entanglement.measurements.remaining() if include_pool else b""
+    ghosts = game_state.ghosts
+    ghost_index = {id(ghost): i for i, ghost in enumerate(ghosts)}
+
+    parts = [
+        HEADER.pack(
+            MAGIC, width, maze.height, game_state.score, game_state.level,
+            game_state.game_over | game_state.won << 1 | game_state.paused << 2,
+            DEATH_REASONS.index(game_state.death_reason),
+            game_state.frightened_timer, game_state.tick, game_state.fluctuation_timer,
+            game_state.layout_index, len(ghosts), len(locks), len(pool),
+        ),
+        maze.layout_bytes(),
+        _pack_mask(maze.pellet_mask, PELLET),
+        _pack_mask(maze.pellet_mask, POWER_PELLET),
+        array("I", [y * width + x for (x, y) in locks]).tobytes(),
+        np.packbits(np.fromiter(locks.values(), dtype=bool, count=len(locks))).tobytes(),
+        np.packbits(np.frombuffer(pool, dtype=np.uint8)).tobytes(),
+    ]
+
+    pacman = game_state.pacman
+    parts.append(PACMAN.pack(
+        pacman.x, pacman.y, pacman.prev_x, pacman.prev_y, pacman.speed,
+        DIRECTION_INDEX[pacman.direction], DIRECTION_INDEX[pacman.next_direction], pacman.events,
+        pacman.lives, pacman.mouth_open, pacman.mouth_direction,
+    ))
+    for ghost in ghosts:
+        partner = ghost_index[id(ghost.entangled_with)] if ghost.entangled_with else -1
+        parts.append(GHOST.pack(
+            ghost.x, ghost.y, ghost.prev_x, ghost.prev_y, ghost.speed,
+            DIRECTION_INDEX[ghost.direction], DIRECTION_INDEX[ghost.next_direction], ghost.events,
+            ghost.mode, ghost.frightened_timer, ghost.decision_timer,
+            ghost.target[0], ghost.target[1], partner,
+        ))
+
+    # Scheduler state is keyed by store slot; it is stored in roster order
+    ai = game_state.ai
+    pacman_tile = ai.pacman_tile or (0, 0)
+    parts.append(SCHEDULER.pack(ai.tick, ai.pacman_tile is not None, pacman_tile[0], pacman_tile[1],
+                                ai.layout_version is not None and ai.layout_version == maze.layout_version))
+    for ghost in ghosts:
+        parts.append(SCHEDULED_GHOST.pack(ghost.slot in ai.urgent, ai.waiting.get(ghost.slot, -1),
+                                          ai.modes.get(ghost.slot, -1)))
+
+    _, words, gauss_next = game_state.rng.getstate()
+    parts.append(array("I", words).tobytes())
+    parts.append(RNG_GAUSS.pack(gauss_next is not None, gauss_next or 0.0))
+    return b"".join(parts)
+
+
+def restore(game_state, data):
+    """
+    Restore a game from a snapshot taken with take().
+    The game must have the same maze size and ghost roster.
+    """
+    view = memoryview(data)
+    (magic, width, height, score, level, flags, death_reason, frightened_timer,
+     tick, fluctuation_timer, layout_index, n_ghosts, n_locks, n_pool) = HEADER.unpack_from(view)
+    maze = game_state.maze
+    if magic != MAGIC:
+        raise ValueError("Not a game snapshot")
+    if (width, height) != (maze.width, maze.height) or n_ghosts != len(game_state.ghosts):
+        raise ValueError("Snapshot was taken from a game with a different maze size or ghost count")
+    offset = HEADER.size
+
+    def take_bytes(size):
+        nonlocal offset
+        chunk = view[offset:offset + size]
+        offset += size
+        return chunk
+
+    # Maze: only rebuild the layout if it differs from the current one
+    layout = take_bytes(width * height)
+    if maze.layout_bytes() != layout:
+        maze.load_layout_bytes(layout)
+    # Pellets: rebuild the mask from both bitmaps, then update only changed tiles
+    tiles = width * height
+    bitmap_size = (tiles + 7) // 8
+    pellets = np.unpackbits(np.frombuffer(take_bytes(bitmap_size), dtype=np.uint8), count=tiles)
+    power_pellets = np.unpackbits(np.frombuffer(take_bytes(bitmap_size), dtype=np.uint8), count=tiles)
+    maze.load_pellet_mask((pellets * PELLET + power_pellets * POWER_PELLET).tobytes())
+    lock_positions = np.frombuffer(take_bytes(4 * n_locks), dtype=np.uint32).tolist()
+    lock_values = np.unpackbits(np.frombuffer(take_bytes((n_locks + 7) // 8), dtype=np.uint8), count=n_locks)
+    maze.entanglement.locked_measurements = {
+        (i % width, i // width): bool(value) for i, value in zip(lock_positions, lock_values.tolist())
+    }
+    pool = np.unpackbits(np.frombuffer(take_bytes((n_pool + 7) // 8), dtype=np.uint8), count=n_pool)
+    maze.entanglement.measurements.load(pool.tobytes())
+
+    # Pacman
+    pacman = game_state.pacman
+    (pacman.x, pacman.y, pacman.prev_x, pacman.prev_y, pacman.speed, direction, next_direction,
+     events, pacman.lives, pacman.mouth_open, pacman.mouth_direction) = PACMAN.unpack_from(view, offset)
+    pacman.events = events  # Setting x and y flagged a move; keep only what was pending
+    pacman.direction = DIRECTIONS[direction]
+    pacman.next_direction = DIRECTIONS[next_direction]
+    offset += PACMAN.size
+
+    # Ghosts (partners are linked after all ghosts are restored)
+    partners = []
+    for ghost in game_state.ghosts:
+        (ghost.x, ghost.y, ghost.prev_x, ghost.prev_y, ghost.speed, direction, next_direction, ghost.events,
+         ghost.mode, ghost.frightened_timer, ghost.decision_timer, target_x, target_y,
+         partner) = GHOST.unpack_from(view, offset)
+        ghost.direction = DIRECTIONS[direction]
+        ghost.next_direction = DIRECTIONS[next_direction]
+        ghost.target = (target_x, target_y)
+        partners.append(partner)
+        offset += GHOST.size
+    for ghost, partner in zip(game_state.ghosts, partners):
+        ghost.entangled_with = game_state.ghosts[partner] if partner >= 0 else None
+
+    # Scheduler (requests are always served within the tick, so there are none to restore)
+    ai = game_state.ai
+    tick_count, has_tile, tile_x, tile_y, in_step = SCHEDULER.unpack_from(view, offset)
+    offset += SCHEDULER.size
+    ai.requests = []
+    ai.tick = tick_count
+    ai.pacman_tile = (tile_x, tile_y) if has_tile else None
+    # The layout version itself is per maze object: only whether the scheduler was up to date carries over
+    ai.layout_version = maze.layout_version if in_step else None
+    ai.urgent = set()
+    ai.waiting = {}
+    ai.modes = {}
+    for ghost in game_state.ghosts:
+        urgent, waiting, mode = SCHEDULED_GHOST.unpack_from(view, offset)
+        offset += SCHEDULED_GHOST.size
+        if urgent:
+            ai.urgent.add(ghost.slot)
+        if waiting >= 0:
+            ai.waiting[ghost.slot] = waiting
+        if mode >= 0:
+            ai.modes[ghost.slot] = mode
+
+    # RNG
+    words = tuple(np.frombuffer(take_bytes(4 * RNG_WORDS), dtype=np.uint32).tolist())
+    has_gauss, gauss_next = RNG_GAUSS.unpack_from(view, offset)
+    game_state.rng.setstate((3, words, gauss_next if has_gauss else None))
+
+    # Game progress
+    game_state.score = score
+    game_state.level = level
+    game_state.game_over = bool(flags & 1)
+    game_state.won = bool(flags & 2)
+    game_state.paused = bool(flags & 4)
+    game_state.death_reason = DEATH_REASONS[death_reason]
+    game_state.frightened_timer = frightened_timer
+    game_state.tick = tick
+    game_state.fluctuation_timer = fluctuation_timer
+    game_state.layout_index = layout_index
+
+
+def state_hash(game_state):
+    """
+    Get a 64-bit hash of the game state.
+    Pre-sampled measurement outcomes are left out: only outcomes actually
+    consumed (and therefore logged by a replay recorder) affect the game.
+    """
+    digest = hashlib.blake2b(take(game_state, include_pool=False), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
@@ -0,0 +1,203 @@
+"""
+Soak test for Pacman: long headless runs with memory and leak tracking
+
+Scripted games run for millions of ticks through deaths, game overs, wall
+fluctuations and levels (a level is cleared after LEVEL_TICKS the way a
+kiosk player would eventually clear it), rendering offscreen now and then.
+Every --sample-every ticks the soak records the traced Python heap
+(tracemalloc), the process RSS and counters that must stay bounded:
+measurement locks, ghosts whose entanglement partner is stale, live objects.
+Growth is measured from a baseline taken after a warm-up, so caches that
+fill once (compiled circuits, text surfaces, walk tables) don't count, and
+the largest growth is reported by allocation site. The soak fails (exit
+status 1) when traced or RSS growth exceeds its limit or a stale partner
+turns up.
+
+Usage:
+    python soak.py                                  # 1M ticks (about 4.6 hours of play)
+    python soak.py --ticks 5000000 --report soak.json
+    python soak.py --ticks 200000 --render-every 1  # render every tick (per-frame surfaces)
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+# The dummy driver must be selected before pygame initializes its display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from constants import *
+from game_state import GameState
+from offscreen import OffscreenRenderer
+
+SOAK_TICKS = 1_000_000
+SAMPLE_EVERY = 50_000  # Ticks between memory samples
+WARMUP_TICKS = 20_000  # Ticks before the baseline sample
+LEVEL_TICKS = 18_000  # Ticks spent on a level before clearing it (5 minutes)
+RENDER_EVERY = 60  # Ticks between offscreen frames (0 = never render)
+INPUT_PERIOD = 25  # Ticks between the scripted player's turns
+TRACED_LIMIT_MB = 8.0  # Allowed traced heap growth over the baseline
+RSS_LIMIT_MB = 64.0  # Allowed RSS growth over the baseline (includes fragmentation)
+TOP_SITES = 10  # Allocation sites listed in the report
+# Allocations by the import system and tracemalloc itself are not the game's
+IGNORED = [tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+           tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+           tracemalloc.Filter(False, tracemalloc.__file__),
+           tracemalloc.Filter(False, "<unknown>")]
+
+
+def rss_bytes():
+    """Get the resident set size of this process (the peak instead where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, KiB elsewhere
+
+
+def stale_partners(game_state):
+    """Count ghosts whose entangled_with is not a current ghost pointing back at them"""
+    ghosts = set(map(id, game_state.ghosts))
+    return sum(1 for ghost in game_state.ghosts
+               if ghost.entangled_with is not None
+               and (id(ghost.entangled_with) not in ghosts or ghost.entangled_with.entangled_with is not ghost))
+
+
+class Soak:
+    """A scripted headless game with memory sampling"""
+
+    def __init__(self, seed=0, width=MAZE_WIDTH, height=MAZE_HEIGHT, render_every=RENDER_EVERY,
+                 level_ticks=LEVEL_TICKS):
+        self.game_state = GameState(width, height, seed=seed)
+        self.input_rng = random.Random(seed)  # The player's turns (separate from the game's RNG)
+        self.renderer = OffscreenRenderer() if render_every else None
+        self.render_every = render_every
+        self.level_ticks = level_ticks
+        self.ticks = 0
+        self.games = 1
+        self.levels = 1
+        self.frames = 0
+        self.baseline = None  # (tracemalloc snapshot, traced bytes, RSS) after the warm-up
+        self.samples = []
+
+    def run(self, ticks):
+        """Advance the soak by a number of ticks"""
+        game_state = self.game_state
+        for _ in range(ticks):
+            self.ticks += 1
+            if self.ticks % INPUT_PERIOD == 0:
+                game_state.pacman.set_next_direction(self.input_rng.choice([UP, DOWN, LEFT, RIGHT]))
+            game_state.update()
+            if game_state.game_over:
+                game_state.reset_game()
+                self.games += 1
+            elif game_state.won or self.ticks % self.level_ticks == 0:
+                game_state.next_level()
+                self.levels += 1
+            if self.renderer is not None and self.ticks % self.render_every == 0:
+                self.renderer.render(game_state)
+                self.frames += 1
+
+    def sample(self):
+        """Record memory and counters now; the first sample becomes the baseline"""
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+        traced = sum(stat.size for stat in snapshot.statistics("filename"))
+        rss = rss_bytes()
+        if self.baseline is None:
+            self.baseline = (snapshot, traced, rss)
+        _, base_traced, base_rss = self.baseline
+        sample = {
+            "tick": self.ticks,
+            "traced_mb": traced / 2 ** 20,
+            "traced_growth_mb": (traced - base_traced) / 2 ** 20,
+            "rss_mb": rss / 2 ** 20,
+            "rss_growth_mb": (rss - base_rss) / 2 ** 20,
+            "locks": len(self.game_state.maze.entanglement.locked_measurements),
+            "stale_partners": stale_partners(self.game_state),
+            "objects": len(gc.get_objects()),
+            "games": self.games,
+            "levels": self.levels,
+        }
+        self.samples.append(sample)
+        return sample, snapshot
+
+    def growth_sites(self, snapshot, count=TOP_SITES):
+        """Get the allocation sites that grew most since the baseline: (file:line, KiB, blocks)"""
+        sites = []
+        for stat in snapshot.compare_to(self.baseline[0], "lineno")[:count]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            sites.append((f"{frame.filename}:{frame.lineno}", stat.size_diff / 1024, stat.count_diff))
+        return sites
+
+
+def main():
+    """Run a soak and report whether memory stayed flat"""
+    parser = argparse.ArgumentParser(description="EntangleMan long-running soak test")
+    parser.add_argument("--ticks", type=int, default=SOAK_TICKS, help="ticks to run after the warm-up")
+    parser.add_argument("--sample-every", type=int, default=SAMPLE_EVERY, help="ticks between memory samples")
+    parser.add_argument("--warmup", type=int, default=WARMUP_TICKS, help="ticks before the baseline sample")
+    parser.add_argument("--seed", type=int, default=0, help="game seed")
+    parser.add_argument("--width", type=int, default=MAZE_WIDTH, help="maze width in tiles")
+    parser.add_argument("--height", type=int, default=MAZE_HEIGHT, help="maze height in tiles")
+    parser.add_argument("--render-every", type=int, default=RENDER_EVERY,
+                        help="ticks between offscreen frames (0 = never render)")
+    parser.add_argument("--level-ticks", type=int, default=LEVEL_TICKS, help="ticks before a level is cleared")
+    parser.add_argument("--traced-limit", type=float, default=TRACED_LIMIT_MB,
+                        help="allowed traced heap growth in MiB")
+    parser.add_argument("--rss-limit", type=float, default=RSS_LIMIT_MB, help="allowed RSS growth in MiB")
+    parser.add_argument("--report", help="also write the samples and growth sites to this JSON file")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    soak = Soak(args.seed, args.width, args.height, args.render_every, args.level_ticks)
+    start = time.perf_counter()
+    soak.run(args.warmup)
+    _, snapshot = soak.sample()
+
+    print(f"{'tick':>9} {'traced MB':>10} {'growth':>8} {'RSS MB':>8} {'growth':>8} {'locks':>6} "
+          f"{'stale':>6} {'objects':>8} {'games':>6} {'levels':>7}")
+    remaining = args.ticks
+    while remaining > 0:
+        soak.run(min(args.sample_every, remaining))
+        remaining -= min(args.sample_every, remaining)
+        sample, snapshot = soak.sample()
+        print(f"{sample['tick']:9d} {sample['traced_mb']:10.2f} {sample['traced_growth_mb']:+8.2f} "
+              f"{sample['rss_mb']:8.1f} {sample['rss_growth_mb']:+8.1f} {sample['locks']:6d} "
+              f"{sample['stale_partners']:6d} {sample['objects']:8d} {sample['games']:6d} {sample['levels']:7d}")
+    elapsed = time.perf_counter() - start
+
+    sites = soak.growth_sites(snapshot)
+    print(f"\n{soak.ticks} ticks ({soak.ticks / TICK_RATE / 3600:.1f} hours of play) in {elapsed:.0f}s, "
+          f"{soak.games} games, {soak.levels} levels, {soak.frames} frames rendered")
+    print("Largest growth since the baseline by allocation site:")
+    for site, kib, blocks in sites:
+        print(f"  {kib:+10.1f} KiB {blocks:+8d} blocks  {site}")
+
+    final = soak.samples[-1]
+    failures = []
+    if final["traced_growth_mb"] > args.traced_limit:
+        failures.append(f"traced heap grew {final['traced_growth_mb']:.2f} MiB (limit {args.traced_limit})")
+    if final["rss_growth_mb"] > args.rss_limit:
+        failures.append(f"RSS grew {final['rss_growth_mb']:.1f} MiB (limit {args.rss_limit})")
+    if any(sample["stale_partners"] for sample in soak.samples):
+        failures.append("ghosts kept stale entanglement partners")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"ticks": soak.ticks, "seconds": elapsed, "samples": soak.samples,
+                       "growth_sites": sites, "failures": failures}, f, indent=2)
+    print("FAIL: " + "; ".join(failures) if failures else "PASS: memory stayed within limits")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
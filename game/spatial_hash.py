@@ -0,0 +1,90 @@
+"""
+Uniform-grid spatial hash over tile coordinates
+
+Entities from an EntityStore are bucketed by the grid cell (a square of
+SPATIAL_CELL_TILES tiles) they are in. sync() recomputes every entity's cell
+in one vectorized pass and only touches the buckets of entities that crossed
+into a new cell, so keeping the hash current costs almost nothing when few
+entities move between cells. Queries return entity slots in ascending order,
+which is the order the entities were created in.
+"""
+import numpy as np
+from constants import *
+
+SPATIAL_CELL_TILES = 4  # Cell edge length in tiles
+
+
+class SpatialHash:
+    """Buckets of entity slots keyed by grid cell"""
+
+    def __init__(self, store, slots, cell_tiles=SPATIAL_CELL_TILES):
+        """
+        Args:
+            store: the EntityStore holding the positions
+            slots: index array of the entities to track
+            cell_tiles: cell edge length in tiles
+        """
+        self.store = store
+        self.slots = np.asarray(slots, dtype=np.intp)
+        self.slot_list = self.slots.tolist()
+        self.cell_pixels = cell_tiles * TILE_SIZE
+        self.buckets = {}  # (cell x, cell y) -> set of slots
+        # Cell each tracked entity is currently filed under
+        self.cell_x = np.zeros(len(self.slots), dtype=np.int64)
+        self.cell_y = np.zeros(len(self.slots), dtype=np.int64)
+        self.rebuild()
+
+    def _cells(self):
+        """Get the current cell of every tracked entity"""
+        cell_x = (self.store.x[self.slots] // self.cell_pixels).astype(np.int64)
+        cell_y = (self.store.y[self.slots] // self.cell_pixels).astype(np.int64)
+        return cell_x, cell_y
+
+    def rebuild(self):
+        """Re-file every entity from scratch"""
+        self.cell_x, self.cell_y = self._cells()
+        self.buckets.clear()
+        for slot, cell in zip(self.slot_list, zip(self.cell_x.tolist(), self.cell_y.tolist())):
+            self.buckets.setdefault(cell, set()).add(slot)
+
+    def sync(self):
+        """Move entities that crossed into another cell since the last sync"""
+        cell_x, cell_y = self._cells()
+        moved = np.flatnonzero((cell_x != self.cell_x) | (cell_y != self.cell_y))
+        if len(moved) == 0:
+            return
+        buckets = self.buckets
+        for i, old_x, old_y, new_x, new_y in zip(moved.tolist(), self.cell_x[moved].tolist(), self.cell_y[moved].tolist(),
+                                                 cell_x[moved].tolist(), cell_y[moved].tolist()):
+            slot = self.slot_list[i]
+            bucket = buckets[(old_x, old_y)]
+            bucket.discard(slot)
+            if not bucket:
+                del buckets[(old_x, old_y)]
+            buckets.setdefault((new_x, new_y), set()).add(slot)
+        self.cell_x = cell_x
+        self.cell_y = cell_y
+
+    def in_rect(self, x0, y0, x1, y1):
+        """
+        Get the slots of entities that may be inside a tile rectangle.
+        Args:
+            x0, y0: top-left tile (inclusive)
+            x1, y1: bottom-right tile (exclusive)
+        Returns:
+            Sorted slots of every entity in a cell overlapping the rectangle
+        """
+        cell_tiles = self.cell_pixels // TILE_SIZE
+        found = []
+        buckets = self.buckets
+        for cell_y in range(y0 // cell_tiles, (y1 - 1) // cell_tiles + 1):
+            for cell_x in range(x0 // cell_tiles, (x1 - 1) // cell_tiles + 1):
+                bucket = buckets.get((cell_x, cell_y))
+                if bucket:
+                    found.extend(bucket)
+        found.sort()
+        return found
+
+    def near(self, tile_x, tile_y, radius=1):
+        """Get the slots of entities that may be within `radius` tiles of a tile"""
+        return self.in_rect(tile_x - radius, tile_y - radius, tile_x + radius + 1, tile_y + radius + 1)
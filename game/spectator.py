@@ -0,0 +1,569 @@
+"""
+Live spectator streaming for Pacman
+
+An asyncio TCP server broadcasts a running game to any number of viewers.
+Every tick becomes one length-prefixed frame:
+    keyframe  - a full state snapshot (see snapshot.py), sent periodically,
+                whenever the game is rebuilt, and to viewers that fell behind
+    delta     - only what changed since the previous tick: progress fields,
+                moved entities, pellet changes, lock changes, the tiles a
+                wall fluctuation changed, and the whole layout only when it
+                was replaced (a new level)
+Each viewer has a bounded frame queue. A viewer too slow to keep up loses
+frames (and skips deltas until the next keyframe) instead of stalling the
+game or the other viewers.
+
+Usage:
+    python spectator.py serve --port 8765          # headless autoplay game
+    python main.py --spectate 8765                 # broadcast the game you play
+    python spectator.py watch localhost:8765 --render
+    python spectator.py bench --viewers 8          # bandwidth and encode cost
+"""
+import argparse
+import asyncio
+import random
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from constants import *
+from game_state import GameState
+import snapshot
+
+SPECTATOR_PORT = 8765
+KEYFRAME_INTERVAL = 2 * TICK_RATE  # Ticks between keyframes
+CLIENT_QUEUE_FRAMES = TICK_RATE  # Frames buffered per viewer before dropping
+WRITE_BUFFER_BYTES = 4 * 1024  # Unsent bytes per viewer before the queue stops draining
+
+# Frame: payload length, kind
+FRAME = struct.Struct("<IB")
+KEYFRAME = 1
+DELTA = 2
+# Keyframe payload: tick, then a snapshot
+KEYFRAME_HEADER = struct.Struct("<Q")
+# tick, score, level, flags, death reason, lives, frightened timer, fluctuation timer,
+# moved entities, pellet changes, locks set, locks cleared, partner list length, changed tiles, layout bytes
+DELTA_HEADER = struct.Struct("<QqiBBiiiHIIIHII")
+ENTITY_DTYPE = np.dtype([("slot", "<u2"), ("x", "<f4"), ("y", "<f4"), ("direction", "u1"), ("mode", "u1")])
+
+
+def _flags(game_state):
+    """Pack the game's status flags"""
+    return game_state.game_over | game_state.won << 1 | game_state.paused << 2
+
+
+class DeltaEncoder:
+    """Turns successive game states into keyframe and delta frames"""
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.ticks_since_keyframe = 0
+        self.maze = None  # Objects a delta was last taken against
+        self.entities = None
+        # Copies of the state sent last
+        self.columns = None
+        self.pellet_mask = None
+        self.locks = None
+        self.layout_version = None
+        self.partners = None
+        self.frame_count = 0
+
+    def _partners(self, game_state):
+        """Get each ghost's entangled partner index (-1 = none)"""
+        index = {id(ghost): i for i, ghost in enumerate(game_state.ghosts)}
+        return [index[id(ghost.entangled_with)] if ghost.entangled_with else -1 for ghost in game_state.ghosts]
+
+    def _remember(self, game_state):
+        """Keep copies of the state just sent"""
+        maze = game_state.maze
+        store = game_state.entities
+        count = store.count
+        self.maze = maze
+        self.entities = store
+        self.columns = (store.x[:count].copy(), store.y[:count].copy(),
+                        store.direction[:count].copy(), store.mode[:count].copy())
+        self.pellet_mask = np.frombuffer(maze.pellet_mask, dtype=np.uint8).copy()
+        self.locks = dict(maze.entanglement.locked_measurements)
+        self.layout_version = maze.layout_version
+        self.partners = self._partners(game_state)
+
+    def encode(self, game_state, keyframe=False):
+        """
+        Encode the current tick as a frame.
+        Args:
+            game_state: the game to encode
+            keyframe: force a keyframe
+        Returns:
+            (kind, frame bytes including the frame header)
+        """
+        self.frame_count += 1
+        rebuilt = game_state.maze is not self.maze or game_state.entities is not self.entities
+        if keyframe or rebuilt or self.ticks_since_keyframe >= self.keyframe_interval:
+            return KEYFRAME, self._keyframe(game_state)
+        self.ticks_since_keyframe += 1
+        return DELTA, self._delta(game_state)
+
+    def _keyframe(self, game_state):
+        """Encode a full snapshot"""
+        payload = KEYFRAME_HEADER.pack(game_state.tick) + snapshot.take(game_state, include_pool=False)
+        self._remember(game_state)
+        self.ticks_since_keyframe = 0
+        return FRAME.pack(len(payload), KEYFRAME) + payload
+
+    def _delta(self, game_state):
+        """Encode the changes since the previous frame"""
+        maze = game_state.maze
+        store = game_state.entities
+        count = store.count
+        old_x, old_y, old_direction, old_mode = self.columns
+        x, y = store.x[:count], store.y[:count]
+        direction, mode = store.direction[:count], store.mode[:count]
+
+        # Entities whose position, direction or mode changed
+        moved = np.flatnonzero((x != old_x) | (y != old_y) | (direction != old_direction) | (mode != old_mode))
+        entities = np.empty(len(moved), dtype=ENTITY_DTYPE)
+        entities["slot"] = moved
+        entities["x"] = x[moved]
+        entities["y"] = y[moved]
+        entities["direction"] = direction[moved]
+        entities["mode"] = mode[moved]
+
+        # Pellet tiles that changed (eaten, or refilled for a new level)
+        mask = np.frombuffer(maze.pellet_mask, dtype=np.uint8)
+        pellet_tiles = np.flatnonzero(mask != self.pellet_mask).astype(np.uint32)
+
+        # Lock changes as row-major tile indices
+        width = maze.width
+        locks = maze.entanglement.locked_measurements
+        old_locks = self.locks
+        lock_set = [(tile_y * width + tile_x, value) for (tile_x, tile_y), value in locks.items()
+                    if old_locks.get((tile_x, tile_y)) != value]
+        lock_cleared = [tile_y * width + tile_x for (tile_x, tile_y) in old_locks if (tile_x, tile_y) not in locks]
+
+        partners = self._partners(game_state)
+        partners = partners if partners != self.partners else []
+        # Layout: the changed tiles after a fluctuation, everything after a replacement
+        changes = maze.changes_since(self.layout_version)
+        layout = maze.layout_bytes() if changes is None else b""
+        layout_tiles = np.array([y * width + x for x, y in changes[1]] if changes else [], dtype=np.uint32)
+        layout_values = np.array([maze.layout[y][x] for x, y in changes[1]] if changes else [], dtype=np.int8)
+
+        pacman = game_state.pacman
+        parts = [
+            DELTA_HEADER.pack(
+                game_state.tick, game_state.score, game_state.level, _flags(game_state),
+                snapshot.DEATH_REASONS.index(game_state.death_reason), pacman.lives,
+                game_state.frightened_timer, game_state.fluctuation_timer,
+                len(entities), len(pellet_tiles), len(lock_set), len(lock_cleared), len(partners), len(layout_tiles), len(layout),
+            ),
+            entities.tobytes(),
+            pellet_tiles.tobytes(),
+            mask[pellet_tiles].tobytes(),
+            np.array([i for i, _ in lock_set], dtype=np.uint32).tobytes(),
+            bytes(value for _, value in lock_set),
+            np.array(lock_cleared, dtype=np.uint32).tobytes(),
+            np.array(partners, dtype=np.int16).tobytes(),
+            layout_tiles.tobytes(),
+            layout_values.tobytes(),
+            layout,
+        ]
+        payload = b"".join(parts)
+
+        # Remember what was sent (only the changed parts)
+        old_x[moved] = x[moved]
+        old_y[moved] = y[moved]
+        old_direction[moved] = direction[moved]
+        old_mode[moved] = mode[moved]
+        self.pellet_mask[pellet_tiles] = mask[pellet_tiles]
+        if lock_set or lock_cleared:
+            self.locks = dict(locks)
+        if partners:
+            self.partners = partners
+        self.layout_version = maze.layout_version
+        return FRAME.pack(len(payload), DELTA) + payload
+
+
+class SpectatorView:
+    """Rebuilds a viewable GameState from received frames"""
+
+    def __init__(self):
+        self.game_state = None
+        self.tick = 0
+
+    def apply(self, kind, payload):
+        """Apply one frame payload"""
+        if kind == KEYFRAME:
+            self._apply_keyframe(payload)
+        elif self.game_state is not None:
+            self._apply_delta(payload)
+
+    def _apply_keyframe(self, payload):
+        """Replace the local game with a snapshot"""
+        (self.tick,) = KEYFRAME_HEADER.unpack_from(payload)
+        data = payload[KEYFRAME_HEADER.size:]
+        (_, width, height, *_, n_ghosts, _, _) = snapshot.HEADER.unpack_from(data)
+        game_state = self.game_state
+        if (game_state is None or (game_state.maze.width, game_state.maze.height) != (width, height)
+                or len(game_state.ghosts) != n_ghosts):
+            # Any seed will do: the snapshot replaces the layout and everything else
+            game_state = self.game_state = GameState(width, height, seed=0, ghost_count=n_ghosts)
+        game_state.restore(data)
+
+    def _apply_delta(self, payload):
+        """Apply the changes of one tick"""
+        game_state = self.game_state
+        maze = game_state.maze
+        view = memoryview(payload)
+        (self.tick, game_state.score, game_state.level, flags, death_reason, game_state.pacman.lives,
+         game_state.frightened_timer, game_state.fluctuation_timer, n_entities, n_pellets, n_lock_set,
+         n_lock_cleared, n_partners, n_layout_tiles, layout_length) = DELTA_HEADER.unpack_from(view)
+        game_state.tick = self.tick
+        game_state.game_over = bool(flags & 1)
+        game_state.won = bool(flags & 2)
+        game_state.paused = bool(flags & 4)
+        game_state.death_reason = snapshot.DEATH_REASONS[death_reason]
+        offset = DELTA_HEADER.size
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(view, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        store = game_state.entities
+        store.save_previous()  # Interpolate from the last received positions
+        entities = take(ENTITY_DTYPE, n_entities)
+        slots = entities["slot"].astype(np.intp)
+        store.x[slots] = entities["x"]
+        store.y[slots] = entities["y"]
+        store.direction[slots] = entities["direction"]
+        store.mode[slots] = entities["mode"]
+        for ghost in game_state.ghosts:
+            if ghost.mode == FRIGHTENED:
+                ghost.frightened_timer = game_state.frightened_timer  # Close enough for flashing
+
+        pellet_tiles = take(np.uint32, n_pellets)
+        pellet_values = take(np.uint8, n_pellets)
+        if n_pellets:
+            mask = np.frombuffer(maze.pellet_mask, dtype=np.uint8).copy()
+            mask[pellet_tiles] = pellet_values
+            maze.load_pellet_mask(mask.tobytes())
+
+        width = maze.width
+        locks = maze.entanglement.locked_measurements
+        lock_set = take(np.uint32, n_lock_set).tolist()
+        lock_values = take(np.uint8, n_lock_set).tolist()
+        for i, value in zip(lock_set, lock_values):
+            locks[(i % width, i // width)] = bool(value)
+        for i in take(np.uint32, n_lock_cleared).tolist():
+            locks.pop((i % width, i // width), None)
+
+        for ghost, partner in zip(game_state.ghosts, take(np.int16, n_partners).tolist()):
+            ghost.entangled_with = game_state.ghosts[partner] if partner >= 0 else None
+
+        layout_tiles = take(np.uint32, n_layout_tiles).tolist()
+        layout_values = take(np.int8, n_layout_tiles).tolist()
+        maze.set_tiles([(i % width, i // width, tile) for i, tile in zip(layout_tiles, layout_values)])
+        if layout_length:
+            maze.load_layout_bytes(view[offset:offset + layout_length])
+
+
+class Viewer:
+    """Server-side state of one connected viewer"""
+
+    def __init__(self, writer, backlog=0):
+        self.writer = writer
+        # Room for the catch-up frames plus the usual slack
+        self.queue = asyncio.Queue(backlog + CLIENT_QUEUE_FRAMES)
+        self.resync = False  # Skipping deltas until the next keyframe
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.task = None  # Task sending this viewer its frames
+
+
+class SpectatorServer:
+    """Broadcasts frames from a DeltaEncoder to every connected viewer"""
+
+    def __init__(self, host="0.0.0.0", port=SPECTATOR_PORT, keyframe_interval=KEYFRAME_INTERVAL):
+        self.host = host
+        self.port = port
+        self.encoder = DeltaEncoder(keyframe_interval)
+        self.viewers = []  # In connection order
+        # Latest keyframe and the deltas after it, for viewers joining mid-game
+        self.catch_up = []
+        self.loop = None
+        self.server = None
+        # Serialization statistics
+        self.encode_ns = {KEYFRAME: 0, DELTA: 0}
+        self.encoded = {KEYFRAME: 0, DELTA: 0}
+        self.encoded_bytes = 0
+
+    async def start(self):
+        """Start accepting viewers on the running event loop"""
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._serve_viewer, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # Resolves port 0
+
+    def start_in_thread(self):
+        """Run the server on its own event loop thread (for a game loop that isn't async)"""
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="spectator-server", daemon=True).start()
+        started.wait()
+
+    async def _serve_viewer(self, reader, writer):
+        """Send one viewer its frames until it disconnects"""
+        viewer = Viewer(writer, len(self.catch_up))
+        viewer.task = asyncio.current_task()
+        # Keep little in the transport and socket so a slow viewer backs up into its (bounded) queue
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_BYTES)
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, WRITE_BUFFER_BYTES)
+        for frame in self.catch_up:
+            viewer.queue.put_nowait(frame)
+        self.viewers.append(viewer)
+        try:
+            while True:
+                frame = await viewer.queue.get()
+                writer.write(frame)
+                viewer.sent_bytes += len(frame)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.viewers.remove(viewer)
+            writer.close()
+
+    def publish(self, game_state):
+        """
+        Encode the current tick and queue it for every viewer.
+        Safe to call from the game thread; encoding happens on the caller.
+        """
+        start = time.perf_counter_ns()
+        kind, frame = self.encoder.encode(game_state)
+        self.encode_ns[kind] += time.perf_counter_ns() - start
+        self.encoded[kind] += 1
+        self.encoded_bytes += len(frame)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._fan_out, kind, frame)
+
+    def _fan_out(self, kind, frame):
+        """Queue a frame for every viewer, dropping it for viewers that are behind"""
+        if kind == KEYFRAME:
+            self.catch_up = [frame]
+        else:
+            self.catch_up.append(frame)  # At most a keyframe interval of deltas
+        for viewer in self.viewers:
+            if kind == KEYFRAME:
+                viewer.resync = False
+            elif viewer.resync:
+                viewer.dropped += 1
+                continue
+            try:
+                viewer.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Deltas after a gap are useless; wait for the next keyframe
+                viewer.dropped += 1
+                viewer.resync = True
+
+    def stats(self):
+        """Get serialization cost and per-viewer traffic"""
+        return {
+            "keyframes": self.encoded[KEYFRAME],
+            "deltas": self.encoded[DELTA],
+            "keyframe_encode_us": self.encode_ns[KEYFRAME] / max(1, self.encoded[KEYFRAME]) / 1000,
+            "delta_encode_us": self.encode_ns[DELTA] / max(1, self.encoded[DELTA]) / 1000,
+            "bytes_per_tick": self.encoded_bytes / max(1, self.encoder.frame_count),
+            "viewers": [{"sent_bytes": viewer.sent_bytes, "dropped": viewer.dropped} for viewer in self.viewers],
+        }
+
+    async def close(self):
+        """Stop accepting viewers and disconnect everyone"""
+        for viewer in list(self.viewers):
+            viewer.task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class Autopilot:
+    """Drives Pacman with random turns so a headless game keeps going"""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)  # Separate from the game's RNG
+
+    def step(self, game_state):
+        """Steer, restart finished games and advance one tick"""
+        if game_state.tick % 30 == 0:
+            game_state.pacman.set_next_direction(self.rng.choice([UP, DOWN, LEFT, RIGHT]))
+        if game_state.game_over:
+            game_state.reset_game()
+        elif game_state.won:
+            game_state.next_level()
+        game_state.update()
+
+
+async def run_game(server, game_state, ticks=None, autopilot=None):
+    """
+    Run a game at the tick rate and publish every tick.
+    Ticks run on a worker thread, so slow ticks (e.g. a maze fluctuation)
+    never block the event loop that feeds the viewers.
+    """
+    loop = asyncio.get_running_loop()
+    autopilot = autopilot or Autopilot()
+    tick_seconds = 1.0 / TICK_RATE
+    next_tick = time.perf_counter()
+    tick = 0
+    while ticks is None or tick < ticks:
+        await loop.run_in_executor(None, autopilot.step, game_state)
+        server.publish(game_state)
+        tick += 1
+        next_tick += tick_seconds
+        delay = next_tick - time.perf_counter()
+        if delay < -MAX_CATCHUP_TICKS * tick_seconds:
+            next_tick = time.perf_counter()  # Too far behind: don't try to catch up
+        await asyncio.sleep(max(0.0, delay))
+
+
+async def watch(host, port, view=None, on_frame=None, delay=0.0, receive_buffer=None):
+    """
+    Receive frames from a server and apply them to a SpectatorView.
+    Args:
+        host, port: server address
+        view: the SpectatorView to update (a new one by default)
+        on_frame: optional callback(view, kind, size) after each frame
+        delay: seconds to stall after each frame (to simulate a slow viewer)
+        receive_buffer: socket receive buffer size in bytes (small = slow viewer backs up sooner)
+    Returns:
+        The view, once the server closes the connection
+    """
+    view = view or SpectatorView()
+    if receive_buffer:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=receive_buffer)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            header = await reader.readexactly(FRAME.size)
+            length, kind = FRAME.unpack(header)
+            payload = await reader.readexactly(length)
+            view.apply(kind, payload)
+            if on_frame is not None:
+                on_frame(view, kind, len(header) + length)
+            if delay:
+                await asyncio.sleep(delay)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+    return view
+
+
+async def bench(viewers, ticks, slow_delay):
+    """Serve a headless game to local viewers and report traffic and encode cost"""
+    server = SpectatorServer(host="127.0.0.1", port=0)
+    await server.start()
+    game_state = GameState(seed=0)
+    received = [0] * viewers
+    views = [SpectatorView() for _ in range(viewers)]
+
+    def counter(i):
+        def on_frame(view, kind, size):
+            received[i] += size
+        return on_frame
+
+    # The last viewer reads slowly to show frame dropping
+    tasks = []
+    for i in range(viewers):
+        slow = slow_delay and i == viewers - 1
+        tasks.append(asyncio.create_task(watch("127.0.0.1", server.port, views[i], counter(i),
+                                               slow_delay if slow else 0.0, 4096 if slow else None)))
+        await asyncio.sleep(0.02)  # Connect in order so server viewers line up with ours
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    await run_game(server, game_state, ticks, Autopilot(0))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.2)  # Let the fast viewers drain their queues
+    stats = server.stats()
+    await server.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"{ticks} ticks in {elapsed:.1f}s to {viewers} viewers")
+    print(f"encode: keyframe {stats['keyframe_encode_us']:.0f} us ({stats['keyframes']}), "
+          f"delta {stats['delta_encode_us']:.0f} us ({stats['deltas']}), {stats['bytes_per_tick']:.0f} bytes/tick")
+    for i, count in enumerate(received):
+        kind = "slow" if i == viewers - 1 and slow_delay else "fast"
+        print(f"  viewer {i} ({kind}): {count / elapsed / 1024:.1f} KiB/s")
+    dropped = [viewer["dropped"] for viewer in stats["viewers"]]
+    print(f"frames dropped per viewer: {dropped}")
+    # A fast viewer's copy should match the game
+    view = views[0].game_state
+    match = (view is not None and view.maze.layout_bytes() == game_state.maze.layout_bytes()
+             and bytes(view.maze.pellet_mask) == bytes(game_state.maze.pellet_mask)
+             and view.score == game_state.score
+             and view.maze.entanglement.locked_measurements == game_state.maze.entanglement.locked_measurements
+             and np.allclose(view.entities.x[:view.entities.count], game_state.entities.x[:game_state.entities.count],
+                             atol=1e-3))
+    print(f"viewer state matches the game: {match}")
+
+
+def main():
+    """Serve, watch or benchmark spectator streams"""
+    parser = argparse.ArgumentParser(description="EntangleMan spectator streaming")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="broadcast a headless autoplay game")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=SPECTATOR_PORT)
+    serve.add_argument("--seed", type=int, default=None, help="game seed")
+    view = commands.add_parser("watch", help="watch a broadcast")
+    view.add_argument("address", help="host:port")
+    view.add_argument("--render", action="store_true", help="draw the game in a window")
+    benchmark = commands.add_parser("bench", help="measure bandwidth and serialization cost")
+    benchmark.add_argument("--viewers", type=int, default=8)
+    benchmark.add_argument("--ticks", type=int, default=10 * TICK_RATE)
+    benchmark.add_argument("--slow-delay", type=float, default=0.1,
+                           help="seconds the last viewer stalls per frame (0 = all fast)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        async def serve_forever():
+            server = SpectatorServer(args.host, args.port)
+            await server.start()
+            print(f"Serving on port {server.port}")
+            await run_game(server, GameState(seed=args.seed), autopilot=Autopilot(args.seed))
+        asyncio.run(serve_forever())
+    elif args.command == "watch":
+        host, port = args.address.rsplit(":", 1)
+        on_frame = None
+        if args.render:
+            import pygame
+            from renderer import Renderer
+            pygame.init()
+            renderers = {}
+
+            def on_frame(view, kind, size):
+                pygame.event.pump()
+                maze = view.game_state.maze
+                if "renderer" not in renderers:
+                    screen = pygame.display.set_mode((min(SCREEN_WIDTH, maze.width * TILE_SIZE),
+                                                      min(SCREEN_HEIGHT, maze.height * TILE_SIZE)))
+                    pygame.display.set_caption("Pacman spectator")
+                    renderers["renderer"] = Renderer(screen)
+                renderers["renderer"].render(view.game_state)
+        asyncio.run(watch(host, int(port), on_frame=on_frame))
+    else:
+        asyncio.run(bench(args.viewers, args.ticks, args.slow_delay))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Difficulty auto-tuner for Pacman
+
+Searches the balancing values below with headless games played by a
+scripted player, looking for the configuration whose win rate and survival
+time come closest to the targets. Configurations are sampled from the grid
+and raced by successive halving: every round each survivor plays more games
+(on the same game seeds, so configurations face the same mazes), and only
+the best 1/eta go on, so weak ones are dropped after a couple of games.
+Games run in parallel worker processes. The best configurations are written
+as ranked JSON files; copy the values of the one you like into the game.
+
+    GHOST_SPEED            constants.py, pixels per tick
+    POWER_PELLET_DURATION  constants.py, seconds
+    FLUCTUATION_PERIOD     constants.py, seconds between wall fluctuations
+    PATH_THRESHOLD         maze.py, walk probability above which a tile is a path
+    decision_delay         Ghost.decision_delay, ticks between pathfinding decisions
+
+Usage:
+    python tuner.py                                   # 32 configurations, targets 50% wins and 60 s survival
+    python tuner.py --configs 64 --target-win-rate 0.3 --target-survival 90 --out tuned
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# The dummy driver must be selected before pygame initializes its display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from constants import *
+import entities
+import game_state
+import maze
+
+# name -> values searched (speeds stay multiples of 1/SUBPIXELS)
+SEARCH_SPACE = {
+    "GHOST_SPEED": [1.0, 1.2, 1.5, 1.8, 2.0],
+    "POWER_PELLET_DURATION": [4, 6, 8, 10, 14],
+    "FLUCTUATION_PERIOD": [3, 5, 8, 12],
+    "PATH_THRESHOLD": [0.01, 0.015, 0.02, 0.03, 0.04],
+    "decision_delay": [1, 2, 3, 5, 8],
+}
+# Module globals each constant is read from (they were star-imported from constants)
+PARAMETER_MODULES = {
+    "GHOST_SPEED": [entities],
+    "POWER_PELLET_DURATION": [game_state],
+    "FLUCTUATION_PERIOD": [game_state],
+    "PATH_THRESHOLD": [maze],
+}
+MAX_GAME_SECONDS = 120  # A game still running after this long counts as survived, not won
+STALL_SECONDS = 20  # A game with no score for this long ends as lost (e.g. Pacman walled in by measured walls)
+GHOST_CAUTION = 2  # The scripted player keeps this many tiles from dangerous ghosts
+
+
+def apply_parameters(parameters):
+    """Set the module-level balancing values of a configuration in this process"""
+    for name, value in parameters.items():
+        for module in PARAMETER_MODULES.get(name, []):
+            setattr(module, name, value)
+
+
+def choose_direction(game, input_rng):
+    """
+    Scripted player: head for the nearest pellet, avoiding tiles near ghosts that aren't frightened.
+    Args:
+        game: the GameState to play
+        input_rng: the player's source of randomness (separate from the game's RNG)
+    Returns a direction, or None to keep going.
+    """
+    start = game.pacman.get_grid_pos()
+    danger = set()
+    for ghost in game.ghosts_near(*start, GHOST_CAUTION + 1):
+        if ghost.mode != FRIGHTENED:
+            gx, gy = ghost.get_grid_pos()
+            danger.update((gx + dx, gy + dy) for dx in range(-GHOST_CAUTION, GHOST_CAUTION + 1)
+                          for dy in range(-GHOST_CAUTION, GHOST_CAUTION + 1))
+    targets = game.maze.pellets | game.maze.power_pellets
+    queue = deque([(start, None)])
+    seen = {start}
+    while queue:
+        (x, y), first = queue.popleft()
+        if first is not None and (x, y) in targets:
+            return first
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            tile = (x + direction[0], y + direction[1])
+            if tile not in seen and tile not in danger and game.maze.is_valid_position(*tile):
+                seen.add(tile)
+                queue.append((tile, first or direction))
+    # Cornered or nothing reachable: any open direction away from danger
+    open_directions = [d for d in (UP, DOWN, LEFT, RIGHT)
+                       if game.maze.is_valid_position(start[0] + d[0], start[1] + d[1])
+                       and (start[0] + d[0], start[1] + d[1]) not in danger]
+    return input_rng.choice(open_directions) if open_directions else None
+
+
+def play(parameters, seed, max_ticks=MAX_GAME_SECONDS * TICK_RATE):
+    """
+    Play one level with the scripted player under a configuration.
+    Returns (won, ticks survived, score).
+    """
+    apply_parameters(parameters)
+    game = game_state.GameState(seed=seed)
+    input_rng = random.Random(seed)  # The player's turns (separate from the game's RNG)
+    for ghost in game.ghosts:
+        ghost.decision_delay = parameters["decision_delay"]
+    last_score, last_scored = game.score, 0
+    while not (game.game_over or game.won) and game.tick < max_ticks:
+        if game.pacman.reaches_center():
+            direction = choose_direction(game, input_rng)
+            if direction is not None:
+                game.pacman.set_next_direction(direction)
+        game.update()
+        if game.score != last_score:
+            last_score, last_scored = game.score, game.tick
+        elif game.tick - last_scored > STALL_SECONDS * TICK_RATE:
+            return False, last_scored, game.score
+    return game.won, game.tick, game.score
+
+
+def _play_task(task):
+    """Worker entry point: play one (configuration index, parameters, seed, max ticks) task"""
+    index, parameters, seed, max_ticks = task
+    return index, play(parameters, seed, max_ticks)
+
+
+def loss(results, target_win_rate, target_survival, max_ticks):
+    """
+    Distance of a configuration's games from the targets (lower is better).
+    Survival is in seconds; a won or timed-out game counts as surviving max_ticks,
+    a stalled one as surviving until its last score.
+    """
+    win_rate = sum(won for won, _, _ in results) / len(results)
+    survival = sum(max_ticks if won else ticks for won, ticks, _ in results) / len(results) / TICK_RATE
+    return abs(win_rate - target_win_rate) + abs(survival - target_survival) / target_survival
+
+
+def game_seed(seed, n):
+    """Get the seed of the n-th game every configuration plays"""
+    return random.Random(f"{seed}/{n}").getrandbits(32)
+
+
+def sample_configurations(count, seed):
+    """Draw distinct configurations from SEARCH_SPACE"""
+    grid = list(itertools.product(*SEARCH_SPACE.values()))
+    picks = random.Random(seed).sample(grid, min(count, len(grid)))
+    return [dict(zip(SEARCH_SPACE, values)) for values in picks]
+
+
+def successive_halving(configurations, games, eta, run, evaluate):
+    """
+    Race configurations, playing more games on fewer of them each round.
+    Args:
+        configurations: parameter dicts
+        games: games per configuration in the first round (then multiplied by eta)
+        eta: only the best 1/eta of each round go on
+        run: callable(list of (index, game number)) -> list of results, same order
+        evaluate: callable(results) -> loss
+    Returns:
+        [(index, rounds survived, results)] ranked best first
+    """
+    results = {i: [] for i in range(len(configurations))}
+    survived = {i: 0 for i in results}
+    survivors = list(results)
+    round_games = games
+    while True:
+        tasks = [(i, n) for i in survivors for n in range(len(results[i]), round_games)]
+        for (i, _), result in zip(tasks, run(tasks)):
+            results[i].append(result)
+        for i in survivors:
+            survived[i] += 1
+        survivors.sort(key=lambda i: evaluate(results[i]))
+        print(f"  round {max(survived.values())}: {len(survivors)} configurations x {round_games} games, "
+              f"best loss {evaluate(results[survivors[0]]):.3f}")
+        if len(survivors) == 1:
+            break
+        survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+        round_games *= eta
+    ranked = sorted(results, key=lambda i: (-survived[i], evaluate(results[i])))
+    return [(i, survived[i], results[i]) for i in ranked]
+
+
+def main():
+    """Tune the balancing values and write ranked configurations"""
+    parser = argparse.ArgumentParser(description="EntangleMan difficulty auto-tuner")
+    parser.add_argument("--configs", type=int, default=32, help="configurations sampled from the search space")
+    parser.add_argument("--games", type=int, default=2, help="games per configuration in the first round")
+    parser.add_argument("--eta", type=int, default=2, help="keep the best 1/eta after every round")
+    parser.add_argument("--target-win-rate", type=float, default=0.5, help="fraction of levels cleared")
+    parser.add_argument("--target-survival", type=float, default=60.0, help="seconds survived per game")
+    parser.add_argument("--max-seconds", type=int, default=MAX_GAME_SECONDS, help="game time limit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the sampled configurations and game seeds")
+    parser.add_argument("--top", type=int, default=5, help="configurations written")
+    parser.add_argument("--out", default="tuned", help="directory for the ranked configuration files")
+    args = parser.parse_args()
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+
+    configurations = sample_configurations(args.configs, args.seed)
+    max_ticks = args.max_seconds * TICK_RATE
+
+    def evaluate(results):
+        return loss(results, args.target_win_rate, args.target_survival, max_ticks)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        def run(tasks):
+            jobs = [(i, configurations[i], game_seed(args.seed, n), max_ticks) for i, n in tasks]
+            return [result for _, result in executor.map(_play_task, jobs)]
+
+        print(f"Tuning {len(configurations)} configurations on {args.workers} workers")
+        ranked = successive_halving(configurations, args.games, args.eta, run, evaluate)
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(args.out, exist_ok=True)
+    print(f"\nDone in {elapsed:.0f}s")
+    print(f"{'rank':>4} {'loss':>6} {'games':>6} {'wins':>5} {'survival s':>11}  parameters")
+    for rank, (i, rounds, results) in enumerate(ranked[:args.top], 1):
+        win_rate = sum(won for won, _, _ in results) / len(results)
+        survival = sum(max_ticks if won else ticks for won, ticks, _ in results) / len(results) / TICK_RATE
+        summary = {
+            "rank": rank,
+            "loss": evaluate(results),
+            "rounds": rounds,
+            "games": len(results),
+            "win_rate": win_rate,
+            "mean_survival_s": survival,
+            "mean_score": sum(score for _, _, score in results) / len(results),
+            "targets": {"win_rate": args.target_win_rate, "survival_s": args.target_survival},
+            "parameters": configurations[i],
+        }
+        path = os.path.join(args.out, f"rank_{rank:02d}.json")
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"{rank:4d} {summary['loss']:6.3f} {len(results):6d} {win_rate:5.2f} {survival:11.1f}  "
+              f"{json.dumps(configurations[i])} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Vectorized headless Pacman environments for reinforcement learning
+
+VecEnv runs many games across worker processes, each worker stepping a
+contiguous slice of them. Actions, observations, rewards and done flags live
+in one shared memory block, so a step moves no game objects between
+processes: the learner writes the actions, releases every worker's semaphore
+and waits for the workers to count down a shared one.
+
+Observations are (OBS_PLANES, height, width) uint8 tile planes:
+    WALL_PLANE        1 on walls
+    PELLET_PLANE      1 on pellets, 2 on power pellets
+    GHOST_PLANE       1 where a ghost is
+    FRIGHTENED_PLANE  1 where a frightened ghost is
+    PACMAN_PLANE      1 where Pacman is
+An action is an index into entity_store.DIRECTIONS (0 = keep going). Every
+step repeats its action for `frame_skip` ticks and is rewarded with the score
+gained. A cleared level continues on the next one; a game that ends (game
+over or `max_steps`) is reset in place, and the observation returned for it
+is the new game's first one (the finished game's score and length are left in
+episode_scores and episode_lengths). Layouts come from a pool of
+pre-generated layouts in the same shared block, so resets never run a walk.
+
+Usage:
+    from vec_env import VecEnv
+    env = VecEnv(num_envs=16, workers=4, seed=0)
+    observations = env.reset()
+    observations, rewards, dones = env.step(actions)   # actions: shape (num_envs,)
+    env.close()
+    python benchmark.py vecenv --workers 0 1 2 4       # steps per second by worker count
+"""
+import os
+
+# Every worker imports the game (and pygame); keep their output quiet
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import multiprocessing
+import random
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from constants import *
+from entity_store import DIRECTIONS
+from game_state import GameState
+from maze import generate_layouts, layout_seed
+from quantum_backend import AER, STATEVECTOR
+
+WALL_PLANE = 0
+PELLET_PLANE = 1
+GHOST_PLANE = 2
+FRIGHTENED_PLANE = 3
+PACMAN_PLANE = 4
+OBS_PLANES = 5
+FRAME_SKIP = 4  # Ticks per environment step
+POOL_LAYOUTS = 64  # Layouts generated for the shared pool when no library is given
+ALIGNMENT = 64
+WORKER_POLL_SECONDS = 1.0  # How often a waiting learner checks that its workers are alive
+
+# Commands from the learner to its workers
+RESET = 1
+STEP = 2
+CLOSE = 3
+
+# Observation code of each pellet_mask value
+PELLET_CODES = np.zeros(256, dtype=np.uint8)
+PELLET_CODES[PELLET] = 1
+PELLET_CODES[POWER_PELLET] = 2
+
+
+def _buffer_layout(num_envs, width, height, pool_size, workers):
+    """
+    Get where every array lives in the shared block.
+    Returns ({name: (dtype, shape, offset)}, total size in bytes)
+    """
+    shapes = {
+        "command": (np.int32, (1,)),
+        "failed": (np.int8, (max(workers, 1),)),
+        "actions": (np.int8, (num_envs,)),
+        "observations": (np.uint8, (num_envs, OBS_PLANES, height, width)),
+        "rewards": (np.float32, (num_envs,)),
+        "dones": (np.bool_, (num_envs,)),
+        "episode_scores": (np.int64, (num_envs,)),
+        "episode_lengths": (np.int32, (num_envs,)),
+        "pool": (np.int8, (pool_size, height, width)),
+    }
+    layout = {}
+    offset = 0
+    for name, (dtype, shape) in shapes.items():
+        layout[name] = (dtype, shape, offset)
+        offset = (offset + int(np.prod(shape)) * np.dtype(dtype).itemsize + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+    return layout, max(offset, 1)
+
+
+def _views(buffer, layout):
+    """Get a NumPy view of every array in the shared block"""
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            for name, (dtype, shape, offset) in layout.items()}
+
+
+def layout_pool(width, height, count=POOL_LAYOUTS, seed=0, backend=STATEVECTOR, library=None):
+    """
+    Get the layouts auto-resets draw from.
+    Args:
+        width, height: maze size in tiles
+        count: layouts to generate (ignored with a library)
+        seed: game seed the layout seeds derive from (see maze.layout_seed)
+        backend: quantum walk backend for generated layouts
+        library: MazeLibrary to take every layout from instead of generating
+    Returns:
+        An int8 (count, height, width) array
+    """
+    if library is not None:
+        if (library.width, library.height) != (width, height):
+            raise ValueError(f"Library holds {library.width}x{library.height} layouts, not {width}x{height}")
+        if not len(library):
+            raise ValueError(f"{library.path} holds no layouts")
+        return np.asarray(library.tiles)
+    return np.array(generate_layouts(width, height, [layout_seed(seed, i) for i in range(count)], backend)[0],
+                    dtype=np.int8)
+
+
+class PoolLayouts:
+    """Layout source serving a fixed pool of layouts, each seed mapped onto one of them"""
+
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.depth = 0  # Nothing to queue ahead
+
+    def prefetch(self, width, height, seeds):
+        """Layout source interface: every layout is already available"""
+        pass
+
+    def get(self, width, height, seed, backend=AER):
+        """Layout source interface: get the pool layout for a seed (the backend is ignored)"""
+        if (height, width) != self.tiles.shape[1:]:
+            raise ValueError(f"Pool holds {self.tiles.shape[2]}x{self.tiles.shape[1]} layouts, not {width}x{height}")
+        return self.tiles[seed % len(self.tiles)]
+
+
+class GameSlice:
+    """The games of one worker, reading actions from and writing results to the shared arrays"""
+
+    def __init__(self, arrays, start, seeds, width, height, ghost_count, frame_skip, max_steps):
+        self.arrays = arrays
+        self.start = start  # Index of the first game in the shared arrays
+        self.seeds = seeds
+        self.width = width
+        self.height = height
+        self.ghost_count = ghost_count
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.layouts = PoolLayouts(arrays["pool"])
+        self.games = None  # Created by the first reset
+        self.steps = [0] * len(seeds)  # Steps into each game's current episode
+        self.layout_keys = [None] * len(seeds)  # (maze, layout version) each wall plane was drawn from
+
+    def run(self, command):
+        """Carry out a RESET or STEP command"""
+        if command == RESET:
+            self.reset()
+        elif command == STEP:
+            self.step()
+        else:
+            raise ValueError(f"Unknown command {command}")
+
+    def reset(self):
+        """Start a new episode in every game"""
+        if self.games is None:
+            self.games = [GameState(self.width, self.height, seed=seed, layout_source=self.layouts,
+                                    ghost_count=self.ghost_count) for seed in self.seeds]
+        else:
+            for game in self.games:
+                game.reset_game()
+        end = self.start + len(self.games)
+        self.arrays["rewards"][self.start:end] = 0
+        self.arrays["dones"][self.start:end] = False
+        for i in range(len(self.games)):
+            self.steps[i] = 0
+            self._observe(i)
+
+    def step(self):
+        """Advance every game by one environment step, resetting the ones that end"""
+        if self.games is None:
+            raise RuntimeError("reset() must be called before the first step()")
+        actions = self.arrays["actions"]
+        rewards = self.arrays["rewards"]
+        dones = self.arrays["dones"]
+        for i, game in enumerate(self.games):
+            env = self.start + i
+            direction = DIRECTIONS[actions[env]]
+            if direction != NONE:
+                game.pacman.set_next_direction(direction)
+            score = game.score
+            for _ in range(self.frame_skip):
+                game.update()
+                if game.won:
+                    game.next_level()
+                if game.game_over:
+                    break
+            self.steps[i] += 1
+            rewards[env] = game.score - score
+            done = game.game_over or (self.max_steps is not None and self.steps[i] >= self.max_steps)
+            dones[env] = done
+            if done:
+                self.arrays["episode_scores"][env] = game.score
+                self.arrays["episode_lengths"][env] = self.steps[i]
+                game.reset_game()
+                self.steps[i] = 0
+            self._observe(i)
+
+    def _observe(self, i):
+        """Write game i's observation planes"""
+        game = self.games[i]
+        maze = game.maze
+        planes = self.arrays["observations"][self.start + i]
+        # Walls only change with the layout; converting the grid is the costly part
+        drawn = self.layout_keys[i]
+        if drawn is None or drawn[0] is not maze or drawn[1] != maze.layout_version:
+            planes[WALL_PLANE] = np.asarray(maze.layout, dtype=np.int8) == WALL
+            self.layout_keys[i] = (maze, maze.layout_version)
+        mask = np.frombuffer(maze.pellet_mask, dtype=np.uint8).reshape(self.height, self.width)
+        np.take(PELLET_CODES, mask, out=planes[PELLET_PLANE])
+        planes[GHOST_PLANE:].fill(0)
+
+        store = game.entities
+        count = store.count
+        xs = np.clip((store.x[:count] // TILE_SIZE).astype(np.intp), 0, self.width - 1)
+        ys = np.clip((store.y[:count] // TILE_SIZE).astype(np.intp), 0, self.height - 1)
+        pacman = game.pacman.slot
+        planes[PACMAN_PLANE, ys[pacman], xs[pacman]] = 1
+        ghosts = np.arange(count) != pacman
+        frightened = ghosts & (store.mode[:count] == FRIGHTENED)
+        planes[GHOST_PLANE, ys[ghosts], xs[ghosts]] = 1
+        planes[FRIGHTENED_PLANE, ys[frightened], xs[frightened]] = 1
+
+
+def _worker(index, name, layout, start, seeds, options, go, done, errors):
+    """Worker entry point: run commands on a slice of the games until told to close"""
+    shared = SharedMemory(name)
+    arrays = _views(shared.buf, layout)
+    games = GameSlice(arrays, start, seeds, **options)
+    try:
+        while True:
+            go.acquire()
+            command = int(arrays["command"][0])
+            if command == CLOSE:
+                break
+            try:
+                games.run(command)
+            except Exception:
+                arrays["failed"][index] = 1
+                errors.put(traceback.format_exc())
+            done.release()
+    finally:
+        # Views into the block must be gone before it can be closed
+        del games, arrays
+        shared.close()
+
+
+class VecEnv:
+    """Many headless games stepped together, across worker processes sharing one memory block"""
+
+    def __init__(self, num_envs=8, workers=0, width=MAZE_WIDTH, height=MAZE_HEIGHT, seed=None,
+                 ghost_count=GHOST_COUNT, frame_skip=FRAME_SKIP, max_steps=None, library=None,
+                 pool_size=POOL_LAYOUTS, pool_backend=STATEVECTOR):
+        """
+        Args:
+            num_envs: games stepped per call
+            workers: worker processes (0 = step every game in this process)
+            width, height: maze size in tiles (taken from the library when one is given)
+            seed: game i plays with seed + i (None = random)
+            ghost_count: ghosts per game
+            frame_skip: ticks per step
+            max_steps: steps after which an episode is cut short (None = play until game over)
+            library: MazeLibrary whose layouts make up the reset pool
+            pool_size, pool_backend: layouts generated for the pool without a library
+        """
+        if library is not None:
+            width, height = library.width, library.height
+        if workers > num_envs:
+            raise ValueError(f"{workers} workers for {num_envs} games would leave workers idle")
+        self.num_envs = num_envs
+        self.workers = workers
+        self.started = False  # Set by the first reset(); stepping before it is an error
+        self.width = width
+        self.height = height
+        seed = seed if seed is not None else random.getrandbits(32)
+        self.seeds = [seed + i for i in range(num_envs)]
+        tiles = layout_pool(width, height, pool_size, seed, pool_backend, library)
+
+        self.layout, size = _buffer_layout(num_envs, width, height, len(tiles), workers)
+        options = {"width": width, "height": height, "ghost_count": ghost_count,
+                   "frame_skip": frame_skip, "max_steps": max_steps}
+        self.processes = []
+        if workers == 0:
+            self.shared = None
+            self.arrays = _views(bytearray(size), self.layout)
+            self.arrays["pool"][:] = tiles
+            self.games = GameSlice(self.arrays, 0, self.seeds, **options)
+            return
+
+        self.games = None
+        self.shared = SharedMemory(create=True, size=size)
+        self.arrays = _views(self.shared.buf, self.layout)
+        self.arrays["pool"][:] = tiles
+        # Spawned workers get a clean interpreter (see pregen.py)
+        context = multiprocessing.get_context("spawn")
+        self._go = [context.Semaphore(0) for _ in range(workers)]
+        self._done = context.Semaphore(0)
+        self._errors = context.SimpleQueue()
+        # Contiguous slices, as even as possible
+        bounds = [num_envs * k // workers for k in range(workers + 1)]
+        for k in range(workers):
+            process = context.Process(
+                target=_worker, name=f"vec-env-{k}", daemon=True,
+                args=(k, self.shared.name, self.layout, bounds[k], self.seeds[bounds[k]:bounds[k + 1]],
+                      options, self._go[k], self._done, self._errors))
+            process.start()
+            self.processes.append(process)
+
+    @property
+    def observations(self):
+        """(num_envs, OBS_PLANES, height, width) uint8 observations of the latest step"""
+        return self.arrays["observations"]
+
+    @property
+    def episode_scores(self):
+        """Final score of each game's last finished episode"""
+        return self.arrays["episode_scores"]
+
+    @property
+    def episode_lengths(self):
+        """Steps of each game's last finished episode"""
+        return self.arrays["episode_lengths"]
+
+    def _send(self, command):
+        """Have every worker carry out a command"""
+        if self.workers == 0:
+            self.games.run(command)
+            return
+        self.arrays["command"][0] = command
+        for go in self._go:
+            go.release()
+
+    def _wait(self):
+        """Wait until every worker has finished its command, raising the first failure"""
+        if self.workers == 0:
+            return
+        for _ in range(self.workers):
+            while not self._done.acquire(timeout=WORKER_POLL_SECONDS):
+                dead = [process.name for process in self.processes if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Worker {', '.join(dead)} exited unexpectedly")
+        if self.arrays["failed"].any():
+            self.arrays["failed"][:] = 0
+            raise RuntimeError(f"A worker failed:\n{self._errors.get()}")
+
+    def reset(self):
+        """
+        Start a new episode in every game.
+        Returns the observations (a view into the shared block, overwritten by the next step)
+        """
+        self._send(RESET)
+        self._wait()
+        self.started = True
+        return self.arrays["observations"]
+
+    def step_async(self, actions):
+        """Start a step; the learner can work until step_wait()"""
+        if not self.started:
+            raise RuntimeError("reset() must be called before the first step()")
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs,):
+            raise ValueError(f"Expected {self.num_envs} actions, got shape {actions.shape}")
+        if ((actions < 0) | (actions >= len(DIRECTIONS))).any():
+            raise ValueError(f"Actions must be indices into DIRECTIONS (0-{len(DIRECTIONS) - 1})")
+        self.arrays["actions"][:] = actions
+        self._send(STEP)
+
+    def step_wait(self):
+        """
+        Finish a step started with step_async().
+        Returns (observations, rewards, dones), views into the shared block
+        that the next step overwrites (copy what has to be kept)
+        """
+        self._wait()
+        return self.arrays["observations"], self.arrays["rewards"], self.arrays["dones"]
+
+    def step(self, actions):
+        """Step every game with one action each; see step_wait() for the result"""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        """Stop the workers and release the shared block"""
+        if self.workers and self.processes:
+            self.arrays["command"][0] = CLOSE
+            for go in self._go:
+                go.release()
+            for process in self.processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self.processes.clear()
+        self.arrays = None
+        self.games = None
+        if self.shared is not None:
+            self.shared.unlink()
+            try:
+                self.shared.close()
+            except BufferError:
+                pass  # The caller still holds views; the mapping goes with them
+            self.shared = None
@@ -0,0 +1,8 @@
+"""GameState options"""
+import pytest
+from game_state import GameState
+
+
+def test_noise_rejects_cell_layouts():
+    with pytest.raises(ValueError, match="cell_block"):
+        GameState(seed=0, cell_block=4, noise_profile="low")
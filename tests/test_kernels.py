@@ -0,0 +1,21 @@
+"""Kernels against their pure-Python references (the plain kernels run without Numba)"""
+import numpy as np
+import pytest
+import kernels
+from maze import generate_layout
+from quantum_backend import STATEVECTOR
+
+
+@pytest.mark.parametrize("width, height, seed", [(28, 31, 0), (28, 31, 1), (60, 45, 2)])
+def test_kernels_match_references(width, height, seed):
+    grid = generate_layout(width, height, seed, backend=STATEVECTOR)
+    assert kernels._check_layout(grid, np.random.default_rng(seed), searches=100) == 0
+
+
+def test_search_buffers_survive_epoch_wrap_and_resizes(monkeypatch):
+    monkeypatch.setattr(kernels, "EPOCH_LIMIT", 5)
+    rng = np.random.default_rng(3)
+    small = generate_layout(28, 31, 3, backend=STATEVECTOR)
+    large = generate_layout(60, 45, 4, backend=STATEVECTOR)
+    for grid in (small, large, small):
+        assert kernels._check_layout(grid, rng, searches=20) == 0
@@ -0,0 +1,99 @@
+"""Recording and replaying sessions"""
+import random
+from constants import *
+from game_state import GameState
+import replay
+
+
+def record(path, ticks, hook=None):
+    """Record a scripted session, calling hook(game_state, recorder, tick) before each tick"""
+    game_state = GameState(seed=7)
+    recorder = replay.Recorder(path, game_state)
+    input_rng = random.Random(3)
+    for tick in range(ticks):
+        if tick % 7 == 0:
+            game_state.pacman.set_next_direction(input_rng.choice([UP, DOWN, LEFT, RIGHT]))
+        if hook:
+            hook(game_state, recorder, tick)
+        if game_state.game_over:
+            replay.apply_commands(game_state, replay.COMMAND_RESET)
+            recorder.note_command(replay.COMMAND_RESET)
+        recorder.step(game_state)
+    recorder.close()
+
+
+def test_repeated_commands_in_one_tick(tmp_path):
+    def pause_twice(game_state, recorder, tick):
+        if tick == 100:
+            for _ in range(2):
+                replay.apply_commands(game_state, replay.COMMAND_PAUSE)
+                recorder.note_command(replay.COMMAND_PAUSE)
+        elif tick == 200:
+            replay.apply_commands(game_state, replay.COMMAND_PAUSE)
+            recorder.note_command(replay.COMMAND_PAUSE)
+
+    path = tmp_path / "session.emr"
+    record(path, 300, pause_twice)
+    player = replay.Player(path)
+    assert [commands for _, commands, _, _ in player.ticks()][100] == [replay.COMMAND_PAUSE] * 2
+    assert player.play() is None
+    assert player.played == 300
+
+
+def test_many_measurements_in_one_tick(tmp_path, monkeypatch):
+    update = GameState.update
+
+    def measure_burst(game_state):
+        """Draw a burst of outcomes every 50 ticks and fold them into the score"""
+        update(game_state)
+        if game_state.tick % 50 == 0:
+            measurements = game_state.maze.entanglement.measurements
+            game_state.score += sum(measurements.next() << i for i in range(40))
+
+    monkeypatch.setattr(GameState, "update", measure_burst)
+    path = tmp_path / "session.emr"
+    record(path, 200)
+    player = replay.Player(path)
+    assert max(len(outcomes) for _, _, outcomes, _ in player.ticks()) >= 40
+    assert player.play() is None
+
+
+class MissingExecutor:
+    """Executor whose layout jobs miss their deadline for chosen layout seeds"""
+
+    def __init__(self, missed_seeds):
+        self.missed_seeds = missed_seeds
+
+    def call(self, kind, fn, args, fallback):
+        return fallback() if args[0] in self.missed_seeds else fn(*args)
+
+
+def test_walk_fallbacks_are_scoped_to_their_level(tmp_path):
+    from maze import layout_seed
+    game_state = GameState(seed=7)
+    # The first reset and the second level of the game after it miss; the level between doesn't
+    game_state.executor = game_state.maze.executor = MissingExecutor({layout_seed(7, 1), layout_seed(7, 3)})
+    recorder = replay.Recorder(tmp_path / "session.emr", game_state)
+
+    def run_command(command):
+        layout_index = game_state.layout_index
+        replay.apply_commands(game_state, command)
+        if game_state.layout_index != layout_index and game_state.maze.layout_fell_back:
+            command |= replay.COMMAND_WALK_FALLBACK
+        recorder.note_command(command)
+
+    for tick in range(60):
+        if tick == 10:
+            run_command(replay.COMMAND_RESET)
+        elif tick == 20:
+            run_command(replay.COMMAND_NEXT_LEVEL)
+            run_command(replay.COMMAND_NEXT_LEVEL)
+        recorder.step(game_state)
+    recorder.close()
+
+    player = replay.Player(tmp_path / "session.emr")
+    logged = [commands for _, commands, _, _ in player.ticks() if commands]
+    fallback = replay.COMMAND_WALK_FALLBACK
+    assert logged == [[replay.COMMAND_RESET | fallback],
+                      [replay.COMMAND_NEXT_LEVEL, replay.COMMAND_NEXT_LEVEL | fallback]]
+    assert player.play() is None
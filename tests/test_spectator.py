@@ -0,0 +1,102 @@
+"""Spectator streaming over a local socket"""
+import asyncio
+import random
+import time
+import numpy as np
+from constants import *
+from game_state import GameState
+from spectator import KEYFRAME, DELTA, SpectatorServer, watch
+
+
+def view_state(game_state):
+    """Get what a viewer has to reproduce: layout, pellets, locks and positions"""
+    maze = game_state.maze
+    store = game_state.entities
+    count = store.count
+    return (maze.layout_bytes(), bytes(maze.pellet_mask), dict(maze.entanglement.locked_measurements),
+            store.x[:count].astype(np.float32).tobytes(), store.y[:count].astype(np.float32).tobytes())
+
+
+async def wait_for(condition, timeout=10.0):
+    """Poll until condition() holds or the timeout passes"""
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def stream(game_state, ticks, hook=None, keyframe_interval=10_000, delay=0.0, receive_buffer=None, pace=None):
+    """
+    Play a game to one watch() client, calling hook(game_state, tick) before each tick.
+    Args:
+        pace: optional callable(tick) -> seconds to sleep after publishing the tick
+    Returns:
+        (states sent in order, (kind, view tick, view state) per received frame, server stats)
+    """
+    server = SpectatorServer(host="127.0.0.1", port=0, keyframe_interval=keyframe_interval)
+    await server.start()
+    received = []
+
+    def on_frame(view, kind, size):
+        received.append((kind, view.tick, view_state(view.game_state)))
+
+    client = asyncio.create_task(watch("127.0.0.1", server.port, on_frame=on_frame, delay=delay,
+                                       receive_buffer=receive_buffer))
+    await wait_for(lambda: server.viewers)
+    input_rng = random.Random(5)
+    sent = []
+    for tick in range(ticks):
+        if tick % 20 == 0:
+            game_state.pacman.set_next_direction(input_rng.choice([UP, DOWN, LEFT, RIGHT]))
+        if hook:
+            hook(game_state, tick)
+        game_state.update()
+        server.publish(game_state)
+        sent.append((game_state.tick, view_state(game_state)))
+        await asyncio.sleep(pace(tick) if pace else 0)
+    await wait_for(lambda: received and received[-1][1] == game_state.tick and not server.viewers[0].queue.qsize())
+    stats = server.stats()
+    await server.close()
+    await client
+    return sent, received, stats
+
+
+def test_viewer_follows_fluctuation_and_new_level():
+    game_state = GameState(seed=3)
+    game_state.pacman.lives = 99  # Keep the game running through both events
+
+    def events(game_state, tick):
+        if tick == 100:
+            game_state.fluctuation_timer = 1
+        elif tick == 200:
+            game_state.next_level()
+
+    sent, received, stats = asyncio.run(stream(game_state, 300, events))
+
+    assert stats["viewers"][0]["dropped"] == 0
+    assert [kind for kind, _, _ in received] == [KEYFRAME] + [DELTA] * 299
+    assert [state for _, _, state in received] == [state for _, state in sent]
+    # Both events reached the viewer as deltas: a fluctuation, then a whole new layout
+    layouts = [state[0] for _, state in sent]
+    assert layouts[100] != layouts[99] and layouts[101:200] == [layouts[100]] * 99
+    assert layouts[200] != layouts[199]
+    changed = sum(a != b for a, b in zip(layouts[199], layouts[200]))
+    assert changed > sum(a != b for a, b in zip(layouts[99], layouts[100]))
+    assert any(state[2] for _, state in sent)  # Some walls were locked along the way
+
+
+def test_slow_viewer_drops_frames_and_resyncs_on_keyframe():
+    game_state = GameState(seed=3)
+    game_state.pacman.lives = 99
+    # A burst the viewer can't keep up with, then ticks slower than it reads
+    sent, received, stats = asyncio.run(stream(game_state, 460, keyframe_interval=30, delay=0.01,
+                                               receive_buffer=4096, pace=lambda tick: 0.02 if tick >= 400 else 0))
+
+    assert stats["viewers"][0]["dropped"] > 0
+    expected = dict(sent)
+    ticks = [tick for _, tick, _ in received]
+    gaps = [i for i in range(1, len(ticks)) if ticks[i] != ticks[i - 1] + 1]
+    assert gaps
+    # Frames after a gap are skipped up to the next keyframe, so the view never applies a stale delta
+    assert all(received[i][0] == KEYFRAME for i in gaps)
+    assert all(state == expected[tick] for _, tick, state in received)
+    assert ticks[-1] == game_state.tick